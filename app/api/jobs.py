@@ -0,0 +1,78 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from pydantic import BaseModel
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    status: str = "pending"  # pending, running, completed or failed
+    done: int = 0
+    total: int = 0
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+class JobManager:
+    """
+    Run long operations such as PDF ingestion in the background and track their progress.
+
+    Jobs run one at a time on a dedicated worker thread, so ingestion never
+    blocks the event loop and index updates are applied in submission order.
+    """
+
+    def __init__(self, max_jobs: int = 1000):
+        """Initialize the manager, remembering at most max_jobs jobs."""
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job")
+
+    def submit(self, kind: str, total: int, fn: Callable[[Job], Any]) -> Job:
+        """
+        Queue a job.
+
+        Args:
+            kind: Short description of the job type
+            total: Number of work items, used for progress reporting
+            fn: Function doing the work. It receives the job so it can update
+                job.done, and its return value becomes job.result.
+
+        Returns:
+            The queued job
+        """
+        job = Job(id=str(uuid.uuid4()), kind=kind, total=total, created_at=time.time())
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job by ID, or None if it is unknown."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job, fn: Callable[[Job], Any]) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = fn(job)
+            job.status = "completed"
+        except Exception as e:
+            job.error = str(e) or type(e).__name__
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self) -> None:
+        """Forget the oldest finished jobs once more than max_jobs are stored."""
+        excess = len(self._jobs) - self.max_jobs
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished_at][:max(excess, 0)]:
+            del self._jobs[job_id]
@@ -1,10 +1,24 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
-from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Optional, Dict, Any
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
+import os
+import json
+import math
 import uuid
+import weakref
+import threading
 
-from app.bot.rag_chain import RAGChain
-from app.utils.pdf_processor import PDFProcessor
+from app import config
+from app.bot.rag_chain import RAGChain, StageTimeoutError
+from app.bot.admission import AdmissionController, AdmissionError, SessionBusyError
+from app.bot.collection_manager import CollectionManager, check_collection_name
+from app.bot.embedding_cache import EmbeddingCache
+from app.utils.pdf_processor import FileTooLargeError, PDFProcessor
+from app.api.jobs import Job, JobManager
+from app.utils.metrics import RequestTimer, latency_summary, stage_summary
 
 router = APIRouter(prefix="/api", tags=["rag"])
 
@@ -12,10 +26,39 @@ router = APIRouter(prefix="/api", tags=["rag"])
 class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
+    # Retrieval mode, e.g. "fast" or "multi_query"; defaults to the configured mode
+    mode: Optional[str] = None
+    # Document collection to answer from; defaults to the default collection
+    collection: Optional[str] = None
 
 class ChatResponse(BaseModel):
     response: str
     session_id: str
+    # Passages the answer is based on: document, pages, chunk IDs and tokens
+    sources: List[Dict[str, Any]] = []
+
+class BatchQuestion(BaseModel):
+    message: str
+    session_id: Optional[str] = None
+
+class ChatBatchRequest(BaseModel):
+    questions: List[BatchQuestion]
+    # Retrieval mode and collection for every question
+    mode: Optional[str] = None
+    collection: Optional[str] = None
+    # Sessions answered at once; defaults to and is capped by CHAT_BATCH_CONCURRENCY
+    concurrency: Optional[int] = None
+
+class ChatBatchResult(BaseModel):
+    # None when answering the question failed; see error
+    response: Optional[str]
+    session_id: str
+    sources: List[Dict[str, Any]] = []
+    error: Optional[str] = None
+
+class ChatBatchResponse(BaseModel):
+    # One result per question, in order
+    results: List[ChatBatchResult]
 
 class PDFInfo(BaseModel):
     filename: str
@@ -24,99 +67,375 @@ class PDFInfo(BaseModel):
 class PDFListResponse(BaseModel):
     pdfs: List[PDFInfo]
 
+class UploadResponse(BaseModel):
+    # None when every file was already indexed and nothing had to be queued
+    job_id: Optional[str]
+    files: List[str]
+    # Stored paths of files whose content had already been uploaded
+    duplicates: List[str] = []
+
+class CollectionInfo(BaseModel):
+    name: str
+    loaded: bool
+
+class CollectionListResponse(BaseModel):
+    collections: List[CollectionInfo]
+
 # Create instances
 pdf_processor = PDFProcessor()
-rag_chain = None
+pdf_processors: Dict[str, PDFProcessor] = {config.DEFAULT_COLLECTION: pdf_processor}
+job_manager = JobManager()
+_embedding_cache: Optional[EmbeddingCache] = None
+_shared_lock = threading.Lock()
+# Collections whose index has been synced with their PDFs since startup
+_synced = set()
+
+def get_pdf_processor(collection: str) -> PDFProcessor:
+    """Return the PDF processor of a collection's upload directory."""
+    with _shared_lock:
+        if collection not in pdf_processors:
+            pdf_processors[collection] = PDFProcessor(os.path.join(config.COLLECTIONS_DIR, collection, "uploads"))
+        return pdf_processors[collection]
+
+def shared_embedding_cache() -> EmbeddingCache:
+    """Return the embedding cache shared by all collections."""
+    global _embedding_cache
+    with _shared_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(
+                config.EMBEDDING_CACHE_PATH or None,
+                max_memory_entries=config.EMBEDDING_CACHE_SIZE,
+                max_disk_entries=config.EMBEDDING_CACHE_DISK_SIZE,
+            )
+        return _embedding_cache
+
+def create_collection(name: str) -> RAGChain:
+    """Create the RAG chain of a collection, loading its index from disk."""
+    if name == config.DEFAULT_COLLECTION:
+        return RAGChain(embedding_cache=shared_embedding_cache())
+
+    directory = os.path.join(config.COLLECTIONS_DIR, name)
+    return RAGChain(
+        index_dir=os.path.join(directory, "index"),
+        session_db_path=os.path.join(directory, "sessions.sqlite") if config.SESSION_DB_PATH else "",
+        embedding_cache=shared_embedding_cache(),
+    )
+
+def sync_collection(name: str, rag_chain: RAGChain) -> None:
+    """Repair a newly loaded collection's index against its PDFs on disk, once per process."""
+    if rag_chain.read_only or name in _synced:
+        return
+    _synced.add(name)
+    paths = [pdf["path"] for pdf in get_pdf_processor(name).get_saved_pdfs()]
+    submit_ingestion(name, "sync", paths, sync=True)
+
+collection_manager = CollectionManager(
+    create_collection,
+    max_loaded=config.COLLECTIONS_MAX_LOADED,
+    memory_budget=int(config.COLLECTIONS_MEMORY_MB * 2**20),
+    resident=[config.DEFAULT_COLLECTION],
+    on_load=sync_collection,
+)
+
+# Limits the chat requests running at once; shared with the Telegram bot and the Gradio UI
+admission = AdmissionController(
+    max_concurrent=config.CHAT_MAX_CONCURRENT,
+    max_per_session=config.CHAT_MAX_PER_SESSION,
+    max_queue=config.CHAT_MAX_QUEUE,
+    max_wait=config.CHAT_MAX_WAIT,
+)
+
+def admission_error(error: AdmissionError) -> HTTPException:
+    """A 429 for a session that is already busy, a 503 when the server is overloaded."""
+    return HTTPException(
+        status_code=429 if isinstance(error, SessionBusyError) else 503,
+        detail=str(error),
+        headers={"Retry-After": str(math.ceil(error.retry_after))},
+    )
+
+def get_rag_chain() -> RAGChain:
+    """Return the chain of the default collection, which is never unloaded."""
+    return collection_manager.get(config.DEFAULT_COLLECTION)
+
+def collection_name(collection: Optional[str]) -> str:
+    """Resolve a requested collection name, rejecting invalid names with a 400."""
+    name = collection or config.DEFAULT_COLLECTION
+    try:
+        check_collection_name(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return name
+
+@asynccontextmanager
+async def open_collection(name: str) -> AsyncIterator[RAGChain]:
+    """Load a collection if needed, without blocking the event loop, and keep it loaded while in use."""
+    rag_chain = await run_in_threadpool(collection_manager.acquire, name)
+    try:
+        yield rag_chain
+    finally:
+        collection_manager.release(name)
+
+def check_mode(mode: Optional[str]) -> None:
+    """Reject unknown retrieval modes with a 400."""
+    if mode is not None and mode not in RAGChain.RETRIEVAL_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown mode {mode!r}; expected one of {sorted(RAGChain.RETRIEVAL_MODES)}",
+        )
+
+def submit_ingestion(collection: str, kind: str, pdf_paths: List[str], sync: bool = False) -> Job:
+    """Queue a background job that loads (or, with sync=True, syncs) PDFs into a collection."""
+    def run(job: Job) -> Dict[str, Any]:
+        def progress(done: int, total: int) -> None:
+            job.done = done
+            job.total = total
+
+        # The collection is looked up when the job runs and stays loaded until it is done
+        with collection_manager.use(collection) as rag_chain:
+            if sync:
+                failures = rag_chain.sync_pdfs(pdf_paths)
+            else:
+                failures = rag_chain.load_pdfs(pdf_paths, progress_callback=progress)
+        job.done = job.total
+        return {"failed": failures}
 
-def get_rag_chain():
-    global rag_chain
-    if rag_chain is None:
-        rag_chain = RAGChain()
-    return rag_chain
+    return job_manager.submit(kind, len(pdf_paths), run)
 
-@router.post("/upload-pdfs", response_model=List[str])
+@router.post("/upload-pdfs", response_model=UploadResponse)
 async def upload_pdfs(
     files: List[UploadFile] = File(...),
-    rag_chain: RAGChain = Depends(get_rag_chain)
+    collection: Optional[str] = Form(None),
 ):
-    """Upload PDF files and process them for RAG."""
+    """Upload PDF files to a collection and queue a background job to process them for RAG."""
     if not files:
         raise HTTPException(status_code=400, detail="No PDF files provided")
+    name = collection_name(collection)
     
     # Save the PDFs
-    saved_paths = await pdf_processor.save_uploaded_pdfs(files)
+    try:
+        saved = await get_pdf_processor(name).save_uploaded_pdfs(files)
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     
-    if not saved_paths:
+    if not saved:
         raise HTTPException(status_code=400, detail="No valid PDF files were uploaded")
     
-    # Load PDFs into the RAG chain
-    rag_chain.load_pdfs(saved_paths)
+    saved_paths = list(dict.fromkeys(item["path"] for item in saved))
+    duplicates = list(dict.fromkeys(item["path"] for item in saved if item["duplicate"]))
+
+    # Duplicates are already indexed unless an earlier ingestion of them failed or is still queued
+    async with open_collection(name) as rag_chain:
+        to_load = [
+            path for path in saved_paths
+            if path not in duplicates or rag_chain.document_id(path) not in rag_chain.doc_chunks
+        ]
+    if not to_load:
+        return UploadResponse(job_id=None, files=saved_paths, duplicates=duplicates)
+
+    # Load PDFs into the RAG chain in the background
+    job = submit_ingestion(name, "upload", to_load)
+    
+    return UploadResponse(job_id=job.id, files=saved_paths, duplicates=duplicates)
+
+@router.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str):
+    """Get the status and progress of a background job."""
+    job = job_manager.get(job_id)
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
     
-    return saved_paths
+    return job
+
+@router.get("/collections", response_model=CollectionListResponse)
+async def get_collections():
+    """List the document collections on disk and whether each is loaded in memory."""
+    names = {config.DEFAULT_COLLECTION}
+    if os.path.isdir(config.COLLECTIONS_DIR):
+        names.update(name for name in os.listdir(config.COLLECTIONS_DIR)
+                     if os.path.isdir(os.path.join(config.COLLECTIONS_DIR, name)))
+    loaded = set(collection_manager.loaded())
+    return CollectionListResponse(
+        collections=[CollectionInfo(name=name, loaded=name in loaded) for name in sorted(names)]
+    )
 
 @router.get("/pdfs", response_model=PDFListResponse)
-async def get_pdfs():
-    """Get a list of all available PDFs."""
-    pdfs = pdf_processor.get_saved_pdfs()
+async def get_pdfs(collection: Optional[str] = None):
+    """Get a list of all available PDFs in a collection."""
+    pdfs = get_pdf_processor(collection_name(collection)).get_saved_pdfs()
     return PDFListResponse(pdfs=pdfs)
 
 @router.delete("/pdfs/{filename}")
-async def delete_pdf(
-    filename: str,
-    rag_chain: RAGChain = Depends(get_rag_chain)
-):
-    """Delete a specific PDF file."""
-    success = pdf_processor.delete_pdf(filename)
+async def delete_pdf(filename: str, collection: Optional[str] = None):
+    """Delete a specific PDF file from a collection."""
+    name = collection_name(collection)
+    success = get_pdf_processor(name).delete_pdf(filename)
     
     if not success:
         raise HTTPException(status_code=404, detail="PDF file not found")
     
-    # Reload the PDFs without the deleted one
-    pdfs = pdf_processor.get_saved_pdfs()
-    if pdfs:
-        rag_chain.load_pdfs([pdf["path"] for pdf in pdfs])
+    # Drop the deleted PDF's chunks from the index
+    async with open_collection(name) as rag_chain:
+        await run_in_threadpool(rag_chain.remove_pdf, filename)
     
     return {"status": "success", "message": f"PDF {filename} deleted successfully"}
 
 @router.delete("/pdfs")
-async def delete_all_pdfs(
-    rag_chain: RAGChain = Depends(get_rag_chain)
-):
-    """Delete all PDF files."""
-    success = pdf_processor.delete_all_pdfs()
+async def delete_all_pdfs(collection: Optional[str] = None):
+    """Delete all PDF files of a collection."""
+    name = collection_name(collection)
+    success = get_pdf_processor(name).delete_all_pdfs()
     
     if not success:
         raise HTTPException(status_code=500, detail="Failed to delete PDFs")
     
     # Clear the RAG chain
-    rag_chain.clear_all_sessions()
+    async with open_collection(name) as rag_chain:
+        await run_in_threadpool(rag_chain.clear_documents)
+        rag_chain.clear_all_sessions()
     
     return {"status": "success", "message": "All PDFs deleted successfully"}
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(
-    request: ChatRequest,
-    rag_chain: RAGChain = Depends(get_rag_chain)
-):
-    """Chat with the RAG model."""
-    if not rag_chain:
-        raise HTTPException(status_code=500, detail="RAG chain not initialized")
+async def chat(request: ChatRequest):
+    """Chat with the RAG model, answering from one collection."""
+    check_mode(request.mode)
+    name = collection_name(request.collection)
     
     # Generate or use session ID
     session_id = request.session_id or str(uuid.uuid4())
     
     # Process the message
-    response = rag_chain.query(request.message, session_id)
+    sources = []
+    try:
+        async with admission.aadmit(session_id):
+            async with open_collection(name) as rag_chain:
+                response = await rag_chain.aquery(request.message, session_id, mode=request.mode, sources=sources)
+    except AdmissionError as e:
+        raise admission_error(e)
+    except StageTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     
-    return ChatResponse(response=response, session_id=session_id)
+    return ChatResponse(response=response, session_id=session_id, sources=sources)
+
+@router.post("/chat/batch", response_model=ChatBatchResponse)
+async def chat_batch(request: ChatBatchRequest):
+    """Answer many questions from one collection with bounded concurrency.
+
+    Questions of the same session are answered in order, and the first
+    questions of new sessions are embedded in a few batched requests;
+    identical questions without chat history are answered once. Each
+    session waits for one admission slot behind interactive requests. A
+    question that fails or is not admitted gets an error instead of failing
+    the batch.
+    """
+    check_mode(request.mode)
+    name = collection_name(request.collection)
+    if len(request.questions) > config.CHAT_BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {config.CHAT_BATCH_MAX_QUESTIONS} questions are accepted per batch",
+        )
+
+    concurrency = min(request.concurrency or config.CHAT_BATCH_CONCURRENCY, config.CHAT_BATCH_CONCURRENCY)
+    session_ids = [question.session_id or str(uuid.uuid4()) for question in request.questions]
+    async with open_collection(name) as rag_chain:
+        results = await rag_chain.aquery_batch(
+            [question.message for question in request.questions],
+            session_ids,
+            mode=request.mode,
+            concurrency=concurrency,
+            admission=admission,
+        )
+
+    return ChatBatchResponse(results=[
+        ChatBatchResult(session_id=session_id, **result) for session_id, result in zip(session_ids, results)
+    ])
+
+@router.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Chat with the RAG model, streaming the answer as server-sent events.
+
+    Each answer token is sent as a `data: {"token": ...}` event. A final
+    `done` event carries the session ID, the sources of the answer and the
+    request's latency figures. An answer that takes too long or fails ends
+    with an `error` event instead.
+    """
+    check_mode(request.mode)
+    name = collection_name(request.collection)
+    session_id = request.session_id or str(uuid.uuid4())
+    timer = RequestTimer()
+    sources = []
+
+    # Wait for a slot before answering, so that an overloaded server still returns a 429 or 503
+    try:
+        ticket = await admission.aacquire(session_id)
+    except AdmissionError as e:
+        raise admission_error(e)
+
+    released = False
+
+    def release() -> None:
+        nonlocal released
+        if not released:
+            released = True
+            admission.release(ticket)
+
+    async def events():
+        try:
+            try:
+                # Keep the collection loaded until the whole answer has been streamed
+                async with open_collection(name) as rag_chain:
+                    async for token in rag_chain.aquery_stream(
+                        request.message, session_id, timer=timer, mode=request.mode, sources=sources
+                    ):
+                        yield f"data: {json.dumps({'token': token})}\n\n"
+            except Exception as e:
+                # The status has already been sent, so the error becomes the last event
+                if not isinstance(e, StageTimeoutError):
+                    print(f"Error streaming an answer for session {session_id}: {e}")
+                yield f"event: error\ndata: {json.dumps({'detail': str(e) or type(e).__name__})}\n\n"
+                return
+            timer.finish()
+            done = {
+                "session_id": session_id,
+                "sources": sources,
+                "ttft": timer.ttft,
+                "latency": timer.latency,
+                "stages": timer.stages,
+            }
+            yield f"event: done\ndata: {json.dumps(done)}\n\n"
+        finally:
+            # Also runs when the client goes away and the response is cancelled
+            release()
+
+    body = events()
+    # A response cancelled before it started never runs the generator, so
+    # release the slot once it is discarded
+    weakref.finalize(body, release)
+    return StreamingResponse(
+        body,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/stats")
+async def get_stats(collection: Optional[str] = None):
+    """Get chat latency (overall and per retrieval mode and stage), collection and cache statistics."""
+    async with open_collection(collection_name(collection)) as rag_chain:
+        return {
+            "latency": latency_summary(),
+            "stages": stage_summary(),
+            "collections": collection_manager.stats(),
+            "admission": admission.stats(),
+            **rag_chain.stats(),
+        }
 
 @router.delete("/chat/{session_id}")
-async def clear_chat_history(
-    session_id: str,
-    rag_chain: RAGChain = Depends(get_rag_chain)
-):
-    """Clear chat history for a specific session."""
-    rag_chain.clear_session(session_id)
+async def clear_chat_history(session_id: str, collection: Optional[str] = None):
+    """Clear chat history for a specific session of a collection."""
+    async with open_collection(collection_name(collection)) as rag_chain:
+        rag_chain.clear_session(session_id)
     
     return {"status": "success", "message": f"Chat history for session {session_id} cleared"}
 
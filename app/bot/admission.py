@@ -0,0 +1,319 @@
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, List, NamedTuple, Optional, Tuple
+
+from app.utils.metrics import ADMISSION_WAIT_SECONDS, LatencyStats
+
+# Queued requests with a lower priority value are admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+class AdmissionError(RuntimeError):
+    """A request was not admitted; retry_after suggests how many seconds to wait before retrying."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class SessionBusyError(AdmissionError):
+    """The session already has as many requests in progress as it may have."""
+
+class OverloadedError(AdmissionError):
+    """The queue is full, or the request could not start before its deadline."""
+
+class Ticket(NamedTuple):
+    """An admitted request, to hand back to release()."""
+
+    session: Hashable
+    started: float
+
+class _Waiter:
+    """A queued request."""
+
+    def __init__(self, session: Hashable, priority: int, deadline: float, wake: Callable[[], None]):
+        self.session = session
+        self.priority = priority
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        # Wakes the waiting thread or task once the request leaves the queue
+        self.wake = wake
+        self.admitted = False
+        # Set when the request leaves the queue without being admitted
+        self.error: Optional[AdmissionError] = None
+        self.done = False
+
+class AdmissionController:
+    """
+    Limit how many chat requests run at once, in total and per session.
+
+    Requests beyond the global limit wait in a bounded queue, highest
+    priority first and then in order of their deadline. A request is
+    rejected up front when its session is at its limit, when the queue is
+    full of requests of the same or higher priority, or when the estimated
+    wait already exceeds its deadline; a queued request is dropped once its
+    deadline passes. Rejected requests fail fast with an AdmissionError
+    instead of piling up behind the model.
+
+    Both threads (admit, acquire) and asyncio tasks (aadmit, aacquire) can
+    wait for a slot; they share the same limits.
+    """
+
+    # Weight of the latest request in the moving average of request durations
+    SERVICE_TIME_ALPHA = 0.2
+
+    def __init__(
+        self,
+        max_concurrent: int = 8,
+        max_per_session: int = 2,
+        max_queue: int = 100,
+        max_wait: float = 10.0,
+    ):
+        """
+        Initialize the controller.
+
+        Args:
+            max_concurrent: Maximum number of requests running at once
+            max_per_session: Maximum number of requests of one session, running or queued
+            max_queue: Maximum number of queued requests
+            max_wait: Default seconds a request may wait for a slot
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_per_session = max(1, max_per_session)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+
+        self._active = 0
+        # Running and queued requests of each session
+        self._sessions: Dict[Hashable, int] = defaultdict(int)
+        # Heap of (priority, deadline, sequence number, waiter); left requests are skipped lazily
+        self._queue: List[Tuple[int, float, int, _Waiter]] = []
+        self._queued = 0
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        # Moving average of how long an admitted request runs, in seconds
+        self._service_time: Optional[float] = None
+
+        self.wait_times = LatencyStats("admission_wait_seconds")
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+
+    def _estimated_wait(self, ahead: int) -> float:
+        """Seconds until a request with the given number of requests queued ahead of it starts."""
+        return (ahead + 1) / self.max_concurrent * (self._service_time or 0.0)
+
+    def _retry_after(self) -> float:
+        return max(1.0, self._estimated_wait(self._queued))
+
+    def _enter(
+        self, session: Hashable, priority: int, max_wait: Optional[float], wake: Callable[[], None]
+    ) -> Optional[_Waiter]:
+        """
+        Admit a request or queue it.
+
+        Returns:
+            None if the request was admitted, otherwise its queued waiter
+
+        Raises:
+            SessionBusyError: If the session is at its limit
+            OverloadedError: If the request cannot be queued
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        shed = None
+        with self._lock:
+            if self._sessions.get(session, 0) >= self.max_per_session:
+                self.rejected += 1
+                raise SessionBusyError(
+                    f"Session already has {self.max_per_session} requests in progress",
+                    max(1.0, self._service_time or 0.0),
+                )
+
+            if self._active < self.max_concurrent and not self._queued:
+                self._admit_now(session)
+                return None
+
+            ahead = sum(
+                1 for entry in self._queue if not entry[3].done and entry[3].priority <= priority
+            )
+            if self._service_time is not None and self._estimated_wait(ahead) > max_wait:
+                self.rejected += 1
+                raise OverloadedError("Server is busy; the request could not start in time", self._retry_after())
+
+            if self._queued >= self.max_queue:
+                # Make room by dropping the queued request with the lowest
+                # priority and the latest deadline, if it ranks below this one
+                queued = [entry for entry in self._queue if not entry[3].done]
+                worst = max(queued, key=lambda entry: (entry[0], entry[1]), default=None)
+                if worst is None or worst[0] <= priority:
+                    self.rejected += 1
+                    raise OverloadedError("Server is busy; too many requests are waiting", self._retry_after())
+                shed = worst[3]
+                self._leave(shed, OverloadedError("Dropped for a higher priority request", self._retry_after()))
+                self.shed += 1
+
+            if len(self._queue) > 2 * self._queued + 16:
+                # Drop the entries of requests that already left the queue
+                self._queue = [entry for entry in self._queue if not entry[3].done]
+                heapq.heapify(self._queue)
+            waiter = _Waiter(session, priority, time.monotonic() + max_wait, wake)
+            heapq.heappush(self._queue, (priority, waiter.deadline, next(self._sequence), waiter))
+            self._queued += 1
+            self._sessions[session] += 1
+        if shed is not None:
+            shed.wake()
+        return waiter
+
+    def _admit_now(self, session: Hashable) -> None:
+        self._active += 1
+        self._sessions[session] += 1
+        self.admitted += 1
+        self._observe_wait(0.0)
+
+    def _observe_wait(self, seconds: float) -> None:
+        self.wait_times.observe(seconds)
+        ADMISSION_WAIT_SECONDS.observe(seconds)
+
+    def _leave(self, waiter: _Waiter, error: AdmissionError) -> None:
+        """Take a waiter out of the queue without admitting it; must hold the lock."""
+        waiter.done = True
+        waiter.error = error
+        self._queued -= 1
+        self._drop_session(waiter.session)
+
+    def _drop_session(self, session: Hashable) -> None:
+        self._sessions[session] -= 1
+        if self._sessions[session] <= 0:
+            del self._sessions[session]
+
+    def _dispatch(self) -> List[_Waiter]:
+        """Admit queued requests into free slots; must hold the lock. Returns the waiters to wake."""
+        woken = []
+        now = time.monotonic()
+        while self._queue and self._active < self.max_concurrent:
+            _, deadline, _, waiter = heapq.heappop(self._queue)
+            if waiter.done:
+                continue
+            if deadline <= now:
+                self._leave(waiter, OverloadedError("Server is busy; the request could not start in time", 1.0))
+                self.shed += 1
+            else:
+                waiter.done = True
+                waiter.admitted = True
+                self._queued -= 1
+                self._active += 1
+                self.admitted += 1
+                self._observe_wait(now - waiter.enqueued)
+            woken.append(waiter)
+        return woken
+
+    def _give_up(self, waiter: _Waiter) -> bool:
+        """
+        Stop waiting for a slot.
+
+        Returns:
+            True if the request was admitted meanwhile and now holds a slot
+        """
+        with self._lock:
+            if waiter.admitted:
+                return True
+            if not waiter.done:
+                self._leave(waiter, OverloadedError("Server is busy; the request could not start in time", 1.0))
+                self.shed += 1
+            return False
+
+    def acquire(
+        self, session: Hashable, priority: int = PRIORITY_INTERACTIVE, max_wait: Optional[float] = None
+    ) -> Ticket:
+        """
+        Wait for a slot, blocking the calling thread.
+
+        Raises:
+            AdmissionError: If the request is rejected or its deadline passes
+        """
+        event = threading.Event()
+        waiter = self._enter(session, priority, max_wait, event.set)
+        if waiter is not None:
+            event.wait(max(0.0, waiter.deadline - time.monotonic()))
+            if not self._give_up(waiter):
+                raise waiter.error
+        return Ticket(session, time.monotonic())
+
+    async def aacquire(
+        self, session: Hashable, priority: int = PRIORITY_INTERACTIVE, max_wait: Optional[float] = None
+    ) -> Ticket:
+        """Wait for a slot without blocking the event loop; see acquire()."""
+        loop = asyncio.get_running_loop()
+        woken = loop.create_future()
+
+        def wake() -> None:
+            loop.call_soon_threadsafe(lambda: woken.done() or woken.set_result(None))
+
+        waiter = self._enter(session, priority, max_wait, wake)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(woken, max(0.0, waiter.deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                if self._give_up(waiter):
+                    self.release(Ticket(session, time.monotonic()))
+                raise
+            if not self._give_up(waiter):
+                raise waiter.error
+        return Ticket(session, time.monotonic())
+
+    def release(self, ticket: Ticket) -> None:
+        """Free the slot of an admitted request and admit the next queued ones."""
+        seconds = time.monotonic() - ticket.started
+        with self._lock:
+            self._active -= 1
+            self._drop_session(ticket.session)
+            if self._service_time is None:
+                self._service_time = seconds
+            else:
+                self._service_time += self.SERVICE_TIME_ALPHA * (seconds - self._service_time)
+            woken = self._dispatch()
+        for waiter in woken:
+            waiter.wake()
+
+    @contextmanager
+    def admit(
+        self, session: Hashable, priority: int = PRIORITY_INTERACTIVE, max_wait: Optional[float] = None
+    ) -> Iterator[None]:
+        """Context manager around acquire() and release()."""
+        ticket = self.acquire(session, priority, max_wait)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def aadmit(
+        self, session: Hashable, priority: int = PRIORITY_INTERACTIVE, max_wait: Optional[float] = None
+    ):
+        """Async context manager around aacquire() and release()."""
+        ticket = await self.aacquire(session, priority, max_wait)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the running and queued requests, admission counters and wait time percentiles."""
+        with self._lock:
+            stats = {
+                "active": self._active,
+                "queued": self._queued,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "shed": self.shed,
+                "service_seconds": self._service_time or 0.0,
+            }
+        wait = self.wait_times.summary()
+        stats.update({f"wait_{name}": wait[name] for name in ("p50", "p95", "p99")})
+        return stats
@@ -0,0 +1,139 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+class AnswerCache:
+    """
+    Semantic cache of answers keyed on the embedding of the standalone question.
+
+    A lookup hits when a cached question for the same corpus version is at
+    least `threshold` cosine-similar to the new one. Entries expire after
+    `ttl` seconds and the least recently used ones are evicted beyond
+    `max_entries`. Entries for any other corpus version are dropped as soon
+    as the version changes.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000, ttl: float = 3600):
+        """
+        Initialize the cache.
+
+        Args:
+            threshold: Minimum cosine similarity for a hit
+            max_entries: Maximum number of cached answers (0 disables the cache)
+            ttl: Lifetime of an entry in seconds
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.corpus_version: Optional[str] = None
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._next_id = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def set_corpus_version(self, corpus_version: str) -> None:
+        """Switch to a new corpus version, dropping every answer cached for another one."""
+        with self._lock:
+            if corpus_version != self.corpus_version:
+                self.corpus_version = corpus_version
+                self._entries.clear()
+                self._matrix = None
+
+    def lookup(self, vector: List[float]) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Find a cached answer for a question embedding.
+
+        Returns:
+            Tuple of (cached answer, sources it was based on), or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        query = self._normalize(vector)
+        with self._lock:
+            self._expire()
+            if self._matrix is None and self._entries:
+                self._matrix_ids = list(self._entries)
+                self._matrix = np.stack([self._entries[i]["vector"] for i in self._matrix_ids])
+
+            if self._matrix is not None:
+                similarities = self._matrix @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry_id = self._matrix_ids[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    entry = self._entries[entry_id]
+                    return entry["answer"], entry["sources"]
+
+            self.misses += 1
+            return None
+
+    def store(
+        self,
+        vector: List[float],
+        question: str,
+        answer: str,
+        corpus_version: str,
+        sources: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        """Cache an answer, unless the corpus has changed since the question was asked."""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            if corpus_version != self.corpus_version:
+                return
+            self._entries[self._next_id] = {
+                "vector": self._normalize(vector),
+                "question": question,
+                "answer": answer,
+                "sources": sources or [],
+                "created_at": time.monotonic(),
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def _expire(self) -> None:
+        """Drop entries older than the TTL."""
+        deadline = time.monotonic() - self.ttl
+        expired = [i for i, entry in self._entries.items() if entry["created_at"] < deadline]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        if expired:
+            self._matrix = None
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def clear(self) -> None:
+        """Drop every cached answer."""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit/miss counters, the hit rate and the number of cached answers."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
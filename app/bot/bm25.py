@@ -0,0 +1,141 @@
+import re
+import math
+import heapq
+from collections import Counter, defaultdict
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+# Keeps identifiers such as part numbers, error codes and clause IDs
+# ("E-1203", "4.2.1", "XJ_200") together as single tokens
+TOKEN_PATTERN = re.compile(r"\w(?:[\w.\-/]*\w)?")
+
+# Frequent English words that say nothing about a chunk; they are neither
+# indexed nor searched, which keeps their long postings out of every query
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from had has have how i if in into is it its "
+    "me my no not of on or our so than that the their them then there these they this to was "
+    "we were what when where which who why will with you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Split a text into lowercase terms, leaving out stopwords."""
+    return [term for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+class BM25Index:
+    """
+    Local inverted index over chunk texts, scored with Okapi BM25.
+
+    Chunks can be added and removed individually, so the index follows the
+    vector store through incremental updates.
+
+    Query terms found in more than max_df of the chunks do not select
+    candidates; they only add to the score of chunks matched by the rarer
+    terms of the query, so a common word does not make a search scan most
+    of the index.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, max_df: float = 0.2):
+        self.k1 = k1
+        self.b = b
+        self.max_df = max_df
+        # term -> {chunk ID: term frequency}
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        # chunk ID -> number of terms
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def add(self, chunk_id: str, text: str) -> None:
+        """Index a chunk, replacing it if it is already indexed."""
+        if chunk_id in self.lengths:
+            self.remove([chunk_id])
+        terms = tokenize(text)
+        for term, count in Counter(terms).items():
+            self.postings[term][chunk_id] = count
+        self.lengths[chunk_id] = len(terms)
+        self.total_length += len(terms)
+
+    def remove(self, chunk_ids: Sequence[str]) -> None:
+        """Remove chunks from the index."""
+        removed = set()
+        for chunk_id in chunk_ids:
+            length = self.lengths.pop(chunk_id, None)
+            if length is not None:
+                self.total_length -= length
+                removed.add(chunk_id)
+        if not removed:
+            return
+
+        for term in list(self.postings):
+            posting = self.postings[term]
+            for chunk_id in removed.intersection(posting):
+                del posting[chunk_id]
+            if not posting:
+                del self.postings[term]
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[str, float]]:
+        """
+        Find the chunks that best match a query.
+
+        Returns:
+            Up to k (chunk ID, score) pairs, best first
+        """
+        n = len(self.lengths)
+        if not n:
+            return []
+
+        average_length = self.total_length / n
+        postings = [self.postings[term] for term in set(tokenize(query)) if term in self.postings]
+        rare = [posting for posting in postings if len(posting) <= self.max_df * n]
+        # Without rare terms, every term selects candidates
+        common = [posting for posting in postings if len(posting) > self.max_df * n] if rare else []
+
+        scores: Dict[str, float] = defaultdict(float)
+        for posting in rare or postings:
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for chunk_id, tf in posting.items():
+                scores[chunk_id] += self._term_score(idf, tf, self.lengths[chunk_id], average_length)
+        for posting in common:
+            idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+            for chunk_id in scores:
+                tf = posting.get(chunk_id)
+                if tf:
+                    scores[chunk_id] += self._term_score(idf, tf, self.lengths[chunk_id], average_length)
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def _term_score(self, idf: float, tf: int, length: int, average_length: float) -> float:
+        norm = self.k1 * (1 - self.b + self.b * length / average_length)
+        return idf * tf * (self.k1 + 1) / (tf + norm)
+
+    def score(self, query: str, text: str) -> float:
+        """Score any text, such as several chunks merged together, against a query with the index's term statistics."""
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        n = len(self.lengths)
+        average_length = self.total_length / n if n else max(1, length)
+        score = 0.0
+        for term in set(tokenize(query)):
+            tf = terms.get(term)
+            if not tf:
+                continue
+            df = len(self.postings.get(term, ()))
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            score += self._term_score(idf, tf, length, average_length)
+        return score
+
+def reciprocal_rank_fusion(rankings: List[List[Hashable]], k: int = 60) -> List[Hashable]:
+    """
+    Fuse several rankings into one with reciprocal rank fusion.
+
+    Each item scores the sum of 1 / (k + rank) over the rankings it appears in.
+
+    Returns:
+        All items, best first
+    """
+    scores: Dict[Hashable, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] += 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
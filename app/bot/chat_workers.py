@@ -0,0 +1,116 @@
+import queue
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, List, Optional
+
+class ChatWorkerPool:
+    """
+    Process chat messages on a pool of worker threads.
+
+    Messages of different chats are handled concurrently, while the messages
+    of one chat are handled one at a time in the order they were submitted.
+    The number of waiting messages is bounded, both in total and per chat, so
+    a burst of traffic is rejected up front instead of piling up.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Hashable, Any], None],
+        workers: int = 8,
+        max_pending: int = 200,
+        max_pending_per_chat: int = 5,
+    ):
+        """
+        Initialize the pool.
+
+        Args:
+            handler: Function called with (chat key, item) for every submitted item
+            workers: Number of worker threads
+            max_pending: Maximum number of items waiting across all chats
+            max_pending_per_chat: Maximum number of items waiting for one chat
+        """
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.max_pending_per_chat = max_pending_per_chat
+
+        # Chats with pending items that no worker is handling yet
+        self._ready: "queue.Queue[Optional[Hashable]]" = queue.Queue()
+        # Pending items of every chat that has work queued or in progress
+        self._pending: Dict[Hashable, Deque[Any]] = {}
+        self._pending_count = 0
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self.rejected = 0
+
+    def start(self) -> None:
+        """Start the worker threads."""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"chat-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the worker threads after they finish their current item."""
+        for _ in self._threads:
+            self._ready.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, chat: Hashable, item: Any) -> bool:
+        """
+        Queue an item for a chat.
+
+        Returns:
+            True if the item was queued, False if the queue is full
+        """
+        with self._lock:
+            pending = self._pending.get(chat)
+            if self._pending_count >= self.max_pending or (
+                pending is not None and len(pending) >= self.max_pending_per_chat
+            ):
+                self.rejected += 1
+                return False
+
+            self._pending_count += 1
+            if pending is None:
+                # No worker owns this chat yet, so hand it to the next free one
+                self._pending[chat] = deque([item])
+                self._ready.put(chat)
+            else:
+                pending.append(item)
+        return True
+
+    def _run(self) -> None:
+        while True:
+            chat = self._ready.get()
+            if chat is None:
+                return
+
+            with self._lock:
+                item = self._pending[chat].popleft()
+                self._pending_count -= 1
+
+            try:
+                self.handler(chat, item)
+            except Exception as e:
+                print(f"Error handling message for chat {chat}: {e}")
+
+            with self._lock:
+                if self._pending[chat]:
+                    # Requeue the chat behind the others instead of draining it
+                    self._ready.put(chat)
+                else:
+                    del self._pending[chat]
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of waiting items, busy chats and rejected items."""
+        with self._lock:
+            return {
+                "pending": self._pending_count,
+                "chats": len(self._pending),
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,172 @@
+import re
+import threading
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from app.bot.rag_chain import RAGChain
+
+# Collection names double as directory names
+COLLECTION_NAME_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_-]{0,63}")
+
+def check_collection_name(name: str) -> None:
+    """Raise ValueError unless a collection name is 1-64 letters, digits, '_' or '-'."""
+    if not COLLECTION_NAME_PATTERN.fullmatch(name or ""):
+        raise ValueError(
+            f"Invalid collection name {name!r}; use 1-64 letters, digits, '_' or '-', "
+            "starting with a letter or digit"
+        )
+
+class CollectionManager:
+    """
+    Named document collections, each with its own RAG chain, index and sessions.
+
+    A collection's chain is created by the factory, which loads its index
+    from disk, the first time the collection is used. Loaded collections are
+    kept in least recently used order. Beyond max_loaded collections, or
+    when their estimated memory exceeds memory_budget bytes, the least
+    recently used ones are unloaded until they are needed again. Collections
+    in use (see use()) and the resident ones are never unloaded.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], RAGChain],
+        max_loaded: int = 8,
+        memory_budget: int = 0,
+        resident: Iterable[str] = (),
+        on_load: Optional[Callable[[str, RAGChain], None]] = None,
+    ):
+        """
+        Initialize the manager.
+
+        Args:
+            factory: Creates the chain of a collection from its name
+            max_loaded: Maximum number of collections kept in memory
+            memory_budget: Maximum estimated bytes of the loaded collections (0 for no limit)
+            resident: Names of collections that are never unloaded
+            on_load: Called with the name and chain after a collection is loaded
+        """
+        self.factory = factory
+        self.max_loaded = max_loaded
+        self.memory_budget = memory_budget
+        self.resident = set(resident)
+        self.on_load = on_load
+        self._chains: "OrderedDict[str, RAGChain]" = OrderedDict()
+        self._users: Dict[str, int] = defaultdict(int)
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    def _get(self, name: str, pin: bool) -> RAGChain:
+        check_collection_name(name)
+        with self._lock:
+            chain = self._chains.get(name)
+            if chain is not None:
+                self._chains.move_to_end(name)
+                if pin:
+                    self._users[name] += 1
+                return chain
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Load outside the manager lock so other collections stay usable meanwhile
+        with load_lock:
+            with self._lock:
+                chain = self._chains.get(name)
+                if chain is not None:
+                    self._chains.move_to_end(name)
+                    if pin:
+                        self._users[name] += 1
+                    return chain
+
+            chain = self.factory(name)
+            with self._lock:
+                self._chains[name] = chain
+                self.loads += 1
+                if pin:
+                    self._users[name] += 1
+            print(f"Loaded collection {name}")
+            self._evict(keep=name)
+
+        if self.on_load:
+            self.on_load(name, chain)
+        return chain
+
+    def get(self, name: str) -> RAGChain:
+        """Return the chain of a collection, loading it if needed."""
+        return self._get(name, pin=False)
+
+    def acquire(self, name: str) -> RAGChain:
+        """Return the chain of a collection and keep it loaded until release() is called."""
+        return self._get(name, pin=True)
+
+    def release(self, name: str) -> None:
+        """Allow a collection returned by acquire() to be unloaded again."""
+        with self._lock:
+            self._users[name] -= 1
+            if self._users[name] <= 0:
+                del self._users[name]
+        self._evict()
+
+    @contextmanager
+    def use(self, name: str) -> Iterator[RAGChain]:
+        """Context manager around acquire() and release()."""
+        chain = self.acquire(name)
+        try:
+            yield chain
+        finally:
+            self.release(name)
+
+    def register(self, name: str, chain: RAGChain) -> None:
+        """Use an existing chain for a collection, e.g. one built with stand-in models."""
+        check_collection_name(name)
+        with self._lock:
+            self._chains[name] = chain
+            self._chains.move_to_end(name)
+
+    def peek(self, name: str) -> Optional[RAGChain]:
+        """Return the chain of a collection if it is loaded, without loading it."""
+        with self._lock:
+            return self._chains.get(name)
+
+    def loaded(self) -> List[str]:
+        """Names of the loaded collections, least recently used first."""
+        with self._lock:
+            return list(self._chains)
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        """Unload least recently used collections until the loaded ones fit the limits."""
+        with self._lock:
+            sizes = (
+                {name: chain.memory_estimate() for name, chain in self._chains.items()}
+                if self.memory_budget else {}
+            )
+            total = sum(sizes.values())
+            evicted = []
+            for name in list(self._chains):
+                over_count = len(self._chains) > self.max_loaded
+                over_memory = self.memory_budget and total > self.memory_budget
+                if not over_count and not over_memory:
+                    break
+                if name == keep or name in self.resident or self._users.get(name):
+                    continue
+                evicted.append((name, self._chains.pop(name)))
+                total -= sizes.get(name, 0)
+                self.evictions += 1
+
+        for name, chain in evicted:
+            chain.close()
+            print(f"Unloaded collection {name}")
+
+    def stats(self) -> Dict[str, float]:
+        """Return the number of loaded collections, their estimated memory, loads and evictions."""
+        with self._lock:
+            chains = list(self._chains.values())
+            loads, evictions = self.loads, self.evictions
+        return {
+            "loaded": len(chains),
+            "memory_bytes": sum(chain.memory_estimate() for chain in chains),
+            "loads": loads,
+            "evictions": evictions,
+        }
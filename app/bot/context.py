@@ -0,0 +1,129 @@
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from app.bot.bm25 import BM25Index, reciprocal_rank_fusion
+from app.bot.session_store import estimate_tokens
+
+# Shortest shared text taken as the overlap between consecutive chunks;
+# shorter matches are more likely to be coincidence
+MIN_OVERLAP = 20
+
+def chunk_number(document: Document) -> Optional[int]:
+    """Return the position of a chunk within its document, from its "<doc_id>:<n>" chunk ID."""
+    chunk_id = document.metadata.get("chunk_id")
+    if not chunk_id or ":" not in chunk_id:
+        return None
+    try:
+        return int(chunk_id.rsplit(":", 1)[1])
+    except ValueError:
+        return None
+
+def join_overlapping(first: str, second: str, max_overlap: int) -> str:
+    """Join two consecutive chunks, keeping the text they share only once."""
+    for size in range(min(len(first), len(second), max_overlap), MIN_OVERLAP - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return f"{first}\n{second}"
+
+def merge_chunks(documents: List[Document], max_overlap: int) -> List[Document]:
+    """
+    Merge retrieved chunks that are adjacent in the same document into passages.
+
+    Consecutive chunks overlap by up to max_overlap characters, which would
+    otherwise be sent to the LLM twice.
+
+    Args:
+        documents: Retrieved chunks, best first
+        max_overlap: Chunk overlap used when splitting, in characters
+
+    Returns:
+        Passages ordered by their best ranked chunk. Each has the metadata of
+        its first chunk plus "chunk_ids" and "pages" listing what it covers.
+    """
+    rank = {}
+    runs_by_doc: Dict[Any, List[List[Document]]] = defaultdict(list)
+    passages = []
+
+    numbered = []
+    for position, document in enumerate(documents):
+        number = chunk_number(document)
+        if number is None:
+            passages.append((position, [document]))
+        else:
+            rank[id(document)] = position
+            numbered.append((document.metadata.get("doc_id"), number, document))
+
+    for doc_id, number, document in sorted(numbered, key=lambda item: (str(item[0]), item[1])):
+        runs = runs_by_doc[doc_id]
+        if runs and chunk_number(runs[-1][-1]) == number - 1:
+            runs[-1].append(document)
+        else:
+            runs.append([document])
+
+    for runs in runs_by_doc.values():
+        for run in runs:
+            passages.append((min(rank[id(document)] for document in run), run))
+
+    merged = []
+    for _, run in sorted(passages, key=lambda item: item[0]):
+        text = run[0].page_content
+        for document in run[1:]:
+            text = join_overlapping(text, document.page_content, max_overlap)
+        metadata = dict(run[0].metadata)
+        metadata["chunk_ids"] = [document.metadata.get("chunk_id") for document in run]
+        metadata["pages"] = sorted({document.metadata["page"] for document in run if "page" in document.metadata})
+        merged.append(Document(page_content=text, metadata=metadata))
+    return merged
+
+def rerank(question: str, passages: List[Document], lexical_index: BM25Index) -> List[Document]:
+    """
+    Reorder passages for the question without calling any API.
+
+    The retrieval order is fused with a BM25 score of each whole passage,
+    so a merged passage that covers more of the question moves up.
+    """
+    if len(passages) < 2:
+        return passages
+    scores = [lexical_index.score(question, passage.page_content) for passage in passages]
+    by_score = sorted(range(len(passages)), key=lambda i: scores[i], reverse=True)
+    fused = reciprocal_rank_fusion([list(range(len(passages))), by_score])
+    return [passages[i] for i in fused]
+
+def pack(passages: List[Document], max_tokens: int) -> List[Document]:
+    """
+    Keep the best passages that fit in a token budget.
+
+    Passages that do not fit are skipped in favour of smaller, lower ranked
+    ones. If not even the best passage fits, it is truncated to the budget.
+    A budget of 0 keeps every passage.
+    """
+    if max_tokens <= 0:
+        return passages
+
+    packed = []
+    used = 0
+    for passage in passages:
+        tokens = estimate_tokens(passage.page_content)
+        if used + tokens > max_tokens:
+            if packed:
+                continue
+            passage = Document(page_content=passage.page_content[:max_tokens * 4], metadata=passage.metadata)
+            tokens = estimate_tokens(passage.page_content)
+        packed.append(passage)
+        used += tokens
+    return packed
+
+def describe_sources(passages: List[Document]) -> List[Dict[str, Any]]:
+    """Describe the passages sent to the LLM, for citing them next to the answer."""
+    return [
+        {
+            "document": passage.metadata.get("doc_id"),
+            # Pages are numbered from 1 for display
+            "pages": [page + 1 for page in passage.metadata.get("pages", [])],
+            "chunk_ids": passage.metadata.get("chunk_ids", []),
+            "tokens": estimate_tokens(passage.page_content),
+        }
+        for passage in passages
+    ]
@@ -0,0 +1,161 @@
+import time
+import random
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+# Exception types the Google and HTTP client libraries raise when throttled
+RATE_LIMIT_ERROR_TYPES = ("ResourceExhausted", "TooManyRequests", "RateLimitError")
+
+def _status(error: BaseException) -> Optional[str]:
+    """Return the status an exception carries, directly or on its HTTP response, if any."""
+    for source in (error, getattr(error, "response", None)):
+        for attr in ("status_code", "code", "status"):
+            value = getattr(source, attr, None)
+            if value is not None and not callable(value):
+                return str(getattr(value, "name", value))
+    return None
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Return True if an exception raised by an embedding client means we are being throttled.
+
+    Looks at the status code and exception type of the error and of the
+    errors it was raised from, since LangChain wraps the client's exception.
+    """
+    seen = set()
+    current: Optional[BaseException] = error
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if _status(current) in ("429", "RESOURCE_EXHAUSTED", "TOO_MANY_REQUESTS"):
+            return True
+        if any(cls.__name__ in RATE_LIMIT_ERROR_TYPES for cls in type(current).__mro__):
+            return True
+        current = current.__cause__ or current.__context__
+    return False
+
+class BatchEmbedder:
+    """
+    Embed large numbers of texts in batches, several batches at a time.
+
+    The number of batches in flight adapts to the API: it is halved whenever
+    the API answers with a rate-limit error and grows back by one after each
+    successful batch. A failed batch is retried with exponential backoff on
+    its own; batches that already succeeded are not resent. When the
+    wrapped embeddings write through an EmbeddingCache, every completed batch
+    is also checkpointed there, so a failed ingestion resumes where it stopped.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        batch_size: int = 100,
+        max_concurrency: int = 4,
+        max_retries: int = 6,
+        initial_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        """
+        Initialize the embedder.
+
+        Args:
+            embedding: Embeddings used for each batch
+            batch_size: Number of texts per request
+            max_concurrency: Maximum number of batches in flight
+            max_retries: Attempts per batch before giving up
+            initial_backoff: First retry delay in seconds
+            max_backoff: Upper bound for the retry delay in seconds
+        """
+        self.embedding = embedding
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+
+        self._limit = max_concurrency
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="embed")
+        self.rate_limited = 0
+        self.retries = 0
+
+    def _acquire(self) -> None:
+        with self._condition:
+            while self._in_flight >= self._limit:
+                self._condition.wait()
+            self._in_flight += 1
+
+    def _release(self, throttled: bool) -> None:
+        with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                self._limit = max(1, self._limit // 2)
+            elif self._limit < self.max_concurrency:
+                self._limit += 1
+            self._condition.notify_all()
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed one batch, retrying with backoff until it succeeds or retries run out."""
+        backoff = self.initial_backoff
+        for attempt in range(1, self.max_retries + 1):
+            self._acquire()
+            throttled = False
+            try:
+                return self.embedding.embed_documents(texts)
+            except Exception as e:
+                throttled = is_rate_limit_error(e)
+                if throttled:
+                    self.rate_limited += 1
+                if attempt == self.max_retries:
+                    raise
+            finally:
+                self._release(throttled)
+
+            self.retries += 1
+            # Full jitter keeps retrying batches from hitting the API in lockstep
+            time.sleep(random.uniform(0, backoff))
+            backoff = min(self.max_backoff, backoff * 2)
+
+    def submit(self, texts: List[str]) -> Future:
+        """
+        Start embedding one batch in the background.
+
+        Returns:
+            A future resolving to one vector per text, in input order
+        """
+        return self._executor.submit(self._embed_batch, texts)
+
+    def shutdown(self) -> None:
+        """Stop the worker threads once the batches in flight are done."""
+        self._executor.shutdown(wait=False)
+
+    def embed(
+        self, texts: List[str], progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> List[List[float]]:
+        """
+        Embed texts in batches.
+
+        Args:
+            texts: Texts to embed
+            progress_callback: Called with (texts done, total texts) after each batch
+
+        Returns:
+            One vector per text, in input order
+        """
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1:
+            vectors = self._embed_batch(texts) if texts else []
+            if progress_callback:
+                progress_callback(len(texts), len(texts))
+            return vectors
+
+        futures = [self._executor.submit(self._embed_batch, batch) for batch in batches]
+        vectors = []
+        for batch, future in zip(batches, futures):
+            vectors.extend(future.result())
+            if progress_callback:
+                progress_callback(len(vectors), len(texts))
+        return vectors
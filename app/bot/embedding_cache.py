@@ -0,0 +1,246 @@
+import os
+import time
+import inspect
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.utils.metrics import EMBEDDED_TEXTS, EMBEDDING_REQUESTS
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of embedding vectors.
+
+    Vectors are kept in a bounded in-memory LRU tier backed by an optional
+    SQLite file, so they survive restarts. Keys are hashes of the text and
+    the embedding model, so the same chunk is never embedded twice.
+
+    The SQLite tier is bounded too: each row records when it was last used,
+    and once the file holds more than max_disk_entries vectors the least
+    recently used are deleted, down to PRUNE_TARGET of the limit so that
+    pruning is not repeated on every write. Uses are recorded in batches.
+    """
+
+    # Share of max_disk_entries left after pruning the SQLite tier
+    PRUNE_TARGET = 0.9
+
+    # Uses of vectors collected before their last-used times are written
+    TOUCH_BATCH_SIZE = 1000
+
+    def __init__(
+        self, path: Optional[str] = None, max_memory_entries: int = 10000, max_disk_entries: int = 0
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            path: SQLite file for the on-disk tier, or None for memory only
+            max_memory_entries: Maximum number of vectors held in the LRU tier
+            max_disk_entries: Maximum number of vectors kept in the SQLite file (0 for no limit)
+        """
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.pruned = 0
+
+        self._db = None
+        self._disk_entries = 0
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL DEFAULT 0)"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(embeddings)")]
+            if "last_used" not in columns:
+                # Files written before rows were aged count as least recently used
+                self._db.execute("ALTER TABLE embeddings ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._db.commit()
+            self._disk_entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def key(model: str, kind: str, text: str) -> str:
+        """Return the cache key for a text embedded by a model as a document or query."""
+        return hashlib.sha256(f"{model}\0{kind}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str], remember: bool = True) -> Dict[str, List[float]]:
+        """
+        Look up several keys at once.
+
+        Args:
+            keys: Keys to look up
+            remember: Count the lookups and keep the vectors found in the
+                memory tier; off for bulk reads such as index rebuilds
+
+        Returns:
+            Dictionary of the keys that were found and their vectors
+        """
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is None:
+                    missing.append(key)
+                else:
+                    if remember:
+                        self._memory.move_to_end(key)
+                    found[key] = vector
+
+            if missing and self._db is not None:
+                for start in range(0, len(missing), 500):
+                    batch = missing[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})",
+                        batch,
+                    ).fetchall()
+                    for key, blob in rows:
+                        vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                        found[key] = vector
+                        if remember:
+                            self._remember(key, vector)
+                            self.disk_hits += 1
+
+            if remember:
+                self.hits += len(found)
+                self.misses += len(keys) - len(found)
+                if self._db is not None and found:
+                    now = time.time()
+                    self._touched.update((key, now) for key in found)
+                    if len(self._touched) >= self.TOUCH_BATCH_SIZE:
+                        self._write_touched()
+                        self._db.commit()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        """Store vectors in both tiers, pruning the SQLite tier if it outgrew its limit."""
+        with self._lock:
+            for key, vector in items.items():
+                self._remember(key, vector)
+            if self._db is not None:
+                now = time.time()
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                    [
+                        (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                        for key, vector in items.items()
+                    ],
+                )
+                for key in items:
+                    self._touched.pop(key, None)
+                # Replaced rows are counted too; the count is corrected before pruning
+                self._disk_entries += len(items)
+                if self.max_disk_entries and self._disk_entries > self.max_disk_entries:
+                    self._prune()
+                self._db.commit()
+
+    def _write_touched(self) -> None:
+        """Write the last-used times collected since the previous write."""
+        self._db.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE key = ?",
+            [(used, key) for key, used in self._touched.items()],
+        )
+        self._touched.clear()
+
+    def _prune(self) -> None:
+        """Delete the least recently used rows of the SQLite tier beyond PRUNE_TARGET of its limit."""
+        self._write_touched()
+        self._disk_entries = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if self._disk_entries <= self.max_disk_entries:
+            return
+        excess = self._disk_entries - int(self.max_disk_entries * self.PRUNE_TARGET)
+        self._db.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self._disk_entries -= excess
+        self.pruned += excess
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        """Insert into the LRU tier, evicting the least recently used entries."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the size of both tiers."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "memory_entries": len(self._memory),
+                "disk_entries": self._disk_entries,
+                "pruned": self.pruned,
+            }
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends texts missing from an EmbeddingCache to the model."""
+
+    def __init__(self, embedding: Embeddings, cache: EmbeddingCache, model: str):
+        self.embedding = embedding
+        self.cache = cache
+        self.model = model
+        # Gemini embeds several queries in one request when given the query task type
+        self._batch_queries = "task_type" in inspect.signature(embedding.embed_documents).parameters
+
+    def _embed(self, texts: List[str], kind: str, embed_fn) -> List[List[float]]:
+        keys = [self.cache.key(self.model, kind, text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        # Embed each distinct missing text once
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        if missing:
+            EMBEDDING_REQUESTS.labels(kind=kind).inc()
+            EMBEDDED_TEXTS.labels(kind=kind).inc(len(missing))
+            vectors = embed_fn(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed documents, reusing cached vectors."""
+        return self._embed(texts, "document", self.embedding.embed_documents)
+
+    def cached_documents(self, texts: List[str]) -> Optional[np.ndarray]:
+        """Return the cached document vectors of texts as a float32 matrix, or None unless all are cached."""
+        keys = [self.cache.key(self.model, "document", text) for text in texts]
+        found = self.cache.get_many(keys, remember=False)
+        if len(found) < len(set(keys)):
+            return None
+        return np.array([found[key] for key in keys], dtype=np.float32)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embed several queries, in one request when the model supports it, reusing cached vectors."""
+        if self._batch_queries:
+            embed_fn = lambda texts: self.embedding.embed_documents(texts, task_type="retrieval_query")
+        else:
+            embed_fn = lambda texts: [self.embedding.embed_query(text) for text in texts]
+        return self._embed(texts, "query", embed_fn)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embed a query, reusing a cached vector."""
+        return self._embed(
+            [text], "query", lambda texts: [self.embedding.embed_query(texts[0])]
+        )[0]
@@ -0,0 +1,174 @@
+import os
+import json
+import pickle
+import shutil
+from typing import Any, Dict, Optional, Tuple
+
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+class IndexStore:
+    """
+    Persist a FAISS vector store, its docstore and the document manifest to disk.
+
+    Every save writes a complete new generation directory next to the previous
+    one and then atomically repoints the CURRENT file at it, so a crash mid-save
+    never leaves a half-written index behind.
+    """
+
+    CURRENT_FILE = "CURRENT"
+    INDEX_FILE = "index.faiss"
+    DOCSTORE_FILE = "docstore.pkl"
+    MANIFEST_FILE = "manifest.json"
+    KEEP_GENERATIONS = 2
+
+    def __init__(self, index_dir: str):
+        """Initialize the store with the directory holding the index generations."""
+        self.index_dir = index_dir
+        os.makedirs(self.index_dir, exist_ok=True)
+
+    def current_generation(self) -> int:
+        """
+        Get the generation number of the last completed save.
+
+        Returns:
+            The generation number, or 0 if nothing has been saved yet
+        """
+        try:
+            with open(os.path.join(self.index_dir, self.CURRENT_FILE)) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _generation_dir(self, generation: int) -> str:
+        return os.path.join(self.index_dir, f"gen-{generation:06d}")
+
+    def save(
+        self,
+        vectorstore: Optional[FAISS],
+        manifest: Dict[str, Any],
+        extras: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        """
+        Write the vector store and manifest as a new generation.
+
+        Args:
+            vectorstore: The vector store to persist, or None for an empty index
+            manifest: JSON-serializable document metadata
+            extras: Additional picklable objects (such as the lexical index) saved by name
+
+        Returns:
+            The generation number that was written
+        """
+        generation = self.current_generation() + 1
+        final_dir = self._generation_dir(generation)
+        tmp_dir = final_dir + ".tmp"
+        # Left behind by a save that crashed before switching CURRENT; never read
+        shutil.rmtree(final_dir, ignore_errors=True)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+
+        if vectorstore is not None:
+            faiss.write_index(vectorstore.index, os.path.join(tmp_dir, self.INDEX_FILE))
+            with open(os.path.join(tmp_dir, self.DOCSTORE_FILE), "wb") as f:
+                pickle.dump((vectorstore.docstore, vectorstore.index_to_docstore_id), f)
+
+        for name, obj in (extras or {}).items():
+            with open(os.path.join(tmp_dir, f"{name}.pkl"), "wb") as f:
+                pickle.dump(obj, f)
+
+        with open(os.path.join(tmp_dir, self.MANIFEST_FILE), "w") as f:
+            json.dump(dict(manifest, generation=generation), f)
+
+        os.rename(tmp_dir, final_dir)
+
+        current_tmp = os.path.join(self.index_dir, self.CURRENT_FILE + ".tmp")
+        with open(current_tmp, "w") as f:
+            f.write(str(generation))
+        os.replace(current_tmp, os.path.join(self.index_dir, self.CURRENT_FILE))
+
+        self._prune(generation)
+        return generation
+
+    def _prune(self, generation: int) -> None:
+        """Remove generations older than the ones we keep around."""
+        for name in os.listdir(self.index_dir):
+            if not name.startswith("gen-"):
+                continue
+            try:
+                number = int(name[len("gen-"):].split(".")[0])
+            except ValueError:
+                continue
+            if number <= generation - self.KEEP_GENERATIONS:
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+
+    def read_index(self, generation: int, mmap: bool = False) -> Any:
+        """
+        Read the raw FAISS index of a generation.
+
+        Args:
+            generation: Generation to read
+            mmap: Memory-map the index data instead of copying it into RAM.
+                A memory-mapped index is read-only.
+
+        Returns:
+            The FAISS index
+        """
+        path = os.path.join(self._generation_dir(generation), self.INDEX_FILE)
+        if mmap:
+            flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+            try:
+                return faiss.read_index(path, flags)
+            except RuntimeError:
+                pass
+        return faiss.read_index(path)
+
+    def load_extra(self, generation: int, name: str) -> Optional[Any]:
+        """Load an object saved through the extras of save(), or None if it is missing."""
+        path = os.path.join(self._generation_dir(generation), f"{name}.pkl")
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def load(
+        self, embedding: Embeddings, mmap: bool = False
+    ) -> Optional[Tuple[Optional[FAISS], Dict[str, Any]]]:
+        """
+        Load the current generation.
+
+        Args:
+            embedding: Embedding function to attach to the vector store
+            mmap: Memory-map the index data (see read_index)
+
+        Returns:
+            Tuple of (vector store or None if the index is empty, manifest),
+            or None if no usable generation exists
+        """
+        generation = self.current_generation()
+        if not generation:
+            return None
+
+        gen_dir = self._generation_dir(generation)
+        try:
+            with open(os.path.join(gen_dir, self.MANIFEST_FILE)) as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if not os.path.exists(os.path.join(gen_dir, self.INDEX_FILE)):
+            return None, manifest
+
+        index = self.read_index(generation, mmap=mmap)
+        with open(os.path.join(gen_dir, self.DOCSTORE_FILE), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+
+        vectorstore = FAISS(
+            embedding_function=embedding,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id=index_to_docstore_id,
+        )
+        return vectorstore, manifest
@@ -0,0 +1,168 @@
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Deque, Iterator, List, NamedTuple, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_workers = 0
+
+class PageRange(NamedTuple):
+    """A slice of a PDF's pages handled as one parsing task."""
+
+    path: str
+    start: int
+    end: int
+    total_pages: int
+    # True for the file's last range
+    last: bool
+
+def split_pages(
+    pdf_path: str, start: int, end: int, total_pages: int, chunk_size: int, chunk_overlap: int
+) -> List[Document]:
+    """Parse pages [start, end) of a PDF and split them into chunks."""
+    reader = PdfReader(pdf_path)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    pages = [
+        Document(
+            page_content=reader.pages[number].extract_text(),
+            metadata={"source": pdf_path, "page": number, "total_pages": total_pages},
+        )
+        for number in range(start, end)
+    ]
+    return text_splitter.split_documents(pages)
+
+def _get_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Return the shared worker pool, creating it on first use."""
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != max_workers:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        # Spawn rather than fork: the parent holds HTTP/gRPC clients and threads
+        _pool = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        _pool_workers = max_workers
+    return _pool
+
+def _reset_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False)
+    _pool = None
+
+def _page_ranges(
+    pdf_paths: List[str], pages_per_task: int
+) -> Iterator[Tuple[Optional[PageRange], Optional[Tuple[str, str]]]]:
+    """Yield (page range, None) for every task, or (None, (path, error)) for unreadable files."""
+    for pdf_path in pdf_paths:
+        try:
+            total_pages = len(PdfReader(pdf_path).pages)
+        except Exception as e:
+            yield None, (pdf_path, str(e) or type(e).__name__)
+            continue
+        if not total_pages:
+            yield PageRange(pdf_path, 0, 0, 0, True), None
+        for start in range(0, total_pages, pages_per_task):
+            end = min(total_pages, start + pages_per_task)
+            yield PageRange(pdf_path, start, end, total_pages, end == total_pages), None
+
+def stream_pdf_splits(
+    pdf_paths: List[str],
+    chunk_size: int,
+    chunk_overlap: int,
+    max_workers: int = 1,
+    pages_per_task: int = 16,
+) -> Iterator[Tuple[str, Optional[List[Document]], Optional[str], bool]]:
+    """
+    Parse and split PDFs a few pages at a time, in parallel when max_workers > 1.
+
+    Each file is cut into ranges of pages_per_task pages. At most two ranges
+    per worker are parsed ahead of the consumer, so memory use depends on
+    the range size, not on the size of the files.
+
+    Args:
+        pdf_paths: Paths of the PDFs to process
+        chunk_size: Maximum chunk size in characters
+        chunk_overlap: Overlap between consecutive chunks in characters
+        max_workers: Number of worker processes
+        pages_per_task: Number of pages parsed per task
+
+    Yields:
+        Tuples of (path, splits, error, last) in document and page order;
+        last is True for the final piece of a file. A file that fails to
+        parse yields one piece with splits=None and the error message
+        (last=True), and nothing more, without affecting the other files.
+    """
+    ranges = _page_ranges(pdf_paths, max(1, pages_per_task))
+    failed = set()
+
+    if max_workers <= 1:
+        for page_range, failure in ranges:
+            if failure is not None:
+                yield failure[0], None, failure[1], True
+                continue
+            if page_range.path in failed:
+                continue
+            try:
+                splits = split_pages(*page_range[:4], chunk_size, chunk_overlap)
+            except Exception as e:
+                failed.add(page_range.path)
+                yield page_range.path, None, str(e) or type(e).__name__, True
+                continue
+            yield page_range.path, splits, None, page_range.last
+        return
+
+    pool = _get_pool(max_workers)
+    pending: Deque[Tuple[Optional[PageRange], Optional[Tuple[str, str]], Optional[Future]]] = deque()
+
+    def restart() -> None:
+        """Start a fresh pool after a worker died hard and resubmit the queued ranges."""
+        nonlocal pool
+        _reset_pool()
+        pool = _get_pool(max_workers)
+        for i, (page_range, failure, _) in enumerate(pending):
+            if page_range is not None:
+                pending[i] = (page_range, failure, pool.submit(
+                    split_pages, *page_range[:4], chunk_size, chunk_overlap
+                ))
+
+    def refill() -> None:
+        while len(pending) < 2 * max_workers:
+            item = next(ranges, None)
+            if item is None:
+                return
+            page_range, failure = item
+            pending.append((page_range, failure, None))
+            if page_range is not None:
+                try:
+                    future = pool.submit(split_pages, *page_range[:4], chunk_size, chunk_overlap)
+                except BrokenProcessPool:
+                    restart()
+                else:
+                    pending[-1] = (page_range, failure, future)
+
+    refill()
+    while pending:
+        page_range, failure, future = pending.popleft()
+        if failure is not None:
+            yield failure[0], None, failure[1], True
+        elif page_range.path in failed:
+            future.cancel()
+        else:
+            try:
+                splits = future.result()
+            except BrokenProcessPool as e:
+                restart()
+                failed.add(page_range.path)
+                yield page_range.path, None, str(e) or type(e).__name__, True
+            except Exception as e:
+                failed.add(page_range.path)
+                yield page_range.path, None, str(e) or type(e).__name__, True
+            else:
+                yield page_range.path, splits, None, page_range.last
+        refill()
@@ -1,56 +1,688 @@
 import os
-from typing import Dict, List, Any
-from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain.chains import create_retrieval_chain
-from langchain.chains.combine_documents import create_stuff_documents_chain
+import time
+import queue
+import asyncio
+import hashlib
+import threading
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Any, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain.document_loaders import PyPDFLoader
 from langchain_community.vectorstores import FAISS
-from langchain.retrievers.multi_query import MultiQueryRetriever
-from langchain.chains import create_history_aware_retriever
-from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_core.chat_history import BaseChatMessageHistory
-from langchain_core.runnables.history import RunnableWithMessageHistory
+
+from app import config
+from app.bot.index_store import IndexStore
+from app.bot.embedding_cache import EmbeddingCache, CachedEmbeddings
+from app.bot.embedder import BatchEmbedder
+from app.bot.answer_cache import AnswerCache
+from app.bot.admission import PRIORITY_BATCH, AdmissionController, AdmissionError
+from app.bot.session_store import SessionStore, window_history
+from app.bot.bm25 import BM25Index, reciprocal_rank_fusion
+from app.bot.context import describe_sources, merge_chunks, pack, rerank
+from app.bot.vector_index import (
+    add_vectors, configure_search, delete_vectors, index_bytes, index_type, needs_compaction, needs_rebuild,
+    rebuild_without, search, search_parameters,
+)
+from app.utils.metrics import (
+    COALESCED_QUESTIONS, INGESTED_CHUNKS, INGESTED_DOCUMENTS, LLM_METRICS, RequestTimer, ingest_stage
+)
+
+class StageTimeoutError(TimeoutError):
+    """A query stage took longer than its configured time limit."""
+
+    def __init__(self, stage: str, seconds: float):
+        super().__init__(f"The {stage} stage timed out after {seconds:g}s")
+        self.stage = stage
+
+@dataclass
+class QueryState:
+    """Intermediate results of answering one message."""
+
+    message: str
+    mode: str
+    timer: RequestTimer
+    history: BaseChatMessageHistory
+    chat_history: List[BaseMessage]
+    question: str
+    corpus_version: str
+    question_vector: Optional[List[float]] = None
+    documents: Optional[List[Document]] = None
+    answer: Optional[str] = None
+    cached: bool = False
+    # Passages sent to the LLM, as described by describe_sources
+    sources: Optional[List[Dict[str, Any]]] = None
 
 class RAGChain:
-    def __init__(self, api_key: str = None):
-        """Initialize the RAG chain with Google API key."""
+    EMBEDDING_MODEL = "models/text-embedding-004"
+
+    # Approximate memory of a chunk buffered during ingestion besides its
+    # text: its vector as a list of Python floats, the Document and metadata
+    BUFFERED_CHUNK_OVERHEAD = 32 * 1024
+
+    # Retrieval modes trade recall for latency. The question is only
+    # contextualized when the session has history, in every mode. Vector
+    # modes are fused with the lexical index when hybrid retrieval is on.
+    RETRIEVAL_MODES = {
+        # One vector search on the question: no extra LLM call before answering
+        "fast": {"multi_query": False, "vector": True},
+        # The LLM writes alternative phrasings, which are searched in parallel
+        "multi_query": {"multi_query": True, "vector": True},
+        # Keyword search on the local index only: no embedding API call at all
+        "lexical": {"multi_query": False, "vector": False},
+    }
+
+    def __init__(
+        self,
+        api_key: str = None,
+        index_dir: Optional[str] = config.INDEX_DIR,
+        read_only: bool = config.INDEX_READ_ONLY,
+        llm: Optional[BaseChatModel] = None,
+        embedding: Optional[Embeddings] = None,
+        session_db_path: Optional[str] = config.SESSION_DB_PATH,
+        embedding_cache: Optional[EmbeddingCache] = None,
+    ):
+        """Initialize the RAG chain with Google API key.
+
+        If index_dir is set, the vector index is persisted there after every
+        change and loaded back from it on construction. Pass None to keep the
+        index in memory only.
+
+        With read_only, the chain never writes the index. It follows the
+        index persisted by another process instead, switching to each new
+        generation as it appears.
+
+        llm and embedding replace the Gemini chat and embedding models, e.g.
+        with local stand-ins for benchmarks. No API key is needed when both
+        are given.
+
+        session_db_path is the SQLite file for chat histories (empty to keep
+        them in memory), and embedding_cache lets several chains, such as
+        the collections of one process, share one cache.
+        """
+        if read_only and not index_dir:
+            raise ValueError("A read-only RAG chain needs an index directory to follow")
+
         if api_key:
             os.environ["GOOGLE_API_KEY"] = api_key
-        elif "GOOGLE_API_KEY" not in os.environ:
+        elif "GOOGLE_API_KEY" not in os.environ and (llm is None or embedding is None):
             raise ValueError("Google API key is required")
-            
-        self.llm = ChatGoogleGenerativeAI(
+
+        if llm is None or embedding is None:
+            # The Google client libraries take about a second to import, so
+            # they are only loaded once a chain that talks to Gemini is built
+            from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+
+        self.llm = llm or ChatGoogleGenerativeAI(
             model="gemini-2.0-flash",
             temperature=0,
             max_tokens=None,
-            timeout=None,
-            max_retries=2,
+            timeout=config.LLM_TIMEOUT or None,
+            max_retries=config.LLM_MAX_RETRIES,
             streaming=True
         )
         
-        self.embedding = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004")
-        self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        self.session_store = {}
+        self.embedding_cache = embedding_cache or EmbeddingCache(
+            config.EMBEDDING_CACHE_PATH or None,
+            max_memory_entries=config.EMBEDDING_CACHE_SIZE,
+            max_disk_entries=config.EMBEDDING_CACHE_DISK_SIZE,
+        )
+        self.embedding = CachedEmbeddings(
+            embedding or GoogleGenerativeAIEmbeddings(model=self.EMBEDDING_MODEL),
+            self.embedding_cache,
+            self.EMBEDDING_MODEL,
+        )
+        self.embedder = BatchEmbedder(
+            self.embedding,
+            batch_size=config.EMBED_BATCH_SIZE,
+            max_concurrency=config.EMBED_MAX_CONCURRENCY,
+        )
+        self.chunk_size = 1000
+        self.chunk_overlap = 200
+        self.ingest_workers = config.INGEST_WORKERS
+        self.session_store = SessionStore(
+            max_sessions=config.SESSION_MAX,
+            ttl=config.SESSION_TTL,
+            path=session_db_path or None,
+            max_loaded_messages=config.HISTORY_MAX_MESSAGES,
+            max_messages=config.SESSION_MAX_MESSAGES,
+        )
         self.vectorstore = None
-        self.conversational_rag_chain = None
-        
-    def load_pdfs(self, pdf_paths: List[str]) -> None:
-        """Load PDF documents and create vector store."""
-        docs = []
-        for pdf_path in pdf_paths:
-            loader = PyPDFLoader(pdf_path)
-            docs.extend(loader.load())
-            
-        splits = self.text_splitter.split_documents(docs)
-        
-        self.vectorstore = FAISS.from_documents(documents=splits, embedding=self.embedding)
-        retriever = MultiQueryRetriever.from_llm(
-            retriever=self.vectorstore.as_retriever(), llm=self.llm
+        self.retrieval_mode = config.RETRIEVAL_MODE
+        self.search_k = config.RETRIEVAL_K
+        self.hybrid = config.RETRIEVAL_HYBRID
+        self.vector_search_timeout = config.VECTOR_SEARCH_TIMEOUT
+        self.contextualize_timeout = config.CONTEXTUALIZE_TIMEOUT
+        self.generate_queries_timeout = config.GENERATE_QUERIES_TIMEOUT
+        self.answer_timeout = config.ANSWER_TIMEOUT
+        self.context_max_tokens = config.CONTEXT_MAX_TOKENS
+        # BM25 index over the same chunks as the vector store
+        self.lexical_index = BM25Index()
+        self._search_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
+        # Runs blocking LLM calls that have a time limit; a call that times out finishes here
+        # unobserved. Sized for one running and one abandoned call per admitted request, so
+        # abandoned calls cannot starve new ones; past that, calls queue within their time limit.
+        self._stage_executor = ThreadPoolExecutor(
+            max_workers=2 * max(1, config.CHAT_MAX_CONCURRENT), thread_name_prefix="stage"
         )
-        
-        # Create history-aware retriever
+        # Answers being computed by aquery, shared with identical questions that arrive meanwhile
+        self._in_flight: Dict[Tuple, asyncio.Future] = {}
+        self._build_chains()
+        self.answer_cache = AnswerCache(
+            threshold=config.ANSWER_CACHE_THRESHOLD,
+            max_entries=config.ANSWER_CACHE_SIZE,
+            ttl=config.ANSWER_CACHE_TTL,
+        )
+        # Maps each document ID to the IDs of its chunks in the vector store
+        self.doc_chunks: Dict[str, List[str]] = {}
+        # Size and modification time of each indexed file, used to detect stale entries
+        self.doc_fingerprints: Dict[str, Dict[str, int]] = {}
+
+        # Serializes whole ingestion operations (load, remove, sync, clear)
+        self._write_lock = threading.Lock()
+        # Guards the FAISS index itself; held only for searches and in-place updates
+        self._index_lock = threading.RLock()
+
+        self.index_store = IndexStore(index_dir) if index_dir else None
+        self._index_generation = 0
+        self._index_mmapped = False
+        # Search parameters that skip deleted vectors, while the index has any
+        self._search_params = None
+        self._load_index()
+        self.answer_cache.set_corpus_version(self.corpus_version)
+
+        self.read_only = read_only
+        self._stop_refresh = threading.Event()
+        if read_only:
+            threading.Thread(target=self._refresh_loop, name="index-refresh", daemon=True).start()
+
+    @staticmethod
+    def document_id(pdf_path: str) -> str:
+        """Return the stable document ID used for a PDF in the index."""
+        return os.path.basename(pdf_path)
+
+    @staticmethod
+    def file_fingerprint(pdf_path: str) -> Dict[str, int]:
+        """Return the size and modification time of a file."""
+        stat = os.stat(pdf_path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def corpus_fingerprint(self) -> str:
+        """Return a hash identifying the set of indexed documents and their versions."""
+        digest = hashlib.sha256()
+        for doc_id in sorted(self.doc_fingerprints):
+            fingerprint = self.doc_fingerprints[doc_id]
+            digest.update(f"{doc_id}\0{fingerprint['size']}\0{fingerprint['mtime_ns']}\n".encode())
+        return digest.hexdigest()
+
+    def load_pdfs(
+        self, pdf_paths: List[str], progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> Dict[str, str]:
+        """Load PDF documents and add them to the vector store.
+
+        Only the given files are parsed and embedded; documents that are
+        already indexed stay in place. Loading a file whose document ID is
+        already indexed replaces its previous chunks. Files are streamed
+        through parsing, embedding and indexing in bounded memory, and a file
+        that fails to parse is skipped.
+
+        Args:
+            pdf_paths: Paths of the PDFs to load
+            progress_callback: Called with (files done, total files) after each file
+
+        Returns:
+            Mapping of the paths that failed to load to their error message
+        """
+        self._check_writable()
+        with self._write_lock:
+            failures = self._add_pdfs(pdf_paths, progress_callback)
+            self._after_update()
+        return failures
+
+    def remove_pdf(self, doc_id: str) -> bool:
+        """Remove a document's chunks from the vector store without re-embedding.
+
+        Returns:
+            True if the document was indexed and has been removed, False otherwise
+        """
+        self._check_writable()
+        with self._write_lock:
+            removed = self._remove_pdf(doc_id)
+            if removed:
+                self._after_update()
+        return removed
+
+    def sync_pdfs(self, pdf_paths: List[str]) -> Dict[str, str]:
+        """Bring the index in line with the given set of PDF files.
+
+        Documents whose file is gone or has changed since it was indexed are
+        removed, and files that are new or changed are (re)loaded. Unchanged
+        documents cost nothing.
+        """
+        self._check_writable()
+        wanted = {self.document_id(path): path for path in pdf_paths}
+        changed = False
+
+        with self._write_lock:
+            stale = [
+                doc_id for doc_id in self.doc_chunks
+                if doc_id not in wanted or self.doc_fingerprints.get(doc_id) != self.file_fingerprint(wanted[doc_id])
+            ]
+            if stale:
+                # Delete all stale chunks at once, so the index is compacted at most once
+                chunk_ids = []
+                for doc_id in stale:
+                    chunk_ids.extend(self.doc_chunks.pop(doc_id))
+                    self.doc_fingerprints.pop(doc_id, None)
+                self._delete_chunks(chunk_ids)
+                changed = True
+
+            # Apply a changed INDEX_TYPE or threshold to an index loaded from disk
+            if self.vectorstore is not None and needs_rebuild(self.vectorstore.index):
+                self._rebuild_index()
+                changed = True
+
+            new_paths = [path for doc_id, path in wanted.items() if doc_id not in self.doc_chunks]
+            failures = self._add_pdfs(new_paths)
+
+            if changed or new_paths:
+                self._after_update()
+        return failures
+
+    def clear_documents(self) -> None:
+        """Drop every indexed document."""
+        self._check_writable()
+        with self._write_lock:
+            with self._index_lock:
+                self.vectorstore = None
+                self.lexical_index = BM25Index()
+                self.doc_chunks = {}
+                self.doc_fingerprints = {}
+                self._index_mmapped = False
+                self._search_params = None
+            self._persist()
+            self.answer_cache.set_corpus_version(self.corpus_version)
+
+    @property
+    def corpus_version(self) -> str:
+        """Identifier of the current set of indexed documents; changes with every load or delete."""
+        return self.corpus_fingerprint()
+
+    def _add_pdfs(
+        self, pdf_paths: List[str], progress_callback: Optional[Callable[[int, int], None]] = None
+    ) -> Dict[str, str]:
+        """Stream PDFs through parsing, embedding and indexing.
+
+        Pages are parsed and split a few at a time by the worker processes.
+        Their chunks are embedded in batches while later pages are still being
+        parsed, and each batch is added to the index as soon as its vectors
+        arrive. The chunks waiting between the stages are bounded by
+        INGEST_MEMORY_LIMIT_MB and by the number of embedding batches in
+        flight, so peak memory depends on the batch sizes, not on the files.
+
+        A document that fails to parse is removed again from the index, along
+        with the chunks that were already added for it. If ingestion itself
+        fails, the documents completed before are kept and persisted.
+        """
+        failures: Dict[str, str] = {}
+        # Chunk IDs added so far for each document being ingested
+        indexed: Dict[str, List[str]] = {}
+        # Chunks waiting for a full embedding batch
+        batch: List[Document] = []
+        # Documents whose last chunk is at batch[:position], as (path, position)
+        finished: List[Tuple[str, int]] = []
+        # Submitted batches in order, as (future, chunks, finished paths, buffered bytes)
+        in_flight: Deque[Tuple[Optional[Future], List[Document], List[str], int]] = deque()
+        buffered = 0
+        done = 0
+        limit = config.INGEST_MEMORY_LIMIT_MB * 2**20
+        max_in_flight = 2 * self.embedder.max_concurrency
+
+        def report(path: str, error: Optional[str] = None) -> None:
+            nonlocal done
+            done += 1
+            if error is not None:
+                print(f"Failed to load {path}: {error}")
+                failures[path] = error
+            INGESTED_DOCUMENTS.labels(status="ok" if error is None else "failed").inc()
+            if progress_callback:
+                progress_callback(done, len(pdf_paths))
+
+        def submit(count: int) -> None:
+            nonlocal batch, finished
+            chunks, batch = batch[:count], batch[count:]
+            paths = [path for path, position in finished if position <= count]
+            finished = [(path, position - count) for path, position in finished if position > count]
+            size = sum(len(chunk.page_content) + self.BUFFERED_CHUNK_OVERHEAD for chunk in chunks)
+            future = self.embedder.submit([chunk.page_content for chunk in chunks]) if chunks else None
+            in_flight.append((future, chunks, paths, size))
+
+        def complete_oldest() -> None:
+            nonlocal buffered
+            future, chunks, paths, size = in_flight.popleft()
+            if future is not None:
+                with ingest_stage("embed"):
+                    vectors = future.result()
+                with ingest_stage("index"):
+                    self._index_chunks(chunks, vectors, indexed)
+            buffered -= size
+            for path in paths:
+                doc_id = self.document_id(path)
+                chunk_ids = indexed.pop(doc_id, None)
+                if chunk_ids is None:
+                    continue  # Failed while its chunks were in flight
+                # Recorded even without chunks (such as a scan without a text
+                # layer), so that the file is not parsed again until it changes
+                self.doc_chunks[doc_id] = chunk_ids
+                self.doc_fingerprints[doc_id] = self.file_fingerprint(path)
+                report(path)
+
+        from app.bot.ingestion import stream_pdf_splits
+
+        pieces = stream_pdf_splits(
+            pdf_paths,
+            self.chunk_size,
+            self.chunk_overlap,
+            max_workers=self.ingest_workers,
+            pages_per_task=config.INGEST_PAGES_PER_TASK,
+        )
+        current = None
+        try:
+            while True:
+                # Time spent waiting for the parser processes
+                with ingest_stage("parse_split"):
+                    piece = next(pieces, None)
+                if piece is None:
+                    break
+                pdf_path, splits, error, last = piece
+                doc_id = self.document_id(pdf_path)
+
+                if error is not None:
+                    self._delete_chunks(indexed.pop(doc_id, []))
+                    report(pdf_path, error)
+                    current = None
+                    continue
+
+                if pdf_path != current:
+                    current = pdf_path
+                    if doc_id in self.doc_chunks:
+                        self._remove_pdf(doc_id)
+                    indexed[doc_id] = []
+                    next_chunk = 0
+
+                for split in splits:
+                    split.metadata["doc_id"] = doc_id
+                    split.metadata["chunk_id"] = f"{doc_id}:{next_chunk}"
+                    next_chunk += 1
+                    buffered += len(split.page_content) + self.BUFFERED_CHUNK_OVERHEAD
+                batch.extend(splits)
+                if last:
+                    finished.append((pdf_path, len(batch)))
+                    current = None
+
+                while len(batch) >= self.embedder.batch_size:
+                    submit(self.embedder.batch_size)
+                # Apply backpressure: index finished batches before parsing further
+                while buffered > limit or len(in_flight) > max_in_flight:
+                    if not in_flight:
+                        if not batch:
+                            break
+                        submit(len(batch))
+                    complete_oldest()
+
+            while batch or finished:
+                submit(min(len(batch), self.embedder.batch_size))
+            while in_flight:
+                complete_oldest()
+        except BaseException:
+            # Leave no partially indexed document behind
+            for future, _, _, _ in in_flight:
+                if future is not None:
+                    future.cancel()
+            self._delete_chunks([chunk_id for chunk_ids in indexed.values() for chunk_id in chunk_ids])
+            # Keep the documents that were completed before the failure
+            try:
+                self._after_update()
+            except Exception as e:
+                print(f"Failed to save the index after an interrupted ingestion: {e}")
+            raise
+        return failures
+
+    def _index_chunks(
+        self, chunks: List[Document], vectors: List[List[float]], indexed: Dict[str, List[str]]
+    ) -> None:
+        """Add embedded chunks to the vector store and the lexical index."""
+        # Skip chunks of documents that failed while these were in flight
+        keep = [i for i, chunk in enumerate(chunks) if chunk.metadata["doc_id"] in indexed]
+        if not keep:
+            return
+        texts = [chunks[i].page_content for i in keep]
+        text_embeddings = list(zip(texts, (vectors[i] for i in keep)))
+        metadatas = [chunks[i].metadata for i in keep]
+        chunk_ids = [metadata["chunk_id"] for metadata in metadatas]
+
+        with self._index_lock:
+            if self.vectorstore is None:
+                self.vectorstore = FAISS.from_embeddings(
+                    text_embeddings, self.embedding, metadatas=metadatas, ids=chunk_ids
+                )
+            else:
+                self._ensure_writable()
+                add_vectors(self.vectorstore, text_embeddings, metadatas, chunk_ids)
+            for chunk_id, text in zip(chunk_ids, texts):
+                self.lexical_index.add(chunk_id, text)
+        if needs_rebuild(self.vectorstore.index):
+            self._rebuild_index()
+        for metadata in metadatas:
+            indexed[metadata["doc_id"]].append(metadata["chunk_id"])
+        INGESTED_CHUNKS.inc(len(chunk_ids))
+
+    def _delete_chunks(self, chunk_ids: List[str]) -> None:
+        """Delete chunks from the vector store and the lexical index."""
+        if not chunk_ids:
+            return
+        with ingest_stage("remove"):
+            with self._index_lock:
+                # HNSW deletes only mark tombstones, so a memory-mapped graph need not be copied
+                if index_type(self.vectorstore.index) != "hnsw":
+                    self._ensure_writable()
+                delete_vectors(self.vectorstore, chunk_ids)
+                self.lexical_index.remove(chunk_ids)
+                self._search_params = search_parameters(self.vectorstore)
+        if needs_compaction(self.vectorstore):
+            self._rebuild_index()
+
+    def _original_vectors(self, positions: np.ndarray) -> Optional[np.ndarray]:
+        """Return the embeddings of the chunks at the given index positions if they are all cached."""
+        vectorstore = self.vectorstore
+        texts = [
+            vectorstore.docstore.search(vectorstore.index_to_docstore_id[position]).page_content
+            for position in positions
+        ]
+        return self.embedding.cached_documents(texts)
+
+    def _rebuild_index(self) -> None:
+        """
+        Rebuild the index without deleted vectors, as the type suited to the corpus size.
+
+        That moves the vectors to e.g. HNSW once the corpus outgrows a flat
+        index, and drops the tombstones of an HNSW index.
+        """
+        with ingest_stage("rebuild_index"):
+            # Only writers change the index and they are serialized, so it can be read without the lock
+            index, index_to_docstore_id = rebuild_without(
+                self.vectorstore, [], load_vectors=self._original_vectors
+            )
+        with self._index_lock:
+            self.vectorstore.index = index
+            self.vectorstore.index_to_docstore_id = index_to_docstore_id
+            self._index_mmapped = False
+            self._search_params = None
+        print(f"Rebuilt the vector index as {index_type(index)} for {index.ntotal} chunks")
+
+    def _remove_pdf(self, doc_id: str) -> bool:
+        """Delete a document's chunks from the vector store."""
+        chunk_ids = self.doc_chunks.pop(doc_id, None)
+        self.doc_fingerprints.pop(doc_id, None)
+        if chunk_ids is None:
+            return False
+
+        self._delete_chunks(chunk_ids)
+        return True
+
+    def _after_update(self) -> None:
+        """Persist the index after a change and invalidate answers for the old corpus."""
+        self._persist()
+        self.answer_cache.set_corpus_version(self.corpus_version)
+
+    def _check_writable(self) -> None:
+        if self.read_only:
+            raise RuntimeError(
+                "The index is read-only in this process; add or remove documents "
+                "through the process that owns it"
+            )
+
+    def _ensure_writable(self) -> None:
+        """Replace a memory-mapped (read-only) index with an in-RAM copy before mutating it."""
+        if self._index_mmapped:
+            self.vectorstore.index = self.index_store.read_index(self._index_generation)
+            self._index_mmapped = False
+
+    def _persist(self) -> None:
+        """Save the index and document manifest as a new on-disk generation."""
+        if self.index_store is None:
+            return
+
+        manifest = {
+            "embedding_model": self.EMBEDDING_MODEL,
+            "corpus_fingerprint": self.corpus_fingerprint(),
+            "documents": {
+                doc_id: {"chunks": chunk_ids, "fingerprint": self.doc_fingerprints.get(doc_id)}
+                for doc_id, chunk_ids in self.doc_chunks.items()
+            },
+        }
+        with ingest_stage("persist"):
+            self._index_generation = self.index_store.save(
+                self.vectorstore, manifest, extras={"lexical": self.lexical_index}
+            )
+
+    def _load_index(self) -> bool:
+        """Load the current persisted generation, if there is a compatible one.
+
+        The new state is built on the side and swapped in under the index
+        lock, so searches see either the old generation or the new one.
+
+        Returns:
+            True if a generation was loaded
+        """
+        if self.index_store is None:
+            return False
+
+        loaded = self.index_store.load(self.embedding, mmap=config.INDEX_MMAP)
+        if loaded is None:
+            return False
+
+        vectorstore, manifest = loaded
+        if manifest.get("embedding_model") != self.EMBEDDING_MODEL:
+            # Vectors from another model are not comparable; start over
+            return False
+
+        doc_chunks = {}
+        doc_fingerprints = {}
+        for doc_id, info in manifest["documents"].items():
+            doc_chunks[doc_id] = info["chunks"]
+            if info.get("fingerprint"):
+                doc_fingerprints[doc_id] = info["fingerprint"]
+
+        lexical_index = self.index_store.load_extra(manifest["generation"], "lexical")
+        if lexical_index is None and vectorstore is not None:
+            # Index saved before lexical search existed: rebuild it from the docstore
+            lexical_index = BM25Index()
+            for chunk_id in vectorstore.index_to_docstore_id.values():
+                if chunk_id is not None:
+                    lexical_index.add(chunk_id, vectorstore.docstore.search(chunk_id).page_content)
+
+        search_params = None
+        if vectorstore is not None:
+            configure_search(vectorstore.index)
+            search_params = search_parameters(vectorstore)
+
+        with self._index_lock:
+            self.vectorstore = vectorstore
+            self.lexical_index = lexical_index or BM25Index()
+            self.doc_chunks = doc_chunks
+            self.doc_fingerprints = doc_fingerprints
+            self._index_generation = manifest["generation"]
+            self._index_mmapped = vectorstore is not None and config.INDEX_MMAP
+            self._search_params = search_params
+        return True
+
+    def refresh(self) -> bool:
+        """Switch to the newest persisted generation if another process has saved one.
+
+        Returns:
+            True if a new generation was loaded
+        """
+        if self.index_store is None:
+            return False
+        if self.index_store.current_generation() == self._index_generation:
+            return False
+
+        with self._write_lock:
+            try:
+                loaded = self._load_index()
+            except Exception as e:
+                # A generation pruned mid-read; the next refresh picks up the newer one
+                print(f"Failed to load index generation: {e}")
+                return False
+            if loaded:
+                self.answer_cache.set_corpus_version(self.corpus_version)
+        return loaded
+
+    def _refresh_loop(self) -> None:
+        while not self._stop_refresh.wait(config.INDEX_REFRESH_INTERVAL):
+            self.refresh()
+
+    def memory_estimate(self) -> int:
+        """Approximate bytes of memory held by the index, the chunk texts and the lexical index."""
+        vectorstore = self.vectorstore
+        if vectorstore is None:
+            return 0
+        # Chunk texts in the docstore and their BM25 postings take about twice the text size
+        return index_bytes(vectorstore.index) + vectorstore.index.ntotal * self.chunk_size * 2
+
+    def close(self) -> None:
+        """Stop background work and release files; the persisted index and sessions are kept."""
+        self._stop_refresh.set()
+        self._search_executor.shutdown(wait=False)
+        self._stage_executor.shutdown(wait=False)
+        self.embedder.shutdown()
+        self.session_store.close()
+
+    def has_documents(self) -> bool:
+        """Return True if at least one document is indexed."""
+        return any(self.doc_chunks.values()) and self.vectorstore is not None
+
+    def _build_chains(self) -> None:
+        """Create the prompt chains used to answer questions."""
+        from langchain.chains.combine_documents import create_stuff_documents_chain
+        from langchain.retrievers.multi_query import DEFAULT_QUERY_PROMPT, LineListOutputParser
+
+        self.query_generation_chain = (
+            DEFAULT_QUERY_PROMPT | self._tracked_llm("generate_queries") | LineListOutputParser()
+        )
+
+        # Create the chain that turns a follow-up into a standalone question
         contextualize_q_system_prompt = (
             "Given a chat history and the latest user question "
             "which might reference context in the chat history, "
@@ -63,11 +695,11 @@ class RAGChain:
             MessagesPlaceholder("chat_history"),
             ("human", "{input}"),
         ])
-        
-        history_aware_retriever = create_history_aware_retriever(
-            self.llm, retriever, contextualize_q_prompt
+
+        self.contextualize_chain = (
+            contextualize_q_prompt | self._tracked_llm("contextualize") | StrOutputParser()
         )
-        
+
         # Create question-answering chain
         system_prompt = (
             "You are an assistant for question-answering tasks. "
@@ -78,67 +710,647 @@ class RAGChain:
             "Answer the user greeting in a friendly manner.\n\n"
             "{context}"
         )
-        
+
         qa_prompt = ChatPromptTemplate.from_messages([
             ("system", system_prompt),
             MessagesPlaceholder("chat_history"),
             ("human", "{input}"),
         ])
-        
-        question_answer_chain = create_stuff_documents_chain(self.llm, qa_prompt)
-        
-        rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
-        
-        # Setup stateful chat history
-        def get_session_history(session_id: str) -> BaseChatMessageHistory:
-            if session_id not in self.session_store:
-                self.session_store[session_id] = ChatMessageHistory()
-            return self.session_store[session_id]
-        
-        self.conversational_rag_chain = RunnableWithMessageHistory(
-            rag_chain,
-            get_session_history,
-            input_messages_key="input",
-            history_messages_key="chat_history",
-            output_messages_key="answer",
+
+        self.question_answer_chain = create_stuff_documents_chain(self._tracked_llm("answer"), qa_prompt)
+
+    def _tracked_llm(self, call: str):
+        """Return the LLM with call and token counting under the given label."""
+        return self.llm.with_config(callbacks=[LLM_METRICS], metadata={"llm_call": call})
+
+    def _resolve_mode(self, mode: Optional[str]) -> str:
+        mode = mode or self.retrieval_mode
+        if mode not in self.RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        return mode
+
+    def _start_query(
+        self, message: str, session_id: str, mode: Optional[str], timer: RequestTimer
+    ) -> QueryState:
+        timer.mode = self._resolve_mode(mode)
+        history = self.session_store.get(session_id)
+        return QueryState(
+            message=message,
+            mode=timer.mode,
+            timer=timer,
+            history=history,
+            # Only a bounded window of recent turns is sent to the model
+            chat_history=window_history(
+                history.messages, config.HISTORY_MAX_MESSAGES, config.HISTORY_MAX_TOKENS
+            ),
+            question=message,
+            corpus_version=self.corpus_version,
         )
-    
-    def query(self, message: str, session_id: str) -> str:
-        """Process a user message and return the response."""
-        if not self.vectorstore or not self.conversational_rag_chain:
+
+    def _call_stage(self, stage: str, timeout: float, call: Callable[[], Any]) -> Any:
+        """Run a blocking stage, raising StageTimeoutError after timeout seconds (0 for no limit)."""
+        if not timeout:
+            return call()
+        future = self._stage_executor.submit(call)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # Drops the call if it is still queued behind others
+            future.cancel()
+            raise StageTimeoutError(stage, timeout) from None
+
+    async def _acall_stage(self, stage: str, timeout: float, awaitable) -> Any:
+        """Async version of _call_stage; the awaitable is cancelled when it times out."""
+        if not timeout:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            raise StageTimeoutError(stage, timeout) from None
+
+    def _stream_answer(self, state: QueryState):
+        """
+        Stream the answer tokens, raising StageTimeoutError once the answer takes too long.
+
+        With a time limit, the model is streamed on a stage thread, so that
+        waiting for a token that never comes also ends at the deadline.
+        """
+        if not self.answer_timeout:
+            yield from self.question_answer_chain.stream(self._answer_input(state))
+            return
+
+        deadline = time.monotonic() + self.answer_timeout
+        # Tokens, then None at the end or the exception that ended the stream
+        tokens: "queue.Queue[Any]" = queue.Queue()
+        stop = threading.Event()
+
+        def produce() -> None:
+            stream = self.question_answer_chain.stream(self._answer_input(state))
+            try:
+                for token in stream:
+                    if stop.is_set():
+                        return
+                    tokens.put(token)
+                tokens.put(None)
+            except Exception as e:
+                tokens.put(e)
+            finally:
+                stream.close()
+
+        future = self._stage_executor.submit(produce)
+        try:
+            while True:
+                try:
+                    token = tokens.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    raise StageTimeoutError("answer", self.answer_timeout) from None
+                if token is None:
+                    return
+                if isinstance(token, Exception):
+                    raise token
+                yield token
+        finally:
+            # The producer stops at its next token
+            stop.set()
+            future.cancel()
+
+    async def _astream_answer(self, state: QueryState):
+        """Async version of _stream_answer, which also stops waiting for a token at the deadline."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.answer_timeout if self.answer_timeout else None
+        stream = self.question_answer_chain.astream(self._answer_input(state)).__aiter__()
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                try:
+                    token = await asyncio.wait_for(stream.__anext__(), timeout)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    raise StageTimeoutError("answer", self.answer_timeout) from None
+                yield token
+        finally:
+            await stream.aclose()
+
+    def _vector_search(self, query: str, vector: Optional[List[float]] = None) -> List[Document]:
+        """Run one vector search, holding the index lock only for the search itself."""
+        if vector is None:
+            vector = self.embedding.embed_query(query)
+        with self._index_lock:
+            if self.vectorstore is None:
+                return []
+            if self._search_params is not None:
+                return search(self.vectorstore, vector, self.search_k, self._search_params)
+            return self.vectorstore.similarity_search_by_vector(vector, k=self.search_k)
+
+    def _lexical_search(self, query: str) -> List[Document]:
+        """Run one BM25 search on the local lexical index."""
+        with self._index_lock:
+            if self.vectorstore is None:
+                return []
+            return [
+                self.vectorstore.docstore.search(chunk_id)
+                for chunk_id, _ in self.lexical_index.search(query, k=self.search_k)
+            ]
+
+    def _lexical_searches(self, queries: List[str]) -> List[List[Document]]:
+        """Run a BM25 search for each query."""
+        return [self._lexical_search(query) for query in queries]
+
+    @staticmethod
+    def _chunk_key(document: Document) -> str:
+        return document.metadata.get("chunk_id") or document.page_content
+
+    def _unique_documents(self, results: List[List[Document]]) -> List[Document]:
+        """Merge search results, keeping the first occurrence of each chunk."""
+        seen = set()
+        documents = []
+        for result in results:
+            for document in result:
+                key = self._chunk_key(document)
+                if key not in seen:
+                    seen.add(key)
+                    documents.append(document)
+        return documents
+
+    def _combine(
+        self, vector_results: List[List[Document]], lexical_results: List[List[Document]], n_queries: int
+    ) -> List[Document]:
+        """Fuse vector and lexical rankings with reciprocal rank fusion."""
+        if not lexical_results:
+            return self._unique_documents(vector_results)
+
+        documents = {}
+        rankings = []
+        for result in vector_results + lexical_results:
+            ranking = []
+            for document in result:
+                key = self._chunk_key(document)
+                documents.setdefault(key, document)
+                ranking.append(key)
+            rankings.append(ranking)
+        fused = reciprocal_rank_fusion(rankings)
+        return [documents[key] for key in fused[:self.search_k * n_queries]]
+
+    def _retrieve(self, state: QueryState) -> List[Document]:
+        """Retrieve documents for the standalone question according to the retrieval mode."""
+        use_vector = self.RETRIEVAL_MODES[state.mode]["vector"]
+        queries = [state.question]
+        if self.RETRIEVAL_MODES[state.mode]["multi_query"]:
+            with state.timer.stage("generate_queries"):
+                try:
+                    queries += self._call_stage(
+                        "generate_queries", self.generate_queries_timeout,
+                        lambda: self.query_generation_chain.invoke({"question": state.question}),
+                    )
+                except StageTimeoutError as e:
+                    print(f"{e}; searching for the question only")
+
+        lexical_results = []
+        if self.hybrid or not use_vector:
+            with state.timer.stage("lexical_search"):
+                lexical_results = self._lexical_searches(queries)
+
+        vector_results = []
+        if use_vector:
+            vectors = [state.question_vector] + [None] * (len(queries) - 1)
+            with state.timer.stage("search"):
+                futures = [
+                    self._search_executor.submit(self._vector_search, query, vector)
+                    for query, vector in zip(queries, vectors)
+                ]
+                done, _ = wait(futures, timeout=self.vector_search_timeout)
+                vector_results = [f.result() for f in futures if f in done and not f.exception()]
+
+            if len(vector_results) < len(queries):
+                print(f"Vector search failed or timed out for {len(queries) - len(vector_results)} queries")
+                if not vector_results and not lexical_results:
+                    # Fall back to the local lexical index
+                    with state.timer.stage("lexical_search"):
+                        lexical_results = self._lexical_searches(queries)
+
+        return self._combine(vector_results, lexical_results, len(queries))
+
+    async def _aretrieve(self, state: QueryState) -> List[Document]:
+        """Async version of _retrieve."""
+        use_vector = self.RETRIEVAL_MODES[state.mode]["vector"]
+        queries = [state.question]
+        if self.RETRIEVAL_MODES[state.mode]["multi_query"]:
+            with state.timer.stage("generate_queries"):
+                try:
+                    queries += await self._acall_stage(
+                        "generate_queries", self.generate_queries_timeout,
+                        self.query_generation_chain.ainvoke({"question": state.question}),
+                    )
+                except StageTimeoutError as e:
+                    print(f"{e}; searching for the question only")
+
+        lexical_results = []
+        if self.hybrid or not use_vector:
+            with state.timer.stage("lexical_search"):
+                lexical_results = await asyncio.to_thread(self._lexical_searches, queries)
+
+        vector_results = []
+        if use_vector:
+            vectors = [state.question_vector] + [None] * (len(queries) - 1)
+            with state.timer.stage("search"):
+                try:
+                    results = await asyncio.wait_for(
+                        asyncio.gather(
+                            *(
+                                asyncio.to_thread(self._vector_search, query, vector)
+                                for query, vector in zip(queries, vectors)
+                            ),
+                            return_exceptions=True,
+                        ),
+                        timeout=self.vector_search_timeout,
+                    )
+                    vector_results = [r for r in results if not isinstance(r, BaseException)]
+                except asyncio.TimeoutError:
+                    pass
+
+            if len(vector_results) < len(queries):
+                print(f"Vector search failed or timed out for {len(queries) - len(vector_results)} queries")
+                if not vector_results and not lexical_results:
+                    # Fall back to the local lexical index
+                    with state.timer.stage("lexical_search"):
+                        lexical_results = await asyncio.to_thread(self._lexical_searches, queries)
+
+        return self._combine(vector_results, lexical_results, len(queries))
+
+    def _prepare(
+        self, message: str, session_id: str, mode: Optional[str], timer: RequestTimer
+    ) -> QueryState:
+        """Contextualize the message, check the answer cache and retrieve documents."""
+        state = self._start_query(message, session_id, mode, timer)
+        if state.chat_history:
+            with timer.stage("contextualize"):
+                try:
+                    state.question = self._call_stage(
+                        "contextualize", self.contextualize_timeout,
+                        lambda: self.contextualize_chain.invoke(
+                            {"input": message, "chat_history": state.chat_history}
+                        ),
+                    )
+                except StageTimeoutError as e:
+                    print(f"{e}; searching for the message as is")
+
+        if self.answer_cache.enabled and self.RETRIEVAL_MODES[state.mode]["vector"]:
+            with timer.stage("answer_cache"):
+                try:
+                    state.question_vector = self._call_stage(
+                        "embed_question", self.vector_search_timeout,
+                        lambda: self.embedding.embed_query(state.question),
+                    )
+                except Exception as e:
+                    print(f"Embedding the question failed: {e}")
+                else:
+                    cached = self.answer_cache.lookup(state.question_vector)
+                    if cached is not None:
+                        state.answer, state.sources = cached
+                        state.cached = True
+
+        if not state.cached:
+            state.documents = self._retrieve(state)
+            self._assemble_context(state)
+        return state
+
+    async def _aprepare(
+        self, message: str, session_id: str, mode: Optional[str], timer: RequestTimer
+    ) -> QueryState:
+        """Async version of _prepare."""
+        state = self._start_query(message, session_id, mode, timer)
+        await self._aresolve(state)
+        return state
+
+    async def _aresolve(self, state: QueryState) -> None:
+        """Contextualize, check the answer cache and retrieve documents for a started query."""
+        timer = state.timer
+        if state.chat_history:
+            with timer.stage("contextualize"):
+                try:
+                    state.question = await self._acall_stage(
+                        "contextualize", self.contextualize_timeout,
+                        self.contextualize_chain.ainvoke(
+                            {"input": state.message, "chat_history": state.chat_history}
+                        ),
+                    )
+                except StageTimeoutError as e:
+                    print(f"{e}; searching for the message as is")
+
+        if self.answer_cache.enabled and self.RETRIEVAL_MODES[state.mode]["vector"]:
+            with timer.stage("answer_cache"):
+                try:
+                    state.question_vector = await self._acall_stage(
+                        "embed_question", self.vector_search_timeout, self.embedding.aembed_query(state.question)
+                    )
+                except Exception as e:
+                    print(f"Embedding the question failed: {e}")
+                else:
+                    cached = self.answer_cache.lookup(state.question_vector)
+                    if cached is not None:
+                        state.answer, state.sources = cached
+                        state.cached = True
+
+        if not state.cached:
+            state.documents = await self._aretrieve(state)
+            # Merging and reranking are CPU-bound and take the index lock
+            await asyncio.to_thread(self._assemble_context, state)
+
+    def _assemble_context(self, state: QueryState) -> None:
+        """Merge overlapping chunks, rerank them and pack the best into the context token budget."""
+        with state.timer.stage("context"):
+            passages = merge_chunks(state.documents, self.chunk_overlap)
+            with self._index_lock:
+                passages = rerank(state.question, passages, self.lexical_index)
+            state.documents = pack(passages, self.context_max_tokens)
+            state.sources = describe_sources(state.documents)
+
+    @staticmethod
+    def _answer_input(state: QueryState) -> Dict[str, Any]:
+        return {
+            "input": state.message,
+            "chat_history": state.chat_history,
+            "context": state.documents,
+        }
+
+    def _finish(self, state: QueryState, sources: Optional[List[Dict[str, Any]]] = None) -> None:
+        """Record the exchange in the session history, cache a freshly generated answer and report its sources."""
+        if sources is not None:
+            sources.extend(state.sources or [])
+        state.history.add_user_message(state.message)
+        state.history.add_ai_message(state.answer)
+        if not state.cached and state.question_vector is not None:
+            self.answer_cache.store(
+                state.question_vector, state.question, state.answer, state.corpus_version, state.sources
+            )
+
+    def query(
+        self,
+        message: str,
+        session_id: str,
+        mode: Optional[str] = None,
+        sources: Optional[List[Dict[str, Any]]] = None,
+    ) -> str:
+        """Process a user message and return the response.
+
+        Args:
+            message: The user message
+            session_id: Chat session the message belongs to
+            mode: Retrieval mode (see RETRIEVAL_MODES); defaults to the configured mode
+            sources: If given, filled with the passages the answer is based on
+                (document, pages, chunk IDs and tokens), for citations
+        """
+        if not self.has_documents():
             return "Please load PDF documents first."
-        
-        response = self.conversational_rag_chain.invoke(
-            {"input": message}, 
-            config={"configurable": {"session_id": session_id}}
-        )
-        return response["answer"]
 
-    def query_stream(self, message: str, session_id: str):
-        """Process a user message and return a streaming response."""
-        if not self.vectorstore or not self.conversational_rag_chain:
+        timer = RequestTimer()
+        state = self._prepare(message, session_id, mode, timer)
+        if not state.cached:
+            with timer.stage("answer"):
+                state.answer = self._call_stage(
+                    "answer", self.answer_timeout,
+                    lambda: self.question_answer_chain.invoke(self._answer_input(state)),
+                )
+        self._finish(state, sources)
+        timer.finish()
+        return state.answer
+
+    async def aquery(
+        self,
+        message: str,
+        session_id: str,
+        mode: Optional[str] = None,
+        sources: Optional[List[Dict[str, Any]]] = None,
+    ) -> str:
+        """Process a user message without blocking the event loop and return the response."""
+        if not self.has_documents():
+            return "Please load PDF documents first."
+
+        timer = RequestTimer()
+        state = self._start_query(message, session_id, mode, timer)
+        key = self._coalescing_key(state)
+        leader = self._in_flight.get(key) if key else None
+        if leader is not None:
+            try:
+                with timer.stage("coalesced"):
+                    state.answer, state.sources = await asyncio.shield(leader)
+            except asyncio.CancelledError:
+                if not leader.cancelled():
+                    raise
+                # The request computing the answer was cancelled; compute it here instead
+            else:
+                state.cached = True
+                COALESCED_QUESTIONS.labels(mode=state.mode).inc()
+
+        if not state.cached:
+            await self._acompute(state, key)
+        self._finish(state, sources)
+        timer.finish()
+        return state.answer
+
+    def _coalescing_key(self, state: QueryState) -> Optional[Tuple]:
+        """
+        Key under which identical questions share one computation, or None.
+
+        Only questions without chat history are shared: their answer does
+        not depend on the session. Futures belong to one event loop, which
+        is part of the key.
+        """
+        if state.chat_history:
+            return None
+        return (id(asyncio.get_running_loop()), state.mode, state.corpus_version, " ".join(state.message.split()))
+
+    async def _acompute(self, state: QueryState, key: Optional[Tuple]) -> None:
+        """Resolve and answer a query, sharing the result with identical questions that arrive meanwhile."""
+        future = None
+        if key and key not in self._in_flight:
+            future = self._in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            await self._aresolve(state)
+            if not state.cached:
+                with state.timer.stage("answer"):
+                    state.answer = await self._acall_stage(
+                        "answer", self.answer_timeout,
+                        self.question_answer_chain.ainvoke(self._answer_input(state)),
+                    )
+        except asyncio.CancelledError:
+            if future is not None:
+                future.cancel()
+            raise
+        except Exception as e:
+            if future is not None:
+                future.set_exception(e)
+                # Mark the exception retrieved in case no other request waits for it
+                future.exception()
+            raise
+        else:
+            if future is not None:
+                future.set_result((state.answer, state.sources))
+        finally:
+            if future is not None and self._in_flight.get(key) is future:
+                del self._in_flight[key]
+
+    def _embed_questions(self, questions: List[str]) -> None:
+        """Embed questions in batches ahead of answering them, so their searches hit the embedding cache."""
+        batch_size = self.embedder.batch_size
+        for start in range(0, len(questions), batch_size):
+            try:
+                self.embedding.embed_queries(questions[start:start + batch_size])
+            except Exception as e:
+                # Each question is embedded on its own later
+                print(f"Embedding a batch of questions failed: {e}")
+
+    async def aquery_batch(
+        self,
+        messages: List[str],
+        session_ids: List[str],
+        mode: Optional[str] = None,
+        concurrency: int = 8,
+        admission: Optional[AdmissionController] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Answer many messages, up to concurrency sessions at a time.
+
+        Messages of the same session are answered one after another, in
+        order, so each sees the answers before it in its chat history. The
+        first questions of new sessions are embedded together in a few
+        batched requests first. Identical questions share one computation
+        (see aquery). A failing question does not fail the others; with an
+        admission controller, each session waits for one slot at batch
+        priority, and all its questions fail if it is not admitted.
+
+        Args:
+            messages: The user messages
+            session_ids: Chat session of each message
+            mode: Retrieval mode for every message; defaults to the configured mode
+            concurrency: Maximum number of sessions answered at once
+            admission: Shared limit on concurrent chat requests, if any
+
+        Returns:
+            For each message, in order, a dict with "response", "sources" and
+            "error" (None, or the error message when it failed)
+        """
+        mode = self._resolve_mode(mode)
+        # Indexes of each session's messages, in order
+        sessions: Dict[str, List[int]] = {}
+        for index, session_id in enumerate(session_ids):
+            sessions.setdefault(session_id, []).append(index)
+
+        if self.has_documents() and self.RETRIEVAL_MODES[mode]["vector"]:
+            # Follow-up questions are rephrased before searching, so only the
+            # first question of a new session benefits
+            questions = list(dict.fromkeys(
+                messages[indexes[0]] for session_id, indexes in sessions.items()
+                if not self.session_store.get(session_id).messages
+            ))
+            if questions:
+                await asyncio.to_thread(self._embed_questions, questions)
+
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        results: List[Dict[str, Any]] = [None] * len(messages)
+
+        def failed(error: Exception) -> Dict[str, Any]:
+            print(f"Error answering a batched question: {error}")
+            return {"response": None, "sources": [], "error": str(error)}
+
+        async def answer(session_id: str, indexes: List[int]) -> None:
+            async with semaphore:
+                try:
+                    async with admission.aadmit(session_id, PRIORITY_BATCH) if admission else nullcontext():
+                        for index in indexes:
+                            sources: List[Dict[str, Any]] = []
+                            try:
+                                response = await self.aquery(messages[index], session_id, mode, sources)
+                            except Exception as e:
+                                results[index] = failed(e)
+                            else:
+                                results[index] = {"response": response, "sources": sources, "error": None}
+                except AdmissionError as e:
+                    for index in indexes:
+                        results[index] = failed(e)
+
+        await asyncio.gather(*(answer(session_id, indexes) for session_id, indexes in sessions.items()))
+        return results
+
+    def query_stream(
+        self,
+        message: str,
+        session_id: str,
+        timer: Optional[RequestTimer] = None,
+        mode: Optional[str] = None,
+        sources: Optional[List[Dict[str, Any]]] = None,
+    ):
+        """Process a user message and yield the answer tokens as they are generated."""
+        if not self.has_documents():
             yield "Please load PDF documents first."
             return
-        
-        response_text = ""
-        for chunk in self.conversational_rag_chain.stream(
-            {"input": message},
-            config={"configurable": {"session_id": session_id}}
-        ):
-            print(f'chunk type: {type(chunk)}')
-            try:
-                chunk_text = chunk.content
-            except:
-                chunk_text = chunk
-            response_text += chunk_text
-            yield chunk_text
 
-            
+        timer = timer or RequestTimer()
+        try:
+            state = self._prepare(message, session_id, mode, timer)
+            if state.cached:
+                timer.first_token()
+                yield state.answer
+            else:
+                tokens = []
+                with timer.stage("answer"):
+                    for token in self._stream_answer(state):
+                        timer.first_token()
+                        tokens.append(token)
+                        yield token
+                state.answer = "".join(tokens)
+            self._finish(state, sources)
+        finally:
+            timer.finish()
+
+    async def aquery_stream(
+        self,
+        message: str,
+        session_id: str,
+        timer: Optional[RequestTimer] = None,
+        mode: Optional[str] = None,
+        sources: Optional[List[Dict[str, Any]]] = None,
+    ):
+        """Async version of query_stream."""
+        if not self.has_documents():
+            yield "Please load PDF documents first."
+            return
+
+        timer = timer or RequestTimer()
+        try:
+            state = await self._aprepare(message, session_id, mode, timer)
+            if state.cached:
+                timer.first_token()
+                yield state.answer
+            else:
+                tokens = []
+                with timer.stage("answer"):
+                    async for token in self._astream_answer(state):
+                        timer.first_token()
+                        tokens.append(token)
+                        yield token
+                state.answer = "".join(tokens)
+            self._finish(state, sources)
+        finally:
+            timer.finish()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return the embedding and answer cache statistics and the size of the vector index."""
+        vectorstore = self.vectorstore
+        return {
+            "embedding_cache": self.embedding_cache.stats(),
+            "answer_cache": self.answer_cache.stats(),
+            "vector_index": {
+                "vectors": vectorstore.index.ntotal if vectorstore is not None else 0,
+                "type": index_type(vectorstore.index) if vectorstore is not None else None,
+            },
+        }
+
     def clear_session(self, session_id: str) -> None:
         """Clear the chat history for a specific session."""
-        if session_id in self.session_store:
-            self.session_store[session_id] = ChatMessageHistory()
+        self.session_store.clear(session_id)
             
     def clear_all_sessions(self) -> None:
         """Clear all chat histories."""
-        self.session_store = {}
\ No newline at end of file
+        self.session_store.clear_all()
\ No newline at end of file
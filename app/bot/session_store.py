@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence
+
+from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of tokens in a text (about four characters per token)."""
+    return len(text) // 4 + 1
+
+def window_history(
+    messages: Sequence[BaseMessage], max_messages: int, max_tokens: int
+) -> List[BaseMessage]:
+    """
+    Keep the most recent messages that fit in a message count and token budget.
+
+    The window always starts on a human message so the model never sees an
+    answer without its question.
+    """
+    window = []
+    tokens = 0
+    for message in reversed(messages):
+        if len(window) >= max_messages:
+            break
+        tokens += estimate_tokens(str(message.content))
+        if tokens > max_tokens and window:
+            break
+        window.append(message)
+    window.reverse()
+    while window and window[0].type != "human":
+        window.pop(0)
+    return window
+
+class BoundedChatMessageHistory(ChatMessageHistory):
+    """In-memory chat history that keeps only its most recent messages (all of them if max_messages is 0)."""
+
+    max_messages: int = 0
+
+    def add_message(self, message: BaseMessage) -> None:
+        super().add_message(message)
+        if self.max_messages and len(self.messages) > self.max_messages:
+            del self.messages[:len(self.messages) - self.max_messages]
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """Chat history of one session stored in SQLite; only the recent tail is ever loaded."""
+
+    def __init__(self, store: "SessionStore", session_id: str):
+        self.store = store
+        self.session_id = session_id
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        rows = self.store._execute(
+            "SELECT message FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (self.session_id, self.store.max_loaded_messages),
+        )
+        return messages_from_dict([json.loads(row[0]) for row in reversed(rows)])
+
+    def add_message(self, message: BaseMessage) -> None:
+        self.store._execute(
+            "INSERT INTO messages (session_id, message) VALUES (?, ?)",
+            (self.session_id, json.dumps(message_to_dict(message))),
+            commit=not self.store.max_messages,
+        )
+        if self.store.max_messages:
+            # Delete what falls out of the stored tail, in the same transaction
+            self.store._execute(
+                "DELETE FROM messages WHERE session_id = ? AND id <= ("
+                "SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (self.session_id, self.session_id, self.store.max_messages),
+                commit=True,
+            )
+        self.store._touch(self.session_id)
+
+    def clear(self) -> None:
+        self.store._execute(
+            "DELETE FROM messages WHERE session_id = ?", (self.session_id,), commit=True
+        )
+
+class SessionStore:
+    """
+    Bounded store of chat histories.
+
+    Sessions unused for `ttl` seconds expire, and beyond `max_sessions` the
+    least recently used ones are evicted. Each session keeps at most its
+    `max_messages` most recent messages. With a SQLite path, histories are
+    kept on disk instead of in RAM and survive restarts.
+    """
+
+    SWEEP_EVERY = 100
+
+    def __init__(
+        self,
+        max_sessions: int = 10000,
+        ttl: float = 7 * 24 * 3600,
+        path: Optional[str] = None,
+        max_loaded_messages: int = 50,
+        max_messages: int = 0,
+    ):
+        """
+        Initialize the store.
+
+        Args:
+            max_sessions: Maximum number of sessions kept
+            ttl: Seconds of inactivity after which a session expires
+            path: SQLite file for the histories, or None to keep them in memory
+            max_loaded_messages: Most recent messages loaded from SQLite per turn
+            max_messages: Most recent messages stored per session, at least
+                max_loaded_messages; older ones are deleted (0 for no limit)
+        """
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_loaded_messages = max_loaded_messages
+        self.max_messages = max(max_messages, max_loaded_messages) if max_messages else 0
+        self._sessions: "OrderedDict[str, BaseChatMessageHistory]" = OrderedDict()
+        self._last_used = {}
+        self._lock = threading.RLock()
+        self._gets = 0
+
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, last_used REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, message TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id)")
+            self._db.commit()
+
+    def _execute(self, sql: str, params: tuple = (), commit: bool = False) -> List[tuple]:
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+            if commit:
+                self._db.commit()
+            return rows
+
+    def _touch(self, session_id: str) -> None:
+        self._execute(
+            "INSERT OR REPLACE INTO sessions (session_id, last_used) VALUES (?, ?)",
+            (session_id, time.time()),
+            commit=True,
+        )
+
+    def get(self, session_id: str) -> BaseChatMessageHistory:
+        """Return the chat history of a session, creating it if needed."""
+        with self._lock:
+            self._gets += 1
+            if self._gets % self.SWEEP_EVERY == 0:
+                self._sweep()
+
+            if self._db is not None:
+                history = SQLiteChatMessageHistory(self, session_id)
+                rows = self._execute("SELECT last_used FROM sessions WHERE session_id = ?", (session_id,))
+                if rows and time.time() - rows[0][0] > self.ttl:
+                    history.clear()
+                return history
+
+            now = time.monotonic()
+            history = self._sessions.get(session_id)
+            if history is None or now - self._last_used[session_id] > self.ttl:
+                history = BoundedChatMessageHistory(max_messages=self.max_messages)
+                self._sessions[session_id] = history
+            self._sessions.move_to_end(session_id)
+            self._last_used[session_id] = now
+
+            while len(self._sessions) > self.max_sessions:
+                evicted, _ = self._sessions.popitem(last=False)
+                del self._last_used[evicted]
+            return history
+
+    def _sweep(self) -> None:
+        """Drop expired sessions (and, on SQLite, the least recently used beyond the limit)."""
+        if self._db is not None:
+            cutoff = time.time() - self.ttl
+            self._db.execute(
+                "DELETE FROM sessions WHERE last_used < ? OR session_id IN ("
+                "SELECT session_id FROM sessions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (cutoff, self.max_sessions),
+            )
+            self._db.execute("DELETE FROM messages WHERE session_id NOT IN (SELECT session_id FROM sessions)")
+            self._db.commit()
+            return
+
+        cutoff = time.monotonic() - self.ttl
+        # Sessions are ordered from least to most recently used
+        for session_id in list(self._sessions):
+            if self._last_used[session_id] >= cutoff:
+                break
+            del self._sessions[session_id]
+            del self._last_used[session_id]
+
+    def clear(self, session_id: str) -> None:
+        """Clear the chat history of a session."""
+        with self._lock:
+            if self._db is not None:
+                SQLiteChatMessageHistory(self, session_id).clear()
+                self._execute("DELETE FROM sessions WHERE session_id = ?", (session_id,), commit=True)
+            elif session_id in self._sessions:
+                del self._sessions[session_id]
+                del self._last_used[session_id]
+
+    def clear_all(self) -> None:
+        """Clear every chat history."""
+        with self._lock:
+            if self._db is not None:
+                self._execute("DELETE FROM messages")
+                self._execute("DELETE FROM sessions", commit=True)
+            self._sessions.clear()
+            self._last_used.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            if self._db is not None:
+                return self._execute("SELECT COUNT(*) FROM sessions")[0][0]
+            return len(self._sessions)
+
+    def close(self) -> None:
+        """Close the SQLite file, if any; histories on disk are kept."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -1,62 +1,216 @@
 import os
+import time
 import threading
+from typing import Callable, List, Optional
 import telebot
+from telebot.apihelper import ApiTelegramException
 from telebot.types import Message
 from dotenv import load_dotenv
 
+from app import config
+from app.bot.admission import AdmissionController, AdmissionError
+from app.bot.chat_workers import ChatWorkerPool
 from app.bot.rag_chain import RAGChain
+from app.utils.startup import Lazy, warm_up
+
+# Longest text Telegram accepts in one message
+MAX_MESSAGE_LENGTH = 4096
+
+class RateLimiter:
+    """Space out calls so that at most `rate` happen per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_time = 0.0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        """Take a slot if one is free right now."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.next_time:
+                return False
+            self.next_time = now + self.interval
+            return True
+
+    def acquire(self) -> None:
+        """Wait for the next free slot."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self.next_time)
+            self.next_time = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def retry_after(error: ApiTelegramException) -> Optional[float]:
+    """Return the wait time requested by a Telegram flood-control error, if it is one."""
+    if error.error_code != 429:
+        return None
+    parameters = (error.result_json or {}).get("parameters") or {}
+    return float(parameters.get("retry_after", 1))
+
+def split_message(text: str) -> List[str]:
+    """Split a text into pieces that fit into Telegram messages."""
+    return [text[i:i + MAX_MESSAGE_LENGTH] for i in range(0, len(text), MAX_MESSAGE_LENGTH)] or [""]
 
 class TelegramBot:
-    def __init__(self, rag_chain: RAGChain = None, token: str = None):
-        """Initialize the Telegram bot with a RAG chain."""
+    PLACEHOLDER = "…"
+    BUSY_MESSAGE = "I'm answering a lot of questions right now, please try again in a moment."
+    ERROR_MESSAGE = "Sorry, something went wrong while answering your question."
+
+    def __init__(
+        self,
+        rag_chain: RAGChain = None,
+        token: str = None,
+        get_rag_chain: Optional[Callable[[], RAGChain]] = None,
+        admission: Optional[AdmissionController] = None,
+    ):
+        """
+        Initialize the Telegram bot with a RAG chain.
+
+        Without rag_chain, the chain is taken from get_rag_chain (or built)
+        when the first message is answered, so the bot starts polling
+        without waiting for the index to load. Answers wait for a slot of
+        the admission controller, shared with the API when it runs the bot.
+        """
         load_dotenv()
-        
+
         # Get the token from environment or parameter
         self.token = token or os.getenv("TELEGRAM_BOT_TOKEN")
-        
+
         if not self.token:
             raise ValueError("Telegram bot token is required")
-            
-        self.bot = telebot.TeleBot(self.token)
-        self.rag_chain = rag_chain or RAGChain()
+
+        # Handlers run on the polling thread, in update order; they only queue
+        # the message and the worker pool does the slow part
+        self.bot = telebot.TeleBot(self.token, threaded=False)
+        self._rag_chain = rag_chain
+        self._get_rag_chain = get_rag_chain or Lazy(RAGChain)
+        self.admission = admission or AdmissionController(
+            max_concurrent=config.CHAT_MAX_CONCURRENT,
+            max_per_session=config.CHAT_MAX_PER_SESSION,
+            max_queue=config.CHAT_MAX_QUEUE,
+            max_wait=config.CHAT_MAX_WAIT,
+        )
         self.stop_flag = threading.Event()
         self.thread = None
-        
+        self.workers = ChatWorkerPool(
+            self._answer,
+            workers=config.TELEGRAM_WORKERS,
+            max_pending=config.TELEGRAM_MAX_PENDING,
+            max_pending_per_chat=config.TELEGRAM_MAX_PENDING_PER_CHAT,
+        )
+        self.edit_interval = config.TELEGRAM_EDIT_INTERVAL
+        self.edit_limiter = RateLimiter(config.TELEGRAM_EDITS_PER_SECOND)
+
         # Set up message handler
         @self.bot.message_handler(func=lambda message: True)
         def handle_message(message: Message):
-            if self.stop_flag.is_set():
+            if self.stop_flag.is_set() or not message.text:
                 return
-                
-            session_id = str(message.chat.id)  # Use chat ID as session identifier
-            user_input = message.text
-            
-            response = self.rag_chain.query(user_input, session_id)
-            self.bot.send_message(message.chat.id, response)
-    
+
+            if not self.workers.submit(message.chat.id, message):
+                self._call(self.bot.send_message, message.chat.id, self.BUSY_MESSAGE)
+
+    @property
+    def rag_chain(self) -> RAGChain:
+        """The RAG chain answering messages."""
+        return self._rag_chain or self._get_rag_chain()
+
+    def _call(self, method, *args, **kwargs):
+        """Call a Bot API method, waiting out flood-control errors a few times."""
+        for attempt in range(3):
+            try:
+                return method(*args, **kwargs)
+            except ApiTelegramException as e:
+                wait = retry_after(e)
+                if wait is None or attempt == 2:
+                    raise
+                time.sleep(wait)
+
+    def _answer(self, chat_id: int, message: Message) -> None:
+        """Answer one message, streaming the answer into a placeholder message."""
+        session_id = str(chat_id)  # Use chat ID as session identifier
+        placeholder = self._call(self.bot.send_message, chat_id, self.PLACEHOLDER)
+
+        text = ""
+        shown = ""
+        next_edit = time.monotonic() + self.edit_interval
+        try:
+            with self.admission.admit(session_id):
+                for token in self.rag_chain.query_stream(message.text, session_id):
+                    text += token
+                    now = time.monotonic()
+                    if now < next_edit or not text.strip() or text == shown:
+                        continue
+                    if not self.edit_limiter.try_acquire():
+                        continue
+                    next_edit = now + self.edit_interval
+                    try:
+                        self.bot.edit_message_text(
+                            text[:MAX_MESSAGE_LENGTH], chat_id, placeholder.message_id
+                        )
+                        shown = text
+                    except ApiTelegramException as e:
+                        # Intermediate edits are best effort; back off if asked to
+                        next_edit = now + max(self.edit_interval, retry_after(e) or 0)
+        except AdmissionError:
+            text = self.BUSY_MESSAGE
+        except Exception as e:
+            print(f"Error answering chat {chat_id}: {e}")
+            text = self.ERROR_MESSAGE
+
+        parts = split_message(text)
+        if parts[0] != shown[:MAX_MESSAGE_LENGTH]:
+            self.edit_limiter.acquire()
+            try:
+                self._call(self.bot.edit_message_text, parts[0], chat_id, placeholder.message_id)
+            except ApiTelegramException as e:
+                if "message is not modified" not in str(e):
+                    raise
+        for part in parts[1:]:
+            self._call(self.bot.send_message, chat_id, part)
+
     def start(self):
         """Start the Telegram bot."""
         if self.thread and self.thread.is_alive():
             return  # Bot is already running
-            
+
         print("Telegram bot is running...")
         self.stop_flag.clear()
+        self.workers.start()
         self.thread = threading.Thread(
-            target=self.bot.polling, 
+            target=self.bot.polling,
             kwargs={"none_stop": True}
         )
         self.thread.start()
-        
+
     def stop(self):
         """Stop the Telegram bot."""
         if not self.thread or not self.thread.is_alive():
             return  # Bot is not running
-            
+
         self.stop_flag.set()
+        self.bot.stop_polling()
         if self.thread:
             self.thread.join(timeout=5)
+        self.workers.stop(timeout=5)
         print("Telegram bot stopped.")
-        
+
     def set_rag_chain(self, rag_chain: RAGChain):
         """Set or update the RAG chain."""
-        self.rag_chain = rag_chain
\ No newline at end of file
+        self._rag_chain = rag_chain
+
+# Run the bot on its own. The API process already runs it when
+# TELEGRAM_BOT_TOKEN is set; run it separately only with INDEX_READ_ONLY=true
+# next to the API, so that a single process owns the index.
+if __name__ == "__main__":
+    get_rag_chain = Lazy(RAGChain)
+    bot = TelegramBot(get_rag_chain=get_rag_chain)
+    bot.start()
+    if config.WARMUP:
+        warm_up("RAG chain", get_rag_chain)
+    try:
+        bot.thread.join()
+    except KeyboardInterrupt:
+        bot.stop()
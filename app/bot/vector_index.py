@@ -0,0 +1,281 @@
+import math
+from typing import Callable, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from app import config
+
+# Supported FAISS index types, from exact to most compressed
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+
+# Fewest vectors each trained index type is built for; smaller corpora stay flat
+MIN_TRAINING_VECTORS = {"ivf": 1000, "ivfpq": 256 * 39}
+
+# Vectors reconstructed and re-added at a time while rebuilding an index
+REBUILD_BATCH_SIZE = 65536
+
+def choose_index_type(count: int, configured: Optional[str] = None) -> str:
+    """
+    Pick the index type for a corpus of the given number of chunks.
+
+    With INDEX_TYPE=auto, small corpora use an exact flat index, larger ones
+    HNSW, and the largest IVF-PQ, which stores compressed codes instead of
+    float32 vectors. A fixed type applies once there is enough data to train it.
+    """
+    configured = configured or config.INDEX_TYPE
+    if configured == "auto":
+        if count >= config.INDEX_IVFPQ_THRESHOLD:
+            configured = "ivfpq"
+        elif count >= config.INDEX_HNSW_THRESHOLD:
+            configured = "hnsw"
+        else:
+            configured = "flat"
+    if configured not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {configured!r}; expected auto or one of {INDEX_TYPES}")
+    if count < MIN_TRAINING_VECTORS.get(configured, 0):
+        return "flat"
+    return configured
+
+def index_type(index: faiss.Index) -> str:
+    """Return the type name of a FAISS index."""
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+def index_bytes(index: faiss.Index) -> int:
+    """Approximate memory used by an index: its vectors or codes plus the graph or list IDs."""
+    kind = index_type(index)
+    if kind == "hnsw":
+        # Level 0 of the graph holds 2 * M neighbours per vector
+        return index.ntotal * (index.d * 4 + index.hnsw.nb_neighbors(0) * 4)
+    if kind in ("ivf", "ivfpq"):
+        return index.ntotal * (index.code_size + 8)
+    return index.ntotal * index.d * 4
+
+def ivf_lists(count: int) -> int:
+    """Number of IVF clusters for a corpus: about 4 * sqrt(n), with at least 39 vectors each."""
+    return max(1, min(int(4 * math.sqrt(count)), count // 39, 65536))
+
+def pq_subquantizers(dimension: int) -> int:
+    """Largest number of PQ sub-quantizers up to INDEX_PQ_BYTES that divides the dimension."""
+    m = max(1, min(config.INDEX_PQ_BYTES, dimension))
+    while dimension % m:
+        m -= 1
+    return m
+
+def new_index(kind: str, dimension: int, count: int) -> faiss.Index:
+    """Create an empty (untrained) index of the given type, sized for count vectors."""
+    if kind == "flat":
+        return faiss.IndexFlatL2(dimension)
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, config.INDEX_HNSW_M)
+        index.hnsw.efConstruction = config.INDEX_HNSW_EF_CONSTRUCTION
+        return index
+
+    quantizer = faiss.IndexFlatL2(dimension)
+    if kind == "ivf":
+        return faiss.IndexIVFFlat(quantizer, dimension, ivf_lists(count))
+    return faiss.IndexIVFPQ(quantizer, dimension, ivf_lists(count), pq_subquantizers(dimension), 8)
+
+def configure_search(index: faiss.Index) -> None:
+    """Apply the configured search-time accuracy settings to an index."""
+    kind = index_type(index)
+    if kind == "hnsw":
+        index.hnsw.efSearch = config.INDEX_HNSW_EF_SEARCH
+    elif kind in ("ivf", "ivfpq"):
+        index.nprobe = config.INDEX_IVF_NPROBE
+
+def needs_rebuild(index: faiss.Index) -> bool:
+    """
+    Return True if an index should be rebuilt for its current size.
+
+    That is when the size calls for another index type, or when an IVF index
+    has grown to four times the size its clusters were trained for.
+    """
+    kind = choose_index_type(index.ntotal)
+    if kind != index_type(index):
+        return True
+    return kind in ("ivf", "ivfpq") and index.nlist * 2 <= ivf_lists(index.ntotal)
+
+def _reconstruct(index: faiss.Index, positions: np.ndarray) -> np.ndarray:
+    if index_type(index) in ("ivf", "ivfpq") and index.direct_map.type == faiss.DirectMap.NoMap:
+        index.make_direct_map()
+    return index.reconstruct_batch(positions)
+
+# Returns the original vectors at the given positions, or None if they are not all available
+VectorLoader = Callable[[np.ndarray], Optional[np.ndarray]]
+
+def rebuild(
+    index: faiss.Index,
+    kind: str,
+    keep: Optional[np.ndarray] = None,
+    load_vectors: Optional[VectorLoader] = None,
+) -> faiss.Index:
+    """
+    Build a new index of the given type from the vectors of an existing one.
+
+    Vectors are read in batches, so besides the two indexes only one batch
+    of float32 vectors is held at a time. They come from load_vectors when
+    it has them, since vectors read back from an IVF-PQ index are lossy and
+    would be quantized twice, and from the existing index otherwise. An IVF
+    index whose cluster count still suits the corpus is refilled without
+    retraining. The existing index is only read, so it can keep serving
+    searches meanwhile.
+
+    Args:
+        index: Index to read the vectors from
+        kind: Type of the new index
+        keep: Positions of the vectors to keep, in order; all by default
+        load_vectors: Source of the original vectors, if any
+
+    Returns:
+        The new index; vector i of it is the vector at keep[i] in the old one
+    """
+    if keep is None:
+        keep = np.arange(index.ntotal, dtype=np.int64)
+
+    def vectors(positions: np.ndarray) -> np.ndarray:
+        loaded = load_vectors(positions) if load_vectors is not None else None
+        return loaded if loaded is not None else _reconstruct(index, positions)
+
+    lists = ivf_lists(len(keep))
+    if kind == index_type(index) and kind in ("ivf", "ivfpq") and lists / 2 < index.nlist < lists * 2:
+        new = faiss.clone_index(index)
+        new.reset()
+        if new.direct_map.type != faiss.DirectMap.NoMap:
+            new.set_direct_map_type(faiss.DirectMap.NoMap)
+    else:
+        new = new_index(kind, index.d, len(keep))
+        if not new.is_trained:
+            sample_size = min(len(keep), 64 * new.nlist, 256 * 1024)
+            sample = np.sort(np.random.default_rng(0).choice(keep, size=sample_size, replace=False))
+            new.train(vectors(sample))
+
+    for start in range(0, len(keep), REBUILD_BATCH_SIZE):
+        new.add(vectors(keep[start:start + REBUILD_BATCH_SIZE]))
+    configure_search(new)
+    return new
+
+def rebuild_without(
+    vectorstore: FAISS,
+    ids: List[str],
+    kind: Optional[str] = None,
+    load_vectors: Optional[VectorLoader] = None,
+) -> Tuple[faiss.Index, Dict[int, str]]:
+    """
+    Build the index of a vector store without deleted vectors and those of the given docstore IDs.
+
+    The new index holds the remaining vectors at consecutive positions.
+
+    Args:
+        vectorstore: Vector store to read
+        ids: Docstore IDs to leave out
+        kind: Type of the new index; chosen by size by default
+        load_vectors: Source of the original vectors, if any (see rebuild)
+
+    Returns:
+        Tuple of (new index, new index_to_docstore_id mapping)
+    """
+    deleted = set(ids)
+    kept = [
+        (i, id_) for i, id_ in sorted(vectorstore.index_to_docstore_id.items())
+        if id_ is not None and id_ not in deleted
+    ]
+    keep = np.fromiter((i for i, _ in kept), dtype=np.int64, count=len(kept))
+    index = rebuild(vectorstore.index, kind or choose_index_type(len(kept)), keep, load_vectors)
+    return index, {position: id_ for position, (_, id_) in enumerate(kept)}
+
+def add_vectors(
+    vectorstore: FAISS, text_embeddings: List[Tuple[str, List[float]]], metadatas: List[Dict], ids: List[str]
+) -> None:
+    """
+    Add embedded texts to a vector store, at the positions after its existing ones.
+
+    Positions of deleted vectors stay taken (see delete_vectors). LangChain
+    numbers new vectors after the existing positions, but IVF indexes label
+    them after their vector count, so once vectors have been removed from an
+    IVF index the new ones are added under explicit labels instead.
+    """
+    index = vectorstore.index
+    mapping = vectorstore.index_to_docstore_id
+    if index_type(index) not in ("ivf", "ivfpq") or index.ntotal == len(mapping):
+        vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        return
+
+    start = len(mapping)
+    vectors = np.array([vector for _, vector in text_embeddings], dtype=np.float32)
+    index.add_with_ids(vectors, np.arange(start, start + len(ids), dtype=np.int64))
+    vectorstore.docstore.add({
+        id_: Document(id=id_, page_content=text, metadata=metadata)
+        for id_, (text, _), metadata in zip(ids, text_embeddings, metadatas)
+    })
+    mapping.update({start + j: id_ for j, id_ in enumerate(ids)})
+
+def delete_vectors(vectorstore: FAISS, ids: List[str]) -> None:
+    """
+    Delete the vectors of the given docstore IDs without rebuilding the index.
+
+    A flat index is compacted. An IVF index removes the vectors from its
+    lists; an HNSW graph cannot drop nodes, so there they stay as tombstones
+    that searches filter out (see search_parameters) until needs_compaction
+    says the index should be rebuilt. Either way the positions stay taken,
+    mapped to None, so that the positions of the other vectors do not move.
+    """
+    index = vectorstore.index
+    if index_type(index) == "flat":
+        vectorstore.delete(ids)
+        return
+
+    deleted = set(ids)
+    positions = [i for i, id_ in vectorstore.index_to_docstore_id.items() if id_ in deleted]
+    if index_type(index) in ("ivf", "ivfpq"):
+        # Removing from an array direct map is not supported; a hash table keeps lookups by label
+        if index.direct_map.type == faiss.DirectMap.Array:
+            index.set_direct_map_type(faiss.DirectMap.Hashtable)
+        index.remove_ids(np.array(positions, dtype=np.int64))
+    for position in positions:
+        vectorstore.index_to_docstore_id[position] = None
+    vectorstore.docstore.delete(ids)
+
+def deleted_count(vectorstore: FAISS) -> int:
+    """Number of positions of deleted vectors."""
+    return sum(1 for id_ in vectorstore.index_to_docstore_id.values() if id_ is None)
+
+def needs_compaction(vectorstore: FAISS) -> bool:
+    """Return True once tombstones make up more than INDEX_MAX_DELETED_RATIO of an HNSW index."""
+    index = vectorstore.index
+    return (
+        index_type(index) == "hnsw"
+        and deleted_count(vectorstore) > config.INDEX_MAX_DELETED_RATIO * max(1, index.ntotal)
+    )
+
+def search_parameters(vectorstore: FAISS) -> Optional[faiss.SearchParameters]:
+    """Return search parameters that skip the tombstones of an HNSW index, or None if it has none."""
+    index = vectorstore.index
+    if index_type(index) != "hnsw":
+        return None
+    deleted = np.array(
+        [i for i, id_ in vectorstore.index_to_docstore_id.items() if id_ is None], dtype=np.int64
+    )
+    if not len(deleted):
+        return None
+    batch = faiss.IDSelectorBatch(deleted)
+    selector = faiss.IDSelectorNot(batch)
+    # Keep the wrapped selector alive as long as the one that points to it
+    selector.referenced_objects = [batch]
+    return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+
+def search(vectorstore: FAISS, vector: List[float], k: int, params: faiss.SearchParameters) -> List[Document]:
+    """Search a vector store with FAISS search parameters, such as a filter on tombstones."""
+    _, labels = vectorstore.index.search(np.array([vector], dtype=np.float32), k, params=params)
+    return [
+        vectorstore.docstore.search(vectorstore.index_to_docstore_id[label])
+        for label in labels[0] if label >= 0
+    ]
@@ -0,0 +1,175 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables before any setting is read
+load_dotenv()
+
+# Directory where uploaded PDFs are stored
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+
+# Largest accepted PDF in megabytes, and largest upload request (all files together); 0 disables a limit
+MAX_UPLOAD_MB = float(os.getenv("MAX_UPLOAD_MB", "100"))
+MAX_UPLOAD_BYTES = int(MAX_UPLOAD_MB * 1024 * 1024)
+MAX_UPLOAD_REQUEST_MB = float(os.getenv("MAX_UPLOAD_REQUEST_MB", "500"))
+MAX_UPLOAD_REQUEST_BYTES = int(MAX_UPLOAD_REQUEST_MB * 1024 * 1024)
+
+# Directory where the vector index is persisted between restarts
+INDEX_DIR = os.getenv("INDEX_DIR", "index")
+
+# Collection used when a request names none; its PDFs and index live in UPLOAD_DIR and INDEX_DIR
+DEFAULT_COLLECTION = os.getenv("DEFAULT_COLLECTION", "default")
+
+# Directory holding the PDFs, index and sessions of every other collection, one subdirectory each
+COLLECTIONS_DIR = os.getenv("COLLECTIONS_DIR", "collections")
+
+# Collections kept in memory at once, and their approximate memory budget in MB (0 for no limit);
+# the least recently used ones are unloaded beyond either limit
+COLLECTIONS_MAX_LOADED = int(os.getenv("COLLECTIONS_MAX_LOADED", "8"))
+COLLECTIONS_MEMORY_MB = float(os.getenv("COLLECTIONS_MEMORY_MB", "2048"))
+
+# Memory-map the persisted index on startup instead of reading it into RAM
+INDEX_MMAP = os.getenv("INDEX_MMAP", "true").lower() == "true"
+
+# FAISS index type: "auto" picks flat, HNSW or IVF-PQ by corpus size; or one of flat, hnsw, ivf, ivfpq
+INDEX_TYPE = os.getenv("INDEX_TYPE", "auto").lower()
+
+# Chunk counts at which the automatic index type switches to HNSW and to IVF-PQ
+INDEX_HNSW_THRESHOLD = int(os.getenv("INDEX_HNSW_THRESHOLD", "50000"))
+INDEX_IVFPQ_THRESHOLD = int(os.getenv("INDEX_IVFPQ_THRESHOLD", "500000"))
+
+# HNSW graph degree, and candidate list sizes while building and searching (higher: better recall, slower)
+INDEX_HNSW_M = int(os.getenv("INDEX_HNSW_M", "32"))
+INDEX_HNSW_EF_CONSTRUCTION = int(os.getenv("INDEX_HNSW_EF_CONSTRUCTION", "80"))
+INDEX_HNSW_EF_SEARCH = int(os.getenv("INDEX_HNSW_EF_SEARCH", "64"))
+
+# IVF clusters searched per query (higher: better recall, slower)
+INDEX_IVF_NPROBE = int(os.getenv("INDEX_IVF_NPROBE", "16"))
+
+# Bytes stored per vector by IVF-PQ (rounded down to a divisor of the embedding dimension)
+INDEX_PQ_BYTES = int(os.getenv("INDEX_PQ_BYTES", "64"))
+
+# Share of deleted vectors an HNSW index keeps as tombstones before it is rebuilt without them
+INDEX_MAX_DELETED_RATIO = float(os.getenv("INDEX_MAX_DELETED_RATIO", "0.2"))
+
+# Follow the index written by another process instead of owning it
+INDEX_READ_ONLY = os.getenv("INDEX_READ_ONLY", "false").lower() == "true"
+
+# Seconds between checks for a new index generation in read-only mode
+INDEX_REFRESH_INTERVAL = float(os.getenv("INDEX_REFRESH_INTERVAL", "5"))
+
+# SQLite file backing the embedding cache (empty to keep it in memory only)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(INDEX_DIR, "embeddings.sqlite"))
+
+# Maximum number of embedding vectors kept in the in-memory cache tier
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+
+# Maximum number of embedding vectors kept in the SQLite file; the least recently used
+# are deleted beyond it (0 for no limit)
+EMBEDDING_CACHE_DISK_SIZE = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "500000"))
+
+# Number of worker processes used to parse and split PDFs
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+
+# Number of PDF pages parsed per ingestion task
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "16"))
+
+# Approximate ceiling in MB for chunks buffered between parsing, embedding and indexing
+INGEST_MEMORY_LIMIT_MB = float(os.getenv("INGEST_MEMORY_LIMIT_MB", "256"))
+
+# Number of chunks sent to the embedding API per request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+
+# Maximum number of embedding requests in flight during ingestion
+EMBED_MAX_CONCURRENCY = int(os.getenv("EMBED_MAX_CONCURRENCY", "4"))
+
+# Minimum cosine similarity between standalone questions for an answer cache hit
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+# Maximum number of cached answers (0 disables the answer cache)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))
+
+# Lifetime of a cached answer in seconds
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+# Maximum number of chat sessions kept; the least recently used are evicted
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+
+# Seconds of inactivity after which a chat session expires
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+
+# SQLite file for chat histories (empty to keep them in memory)
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "")
+
+# Most recent messages of a session sent to the model
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "10"))
+
+# Approximate token budget for the chat history sent to the model
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "1500"))
+
+# Most recent messages stored per session; older ones are deleted (0 for no limit)
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", str(5 * HISTORY_MAX_MESSAGES)))
+
+# Default retrieval mode: "fast" (single search) or "multi_query" (LLM-generated query variants)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "multi_query")
+
+# Number of chunks returned by each search
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", "4"))
+
+# Fuse vector search results with the local BM25 index
+RETRIEVAL_HYBRID = os.getenv("RETRIEVAL_HYBRID", "true").lower() == "true"
+
+# Seconds to wait for vector search before answering from the lexical index alone
+VECTOR_SEARCH_TIMEOUT = float(os.getenv("VECTOR_SEARCH_TIMEOUT", "5"))
+
+# Token budget for the retrieved passages in the answer prompt (0 for no limit)
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "2000"))
+
+# Chat requests answered at once across the API and the Telegram bot, and
+# per session (running or waiting); further requests wait in a bounded queue
+CHAT_MAX_CONCURRENT = int(os.getenv("CHAT_MAX_CONCURRENT", "16"))
+CHAT_MAX_PER_SESSION = int(os.getenv("CHAT_MAX_PER_SESSION", "2"))
+CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", "100"))
+
+# Seconds a chat request may wait for a slot before it is rejected as overloaded
+CHAT_MAX_WAIT = float(os.getenv("CHAT_MAX_WAIT", "10"))
+
+# Seconds before a Gemini request times out (0 for no limit), and how often it is retried
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+
+# Time limits of the query stages in seconds (0 for no limit). A slow
+# contextualization or query generation is skipped; a slow answer fails.
+CONTEXTUALIZE_TIMEOUT = float(os.getenv("CONTEXTUALIZE_TIMEOUT", "10"))
+GENERATE_QUERIES_TIMEOUT = float(os.getenv("GENERATE_QUERIES_TIMEOUT", "10"))
+ANSWER_TIMEOUT = float(os.getenv("ANSWER_TIMEOUT", "60"))
+
+# Most questions accepted by one /api/chat/batch request, and how many of them are answered at once
+CHAT_BATCH_MAX_QUESTIONS = int(os.getenv("CHAT_BATCH_MAX_QUESTIONS", "1000"))
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", "8"))
+
+# Build the RAG chain (loading the persisted index and creating the Gemini
+# clients) in the background right after startup instead of on first use
+WARMUP = os.getenv("WARMUP", "true").lower() == "true"
+
+# Serve the Gradio UI from the API process at this path (empty to disable, which
+# keeps Gradio from being imported and the API quick to start)
+GRADIO_PATH = os.getenv("GRADIO_PATH", "")
+
+# Run the Telegram bot inside the API process when TELEGRAM_BOT_TOKEN is set
+RUN_TELEGRAM_BOT = os.getenv("RUN_TELEGRAM_BOT", "true").lower() == "true"
+
+# Worker threads answering Telegram chats concurrently
+TELEGRAM_WORKERS = int(os.getenv("TELEGRAM_WORKERS", "8"))
+
+# Maximum number of Telegram messages waiting to be answered, in total and per chat
+TELEGRAM_MAX_PENDING = int(os.getenv("TELEGRAM_MAX_PENDING", "200"))
+TELEGRAM_MAX_PENDING_PER_CHAT = int(os.getenv("TELEGRAM_MAX_PENDING_PER_CHAT", "5"))
+
+# Seconds between edits of a Telegram message while its answer is streamed
+TELEGRAM_EDIT_INTERVAL = float(os.getenv("TELEGRAM_EDIT_INTERVAL", "1.5"))
+
+# Maximum number of streaming message edits sent to Telegram per second across all chats
+TELEGRAM_EDITS_PER_SECOND = float(os.getenv("TELEGRAM_EDITS_PER_SECOND", "20"))
+
+# Log chat requests slower than this many seconds with their stage timings (0 disables)
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "0"))
@@ -1,10 +1,15 @@
 import os
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Request, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
-from app.api.routes import router as api_router
-from app.bot.rag_chain import RAGChain
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from app import config
+from app.api.routes import router as api_router, admission, collection_manager, get_rag_chain, pdf_processor
+from app.utils.metrics import register_stats
+from app.utils.startup import warm_up
 
 # Load environment variables
 load_dotenv()
@@ -25,17 +30,75 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject upload requests that declare a body larger than the limit before reading any of it."""
+    if config.MAX_UPLOAD_REQUEST_BYTES and request.url.path == "/api/upload-pdfs":
+        length = request.headers.get("content-length")
+        if length and length.isdigit() and int(length) > config.MAX_UPLOAD_REQUEST_BYTES:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": f"Upload exceeds the {config.MAX_UPLOAD_REQUEST_MB:g} MB request limit"},
+            )
+    return await call_next(request)
+
 # Include API routes
 app.include_router(api_router)
 
 # Create uploads directory if it doesn't exist
-os.makedirs("uploads", exist_ok=True)
+os.makedirs(config.UPLOAD_DIR, exist_ok=True)
+
+# Serve the Gradio UI from this process so that it shares the API's RAG chain and index
+if config.GRADIO_PATH:
+    import gradio as gr
+    from gradio_app import create_demo
+
+    demo = create_demo(pdf_processor=pdf_processor, get_rag_chain=get_rag_chain, admission=admission)
+    app = gr.mount_gradio_app(app, demo, path=config.GRADIO_PATH)
+
+telegram_bot = None
 
-# Initialize RAG chain on startup
 @app.on_event("startup")
 async def startup_event():
-    # Initialize the RAG chain with the API key from environment variables
-    RAGChain()
+    global telegram_bot
+
+    # The default collection is loaded on first use, or right away in the
+    # background when warming up; loading it also queues a background sync
+    # of its index with the PDFs on disk
+    if config.WARMUP:
+        warm_up("default collection", get_rag_chain)
+
+    # Answer Telegram chats from this process as well, sharing the same index
+    if config.RUN_TELEGRAM_BOT and os.getenv("TELEGRAM_BOT_TOKEN"):
+        from app.bot.telegram_bot import TelegramBot
+
+        try:
+            telegram_bot = TelegramBot(get_rag_chain=get_rag_chain, admission=admission)
+            telegram_bot.start()
+        except Exception as e:
+            print(f"Failed to start the Telegram bot: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if telegram_bot is not None:
+        telegram_bot.stop()
+
+def collect_stats():
+    """Cache and queue statistics of the running components, for /metrics."""
+    rag_chain = collection_manager.peek(config.DEFAULT_COLLECTION)
+    stats = dict(rag_chain.stats()) if rag_chain is not None else {}
+    stats["collections"] = collection_manager.stats()
+    stats["admission"] = admission.stats()
+    if telegram_bot is not None:
+        stats["telegram_queue"] = telegram_bot.workers.stats()
+    return stats
+
+register_stats(collect_stats)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics: per-stage and chat latency histograms, LLM, embedding and cache counters."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 @app.get("/")
 async def root():
@@ -0,0 +1,255 @@
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import LLMResult
+from prometheus_client import REGISTRY, Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from app import config
+from app.bot.session_store import estimate_tokens
+
+class LatencyStats:
+    """Keep the most recent latency samples of one kind and report percentiles."""
+
+    def __init__(self, name: str, max_samples: int = 1000):
+        """Initialize the stats, keeping at most max_samples recent samples."""
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        """Record one sample."""
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self._samples.append(seconds)
+
+    def summary(self) -> Dict[str, float]:
+        """
+        Summarize the recorded samples.
+
+        Returns:
+            Dictionary with the total count, the mean and the p50/p95/p99 of
+            the recent samples, in seconds
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+            count, total = self.count, self.total
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {
+            "count": count,
+            "mean": total / count if count else 0.0,
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+        }
+
+# Time from receiving a chat request to the first answer token
+CHAT_TTFT = LatencyStats("chat_time_to_first_token_seconds")
+# Time from receiving a chat request to the end of the answer
+CHAT_LATENCY = LatencyStats("chat_latency_seconds")
+
+# Prometheus metrics, exposed on /metrics
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds", "Duration of query and ingestion pipeline stages",
+    ["mode", "stage"], buckets=LATENCY_BUCKETS,
+)
+CHAT_TTFT_SECONDS = Histogram(
+    "rag_chat_time_to_first_token_seconds", "Time from a chat request to its first answer token",
+    ["mode"], buckets=LATENCY_BUCKETS,
+)
+CHAT_LATENCY_SECONDS = Histogram(
+    "rag_chat_latency_seconds", "Time from a chat request to the end of its answer",
+    ["mode"], buckets=LATENCY_BUCKETS,
+)
+LLM_CALLS = Counter("rag_llm_calls_total", "Chat model calls", ["call"])
+LLM_TOKENS = Counter("rag_llm_tokens_total", "Chat model tokens", ["call", "direction"])
+EMBEDDING_REQUESTS = Counter("rag_embedding_requests_total", "Embedding model requests", ["kind"])
+EMBEDDED_TEXTS = Counter("rag_embedded_texts_total", "Texts sent to the embedding model", ["kind"])
+INGESTED_DOCUMENTS = Counter("rag_ingested_documents_total", "PDFs ingested", ["status"])
+INGESTED_CHUNKS = Counter("rag_ingested_chunks_total", "Chunks added to the index")
+UPLOADED_BYTES = Counter("rag_uploaded_bytes_total", "Bytes of uploaded PDFs saved to disk")
+ADMISSION_WAIT_SECONDS = Histogram(
+    "rag_admission_wait_seconds", "Time chat requests waited in the admission queue before starting",
+    buckets=LATENCY_BUCKETS,
+)
+COALESCED_QUESTIONS = Counter(
+    "rag_chat_coalesced_total", "Chat questions answered by an identical question already in flight", ["mode"]
+)
+
+# Duration of each query pipeline stage, keyed by (retrieval mode, stage)
+_stage_stats: Dict[tuple, LatencyStats] = {}
+_stage_lock = threading.Lock()
+
+def observe_stage(mode: str, stage: str, seconds: float) -> None:
+    """Record the duration of one pipeline stage."""
+    with _stage_lock:
+        stats = _stage_stats.get((mode, stage))
+        if stats is None:
+            stats = _stage_stats[(mode, stage)] = LatencyStats(f"{mode}.{stage}")
+    stats.observe(seconds)
+    STAGE_SECONDS.labels(mode=mode, stage=stage).observe(seconds)
+
+@contextmanager
+def ingest_stage(stage: str):
+    """Time an ingestion stage; recorded under the "ingest" mode."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage("ingest", stage, time.perf_counter() - start)
+
+def stage_summary() -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Return the stage latency summaries grouped by retrieval mode (or "ingest")."""
+    with _stage_lock:
+        items = list(_stage_stats.items())
+    summary: Dict[str, Dict[str, Dict[str, float]]] = {}
+    for (mode, stage), stats in sorted(items):
+        summary.setdefault(mode, {})[stage] = stats.summary()
+    return summary
+
+class RequestTimer:
+    """Measure time-to-first-token and total latency of one chat request."""
+
+    def __init__(self, mode: str = "default"):
+        self.start = time.perf_counter()
+        self.mode = mode
+        self.ttft: Optional[float] = None
+        self.latency: Optional[float] = None
+        # Duration of each pipeline stage of this request
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a pipeline stage of this request."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+            observe_stage(self.mode, name, seconds)
+
+    def first_token(self) -> None:
+        """Mark that the first answer token has been produced (later calls are ignored)."""
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.start
+            CHAT_TTFT.observe(self.ttft)
+            CHAT_TTFT_SECONDS.labels(mode=self.mode).observe(self.ttft)
+
+    def finish(self) -> None:
+        """Mark the end of the request."""
+        if self.latency is None:
+            self.latency = time.perf_counter() - self.start
+            if self.ttft is None:
+                # A non-streamed answer arrives all at once
+                self.first_token()
+            CHAT_LATENCY.observe(self.latency)
+            CHAT_LATENCY_SECONDS.labels(mode=self.mode).observe(self.latency)
+            if config.SLOW_REQUEST_SECONDS and self.latency >= config.SLOW_REQUEST_SECONDS:
+                stages = ", ".join(f"{name}={seconds:.3f}s" for name, seconds in self.stages.items())
+                print(f"Slow chat request ({self.mode}): {self.latency:.3f}s [{stages}]")
+
+def latency_summary() -> Dict[str, Dict[str, float]]:
+    """Return the summaries of all chat latency stats keyed by name."""
+    return {stats.name: stats.summary() for stats in (CHAT_TTFT, CHAT_LATENCY)}
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """
+    Count chat model calls and tokens.
+
+    Calls are labelled by the "llm_call" metadata of the runnable, e.g.
+    llm.with_config(callbacks=[LLM_METRICS], metadata={"llm_call": "answer"}).
+    Token counts come from the model's usage metadata when it reports it,
+    and are estimated from the text otherwise.
+    """
+
+    def __init__(self):
+        # Run ID -> (call label, estimated prompt tokens) of the calls in flight
+        self._calls: Dict[UUID, tuple] = {}
+
+    def on_chat_model_start(
+        self, serialized: Dict[str, Any], messages: List[List[BaseMessage]], *, run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None, **kwargs: Any,
+    ) -> None:
+        call = (metadata or {}).get("llm_call", "other")
+        prompt_tokens = sum(estimate_tokens(str(m.content)) for batch in messages for m in batch)
+        self._calls[run_id] = (call, prompt_tokens)
+        LLM_CALLS.labels(call=call).inc()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        call, prompt_tokens = self._calls.pop(run_id, ("other", 0))
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                LLM_TOKENS.labels(call=call, direction="prompt").inc(
+                    usage.get("input_tokens") or prompt_tokens
+                )
+                LLM_TOKENS.labels(call=call, direction="completion").inc(
+                    usage.get("output_tokens") or estimate_tokens(generation.text)
+                )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._calls.pop(run_id, None)
+
+LLM_METRICS = LLMMetricsHandler()
+
+class StatsCollector:
+    """
+    Expose a stats() dictionary as Prometheus metrics at scrape time.
+
+    Every numeric value of stats()[group][name] becomes rag_<group>_<name>;
+    hit and miss counts are counters, everything else a gauge.
+    """
+
+    COUNTERS = (
+        "hits", "misses", "disk_hits", "rate_limited", "retries", "rejected", "loads", "evictions",
+        "admitted", "shed", "pruned",
+    )
+
+    def __init__(self, stats: Callable[[], Optional[Dict[str, Dict[str, Any]]]]):
+        self.stats = stats
+
+    def collect(self):
+        for group, values in (self.stats() or {}).items():
+            for name, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                metric = f"rag_{group}_{name}"
+                if name in self.COUNTERS:
+                    family = CounterMetricFamily(metric, f"{group} {name}")
+                else:
+                    family = GaugeMetricFamily(metric, f"{group} {name}")
+                family.add_metric([], value)
+                yield family
+
+_stats_collector: Optional[StatsCollector] = None
+_stats_collector_lock = threading.Lock()
+
+def register_stats(stats: Callable[[], Optional[Dict[str, Dict[str, Any]]]]) -> None:
+    """
+    Expose a stats() dictionary through the default Prometheus registry.
+
+    Replaces the collector registered by an earlier call, so that
+    re-importing the app does not register the same metrics twice.
+    """
+    global _stats_collector
+    with _stats_collector_lock:
+        if _stats_collector is not None:
+            REGISTRY.unregister(_stats_collector)
+        _stats_collector = StatsCollector(stats)
+        REGISTRY.register(_stats_collector)
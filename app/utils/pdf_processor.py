@@ -1,43 +1,200 @@
 import os
+import glob
+import time
 import uuid
-import shutil
-from typing import List, Dict
+import hashlib
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
 from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from app import config
+from app.utils.metrics import UPLOADED_BYTES, ingest_stage
+
+class FileTooLargeError(ValueError):
+    """Raised when an uploaded file exceeds the configured size limit."""
 
 class PDFProcessor:
-    def __init__(self, upload_dir: str = "uploads"):
-        """Initialize the PDF processor with an upload directory."""
+    # Bytes read and written per step while saving an upload
+    CHUNK_SIZE = 1024 * 1024
+    # Hex digits of the SHA-256 content hash used as the stored filename prefix
+    HASH_PREFIX_LENGTH = 32
+    # Partial files untouched for this many seconds were left behind by an interrupted upload
+    STALE_PART_SECONDS = 3600
+
+    def __init__(self, upload_dir: str = config.UPLOAD_DIR, max_file_size: int = config.MAX_UPLOAD_BYTES):
+        """Initialize the PDF processor with an upload directory and a per-file size limit in bytes."""
         self.upload_dir = upload_dir
+        self.max_file_size = max_file_size
         os.makedirs(self.upload_dir, exist_ok=True)
-        
-    async def save_uploaded_pdfs(self, files: List[UploadFile]) -> List[str]:
+
+        # Remove partial files left behind by an interrupted upload. Recent
+        # ones may still be written by another worker process.
+        cutoff = time.time() - self.STALE_PART_SECONDS
+        for path in glob.glob(os.path.join(self.upload_dir, ".*.part")):
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def find_by_hash(self, digest: str, exclude: Optional[str] = None) -> Optional[str]:
+        """Return the path of a stored PDF with the given content hash, if there is one."""
+        matches = glob.glob(os.path.join(self.upload_dir, f"{digest[:self.HASH_PREFIX_LENGTH]}_*"))
+        matches = [path for path in matches if path != exclude]
+        return matches[0] if matches else None
+
+    def _claim_path(self, prefix: str) -> str:
+        return os.path.join(self.upload_dir, f".{prefix}.claim")
+
+    def _new_part_file(self) -> Tuple[str, BinaryIO]:
+        path = os.path.join(self.upload_dir, f".{uuid.uuid4()}.part")
+        return path, open(path, "wb")
+
+    def _write_chunk(self, out: BinaryIO, digest: Any, chunk: bytes, written: int) -> int:
+        """Write one chunk and update the hash; returns the new total, enforcing the size limit."""
+        written += len(chunk)
+        if self.max_file_size and written > self.max_file_size:
+            raise FileTooLargeError(f"File exceeds the {self.max_file_size} byte upload limit")
+        digest.update(chunk)
+        out.write(chunk)
+        return written
+
+    def _finish(self, part_path: str, filename: str, digest: str, size: int) -> Dict[str, Any]:
         """
-        Save uploaded PDF files to the upload directory and return their paths.
-        
+        Move a fully written part file into place, or drop it if the same content is already stored.
+
+        Concurrent uploads of the same content, in this process or another,
+        race for a hard link named after the content hash; only the winner
+        keeps its file, so the content is embedded once.
+        """
+        UPLOADED_BYTES.inc(size)
+        prefix = digest[:self.HASH_PREFIX_LENGTH]
+        # The content hash replaces the random prefix, so identical files share one name
+        file_path = os.path.join(self.upload_dir, f"{prefix}_{filename}")
+        claim_path = self._claim_path(prefix)
+        try:
+            existing = self.find_by_hash(digest)
+            if existing is not None:
+                return {"filename": filename, "path": existing, "duplicate": True}
+            try:
+                # Linking fails if the name exists, so the file only appears complete
+                os.link(part_path, file_path)
+            except FileExistsError:
+                return {"filename": filename, "path": file_path, "duplicate": True}
+
+            while True:
+                try:
+                    # The claim is a hard link to the stored file, so it goes
+                    # stale once that file is deleted
+                    os.link(file_path, claim_path)
+                    return {"filename": filename, "path": file_path, "duplicate": False}
+                except FileExistsError:
+                    existing = self.find_by_hash(digest, exclude=file_path)
+                    if existing is not None:
+                        os.remove(file_path)
+                        return {"filename": filename, "path": existing, "duplicate": True}
+                    try:
+                        if os.stat(claim_path).st_nlink == 1:
+                            os.remove(claim_path)
+                    except FileNotFoundError:
+                        pass
+        finally:
+            os.remove(part_path)
+
+    async def save_uploaded_pdfs(self, files: List[UploadFile]) -> List[Dict[str, Any]]:
+        """
+        Save uploaded PDF files to the upload directory.
+
+        Starlette has already spooled each file to a temporary file; it is
+        copied into the upload directory in chunks, without blocking the
+        event loop, while its SHA-256 hash is computed. A file whose content is
+        already stored is not kept again; the existing copy is returned
+        instead, marked as a duplicate.
+
         Args:
             files: List of uploaded PDF files
-            
+
         Returns:
-            List of file paths where the PDFs are saved
+            List of dictionaries with the original filename, the stored path
+            and whether the file was a duplicate
+
+        Raises:
+            FileTooLargeError: If a file exceeds the size limit; no file of
+                the request is kept then
         """
-        saved_paths = []
-        
+        files = [file for file in files if file.filename.lower().endswith('.pdf')]
+
+        # Reject the request if a file size is already known to be too large, before copying anything
         for file in files:
-            if not file.filename.lower().endswith('.pdf'):
+            if self.max_file_size and file.size is not None and file.size > self.max_file_size:
+                raise FileTooLargeError(
+                    f"{os.path.basename(file.filename)} exceeds the {self.max_file_size} byte upload limit"
+                )
+
+        saved = []
+        try:
+            for file in files:
+                filename = os.path.basename(file.filename)
+                with ingest_stage("save_upload"):
+                    digest = hashlib.sha256()
+                    part_path, out = self._new_part_file()
+                    written = 0
+                    try:
+                        while chunk := await file.read(self.CHUNK_SIZE):
+                            written = await run_in_threadpool(self._write_chunk, out, digest, chunk, written)
+                    except BaseException:
+                        out.close()
+                        os.remove(part_path)
+                        raise
+                    out.close()
+
+                saved.append(self._finish(part_path, filename, digest.hexdigest(), written))
+        except BaseException:
+            # Files stored by this request would otherwise be listed but never ingested
+            for item in saved:
+                if not item["duplicate"]:
+                    self.delete_pdf(os.path.basename(item["path"]))
+            raise
+
+        return saved
+
+    def save_pdf_files(self, paths: List[str]) -> List[Dict[str, Any]]:
+        """
+        Copy PDF files from local paths (such as Gradio temporary files) to the upload directory.
+
+        Works like save_uploaded_pdfs, for files that are already on disk.
+
+        Args:
+            paths: Paths of the PDF files to copy
+
+        Returns:
+            List of dictionaries with the original filename, the stored path
+            and whether the file was a duplicate
+        """
+        saved = []
+
+        for path in paths:
+            filename = os.path.basename(path)
+            if not filename.lower().endswith('.pdf'):
                 continue
-                
-            # Create a unique filename to avoid collisions
-            unique_filename = f"{uuid.uuid4()}_{file.filename}"
-            file_path = os.path.join(self.upload_dir, unique_filename)
-            
-            # Save the file
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-                
-            saved_paths.append(file_path)
-            
-        return saved_paths
-    
+
+            with ingest_stage("save_upload"), open(path, "rb") as source:
+                digest = hashlib.sha256()
+                part_path, out = self._new_part_file()
+                written = 0
+                try:
+                    while chunk := source.read(self.CHUNK_SIZE):
+                        written = self._write_chunk(out, digest, chunk, written)
+                except BaseException:
+                    out.close()
+                    os.remove(part_path)
+                    raise
+                out.close()
+
+            saved.append(self._finish(part_path, filename, digest.hexdigest(), written))
+
+        return saved
+
     def get_saved_pdfs(self) -> List[Dict[str, str]]:
         """
         Get a list of all saved PDFs in the upload directory.
@@ -50,7 +207,7 @@ class PDFProcessor:
         for filename in os.listdir(self.upload_dir):
             if filename.lower().endswith('.pdf'):
                 file_path = os.path.join(self.upload_dir, filename)
-                # Get the original filename by removing the UUID prefix
+                # Get the original filename by removing the hash (or UUID) prefix
                 original_name = "_".join(filename.split("_")[1:])
                 
                 pdf_files.append({
@@ -73,6 +230,9 @@ class PDFProcessor:
         try:
             file_path = os.path.join(self.upload_dir, filename)
             if os.path.exists(file_path):
+                claim_path = self._claim_path(filename.split("_", 1)[0])
+                if os.path.exists(claim_path) and os.path.samefile(claim_path, file_path):
+                    os.remove(claim_path)
                 os.remove(file_path)
                 return True
         except Exception:
@@ -90,7 +250,7 @@ class PDFProcessor:
         try:
             for filename in os.listdir(self.upload_dir):
                 file_path = os.path.join(self.upload_dir, filename)
-                if os.path.isfile(file_path) and filename.lower().endswith('.pdf'):
+                if os.path.isfile(file_path) and filename.lower().endswith(('.pdf', '.claim')):
                     os.remove(file_path)
             return True
         except Exception:
@@ -0,0 +1,57 @@
+import time
+import threading
+from typing import Callable, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+class Lazy(Generic[T]):
+    """
+    A value built by a factory on first use.
+
+    The factory runs once even when several threads ask for the value at
+    the same time; they wait for it instead of building their own. If it
+    raises, the next call tries again.
+    """
+
+    def __init__(self, factory: Callable[[], T]):
+        self.factory = factory
+        self._value: Optional[T] = None
+        self._built = False
+        self._lock = threading.Lock()
+
+    def __call__(self) -> T:
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self._value = self.factory()
+                    self._built = True
+        return self._value
+
+    def peek(self) -> Optional[T]:
+        """Return the value if it has been built, without building it."""
+        return self._value if self._built else None
+
+def warm_up(name: str, build: Callable[[], object]) -> threading.Thread:
+    """
+    Build a lazily created component in a background thread.
+
+    Startup finishes without waiting for it, and the first request that
+    needs the component only waits for whatever is left of the warm-up.
+    Failures are printed; the component is then built on first use instead.
+
+    Args:
+        name: Name of the component, for the log
+        build: Builds the component, e.g. a Lazy or a getter around one
+    """
+    def run() -> None:
+        start = time.perf_counter()
+        try:
+            build()
+        except Exception as e:
+            print(f"Warming up the {name} failed: {e}")
+        else:
+            print(f"Warmed up the {name} in {time.perf_counter() - start:.2f}s")
+
+    thread = threading.Thread(target=run, name=f"warm-up-{name.replace(' ', '-')}", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,147 @@
+"""
+Compare the recall and latency of the FAISS index types against exact flat search.
+
+Builds every index type on synthetic clustered vectors, sweeps its search
+setting (efSearch for HNSW, nprobe for IVF) and reports recall@k against
+the flat index, query latency, build time and index size:
+
+    python -m benchmarks.ann --sizes 10000,100000 --output ann.json
+    python -m benchmarks.compare baseline.json ann.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import faiss
+import numpy as np
+
+from app.bot.vector_index import MIN_TRAINING_VECTORS, new_index
+from app.utils.metrics import LatencyStats
+from benchmarks.run import git_revision
+
+def make_vectors(count: int, dimensions: int, seed: int = 0) -> np.ndarray:
+    """Unit vectors drawn around random cluster centres, which is closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(max(1, count // 100), dimensions)).astype("float32")
+    vectors = centres[rng.integers(len(centres), size=count)]
+    vectors += 0.5 * rng.normal(size=vectors.shape).astype("float32")
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def build(kind: str, vectors: np.ndarray) -> Dict[str, Any]:
+    """Train and fill an index of the given type, as RAGChain would."""
+    start = time.perf_counter()
+    index = new_index(kind, vectors.shape[1], len(vectors))
+    if not index.is_trained:
+        sample_size = min(len(vectors), 64 * index.nlist, 256 * 1024)
+        index.train(vectors[np.random.default_rng(1).choice(len(vectors), sample_size, replace=False)])
+    index.add(vectors)
+    return {"index": index, "build_seconds": time.perf_counter() - start}
+
+def measure(index: faiss.Index, queries: np.ndarray, truth: np.ndarray, k: int) -> Dict[str, Any]:
+    """Search one query at a time, like a chat request, and score the results against the exact ones."""
+    latency = LatencyStats("search", max_samples=len(queries))
+    found = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        _, labels = index.search(query[None, :], k)
+        latency.observe(time.perf_counter() - start)
+        found += len(set(labels[0]) & set(expected))
+    return {"recall": found / truth.size, "latency": latency.summary()}
+
+def benchmark_size(args: argparse.Namespace, count: int) -> Dict[str, Any]:
+    vectors = make_vectors(count + args.queries, args.dimensions)
+    vectors, queries = vectors[:count], vectors[count:]
+
+    results = {}
+    flat = build("flat", vectors)
+    _, truth = flat["index"].search(queries, args.k)
+    results["flat"] = {
+        "build_seconds": flat["build_seconds"],
+        "bytes": faiss.serialize_index(flat["index"]).size,
+        "settings": {"exact": measure(flat["index"], queries, truth, args.k)},
+    }
+
+    for kind, setting, values in (
+        ("hnsw", "ef", args.ef),
+        ("ivf", "nprobe", args.nprobe),
+        ("ivfpq", "nprobe", args.nprobe),
+    ):
+        if count < MIN_TRAINING_VECTORS.get(kind, 0):
+            continue
+        built = build(kind, vectors)
+        index = built["index"]
+        settings = {}
+        for value in values:
+            if kind == "hnsw":
+                index.hnsw.efSearch = value
+            else:
+                index.nprobe = value
+            settings[f"{setting}{value}"] = measure(index, queries, truth, args.k)
+        results[kind] = {
+            "build_seconds": built["build_seconds"],
+            "bytes": faiss.serialize_index(index).size,
+            "settings": settings,
+        }
+        print(f"ann: {count} vectors, {kind} done", file=sys.stderr)
+    return results
+
+def print_table(results: Dict[str, Any]) -> None:
+    print(f"{'vectors':>14} {'index':6} {'setting':10} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'MB':>9} {'build s':>8}")
+    for size, kinds in results.items():
+        for kind, result in kinds.items():
+            for setting, measured in result["settings"].items():
+                print(
+                    f"{size:>14} {kind:6} {setting:10} {measured['recall']:7.3f} "
+                    f"{measured['latency']['p50'] * 1000:8.3f} {measured['latency']['p95'] * 1000:8.3f} "
+                    f"{result['bytes'] / 2**20:9.1f} {result['build_seconds']:8.2f}"
+                )
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/<time>-<commit>-ann.json)")
+    parser.add_argument("--sizes", default="10000,100000", help="Comma-separated numbers of vectors")
+    parser.add_argument("--dimensions", type=int, default=768, help="Vector dimensions")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per index and setting")
+    parser.add_argument("--k", type=int, default=4, help="Results per query")
+    parser.add_argument("--ef", default="16,32,64,128", help="HNSW efSearch values to sweep")
+    parser.add_argument("--nprobe", default="4,16,64", help="IVF nprobe values to sweep")
+    args = parser.parse_args(argv)
+    args.sizes = sorted(int(size) for size in args.sizes.split(","))
+    args.ef = [int(value) for value in args.ef.split(",")]
+    args.nprobe = [int(value) for value in args.nprobe.split(",")]
+    return args
+
+def main(argv: List[str] = None) -> None:
+    args = parse_args(argv)
+    settings = {key: value for key, value in vars(args).items() if key != "output"}
+    results: Dict[str, Any] = {
+        "meta": {
+            **git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "faiss": faiss.__version__,
+            "settings": settings,
+        },
+        "ann": {f"{count}vectors": benchmark_size(args, count) for count in args.sizes},
+    }
+    print_table(results["ann"])
+
+    output = args.output
+    if not output:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join("benchmarks", "results", f"{stamp}-{results['meta']['commit'] or 'unknown'}-ann.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Compare two benchmark result files:
+
+    python -m benchmarks.compare baseline.json candidate.json
+
+Prints every metric found in both files with its relative change.
+"""
+import sys
+import json
+from typing import Any, Dict, List
+
+# Metrics where a higher value is better; for all others lower is better
+HIGHER_IS_BETTER = ("per_second", "recall")
+
+def flatten(data: Any, prefix: str = "") -> Dict[str, float]:
+    """Flatten nested results into {"path.to.metric": value} for numeric leaves."""
+    if isinstance(data, dict):
+        items = data.items()
+    elif isinstance(data, list):
+        # Retrieval results are keyed by corpus size rather than position
+        items = ((f"{item.get('documents', i)}docs" if isinstance(item, dict) else str(i), item)
+                 for i, item in enumerate(data))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        return {prefix: float(data)}
+    else:
+        return {}
+
+    flat = {}
+    for key, value in items:
+        flat.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    return flat
+
+def main(argv: List[str] = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        sys.exit(__doc__)
+
+    with open(argv[0]) as f:
+        baseline = json.load(f)
+    with open(argv[1]) as f:
+        candidate = json.load(f)
+    print(f"baseline:  {baseline['meta'].get('commit')}  candidate: {candidate['meta'].get('commit')}")
+
+    old = flatten({key: value for key, value in baseline.items() if key != "meta"})
+    new = flatten({key: value for key, value in candidate.items() if key != "meta"})
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key], new[key]
+        if before == after:
+            continue
+        change = (after - before) / before * 100 if before else float("inf")
+        better = after > before if key.endswith(HIGHER_IS_BETTER) else after < before
+        marker = "+" if better else "-"
+        print(f"{marker} {key:70s} {before:12.4f} -> {after:12.4f} ({change:+.1f}%)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import os
+import random
+from typing import List
+
+VOCABULARY = (
+    "system module pressure valve sensor report annual revenue contract clause "
+    "warranty service interval engine firmware update battery voltage limit "
+    "safety procedure inspection maintenance schedule component assembly torque "
+    "temperature threshold customer invoice payment delivery shipment policy "
+    "network latency throughput storage backup recovery release version"
+).split()
+
+def make_sentence(rng: random.Random) -> str:
+    """Return a random sentence, sometimes mentioning an identifier such as an error code."""
+    words = [rng.choice(VOCABULARY) for _ in range(rng.randint(8, 18))]
+    if rng.random() < 0.3:
+        words.insert(rng.randrange(len(words)), f"E-{rng.randint(1000, 9999)}")
+    return " ".join(words).capitalize() + "."
+
+def make_page(rng: random.Random, chars: int = 2500) -> str:
+    """Return roughly `chars` characters of random sentences."""
+    sentences = []
+    length = 0
+    while length < chars:
+        sentence = make_sentence(rng)
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(sentences)
+
+def write_pdf(path: str, pages: List[str]) -> None:
+    """
+    Write a minimal PDF with one page of Helvetica text per string.
+
+    Kept dependency-free so the benchmarks only need the app's requirements.
+    """
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    page_ids = []
+    for i, text in enumerate(pages):
+        page_id = 4 + 2 * i
+        page_ids.append(page_id)
+        lines = [text[j:j + 90] for j in range(0, len(text), 90)]
+        escaped = (line.replace("\\", "").replace("(", "").replace(")", "") for line in lines)
+        stream = ("BT /F1 9 Tf 20 820 Td 11 TL " + " ".join(f"({line}) '" for line in escaped) + " ET").encode()
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+        ).encode()
+        objects[page_id + 1] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[2] = f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, objects[number])
+    xref = len(out)
+    count = max(objects) + 1
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % count
+    for number in range(1, count):
+        out += b"%010d 00000 n \n" % offsets[number]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, xref)
+
+    with open(path, "wb") as f:
+        f.write(out)
+
+def make_corpus(directory: str, documents: int, pages: int = 5, seed: int = 0) -> List[str]:
+    """
+    Write a synthetic corpus of PDFs, reusing files that already exist.
+
+    Returns:
+        Paths of the PDF files
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(documents):
+        path = os.path.join(directory, f"doc-{seed}-{i:05d}.pdf")
+        if not os.path.exists(path):
+            rng = random.Random(f"{seed}-{i}")
+            write_pdf(path, [make_page(rng) for _ in range(pages)])
+        paths.append(path)
+    return paths
+
+def make_questions(count: int, seed: int = 1) -> List[str]:
+    """Return random questions drawn from the corpus vocabulary."""
+    rng = random.Random(seed)
+    return [f"What does the document say about {make_sentence(rng).rstrip('.').lower()}?" for _ in range(count)]
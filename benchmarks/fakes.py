@@ -0,0 +1,180 @@
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+WORDS = (
+    "the index answer document section page report value system result data "
+    "model request table figure chapter summary error code clause part number"
+).split()
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic local stand-in for the Gemini chat model.
+
+    The reply depends only on the prompt, and is streamed word by word with
+    a configurable time to first token and time per token.
+    """
+
+    first_token_latency: float = 0.05
+    token_latency: float = 0.002
+    answer_tokens: int = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _reply(self, messages: List[BaseMessage]) -> List[str]:
+        prompt = "\n".join(str(message.content) for message in messages)
+        rng = np.random.default_rng(_seed(prompt))
+        tokens = []
+        for i in range(self.answer_tokens):
+            # Three lines, so multi-query generation gets three query variants
+            separator = "\n" if i and i % (self.answer_tokens // 3 or 1) == 0 else " "
+            tokens.append((separator if i else "") + WORDS[rng.integers(len(WORDS))])
+        return tokens
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._reply(messages)
+        time.sleep(self.first_token_latency + self.token_latency * (len(tokens) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tokens = self._reply(messages)
+        await asyncio.sleep(self.first_token_latency + self.token_latency * (len(tokens) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        for i, token in enumerate(self._reply(messages)):
+            time.sleep(self.token_latency if i else self.first_token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        for i, token in enumerate(self._reply(messages)):
+            await asyncio.sleep(self.token_latency if i else self.first_token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+class FakeEmbeddings(Embeddings):
+    """
+    Deterministic local stand-in for the Gemini embedding model.
+
+    Each text maps to a fixed random unit vector seeded by its hash. Every
+    call waits a fixed request latency plus a small cost per text.
+    """
+
+    def __init__(self, size: int = 768, request_latency: float = 0.02, text_latency: float = 0.0002):
+        self.size = size
+        self.request_latency = request_latency
+        self.text_latency = text_latency
+        self.calls = 0
+        self.texts = 0
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.random.default_rng(_seed(text)).standard_normal(self.size)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        time.sleep(self.request_latency + self.text_latency * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts += len(texts)
+        await asyncio.sleep(self.request_latency + self.text_latency * len(texts))
+        return [self._vector(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+class FakeRateLimitError(Exception):
+    """Rate-limit error of the fake embeddings, carrying an HTTP 429 status like the real clients."""
+
+    status_code = 429
+
+class FakeServerError(Exception):
+    """Transient failure of the fake embeddings."""
+
+    status_code = 500
+
+class ThrottledEmbeddings(FakeEmbeddings):
+    """
+    FakeEmbeddings that throttle and fail like a rate-limited API.
+
+    A request made while max_concurrent requests are already in flight is
+    rejected with a FakeRateLimitError, and the first `failures` requests
+    fail with a FakeServerError. Only embed_documents is throttled.
+    """
+
+    def __init__(
+        self,
+        size: int = 768,
+        request_latency: float = 0.02,
+        text_latency: float = 0.0002,
+        max_concurrent: int = 0,
+        failures: int = 0,
+    ):
+        super().__init__(size=size, request_latency=request_latency, text_latency=text_latency)
+        # Requests allowed in flight at once (0 for no limit)
+        self.max_concurrent = max_concurrent
+        self.failures = failures
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.throttled = 0
+        self.failed = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            if self.max_concurrent and self.in_flight >= self.max_concurrent:
+                self.throttled += 1
+                raise FakeRateLimitError("Too many requests")
+            if self.failed < self.failures:
+                self.failed += 1
+                raise FakeServerError("Internal error")
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return super().embed_documents(texts)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
@@ -0,0 +1,244 @@
+"""
+Benchmark the RAG pipeline with local stand-ins for Gemini.
+
+Measures ingestion throughput, retrieval latency against corpus size and
+/api/chat latency under concurrent load, and writes the results as JSON:
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.compare baseline.json results.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+# Keep the benchmarks independent of local settings and state on disk
+os.environ.update({
+    "ANSWER_CACHE_SIZE": "0",
+    "EMBEDDING_CACHE_PATH": "",
+    "SESSION_DB_PATH": "",
+    "GRADIO_PATH": "",
+    "RUN_TELEGRAM_BOT": "false",
+})
+
+from langchain_community.vectorstores import FAISS
+
+from app import config
+from app.bot.bm25 import BM25Index
+from app.bot.ingestion import stream_pdf_splits
+from app.bot.rag_chain import RAGChain
+from app.utils.metrics import LatencyStats, RequestTimer
+from benchmarks.corpus import make_corpus, make_questions
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+
+RETRIEVAL_STAGES = ("generate_queries", "lexical_search", "search")
+
+def build_chain(args: argparse.Namespace) -> RAGChain:
+    """Create an in-memory RAG chain backed by the fake models."""
+    llm = FakeChatModel(first_token_latency=args.llm_first_token, token_latency=args.llm_token)
+    embedding = FakeEmbeddings(size=args.dimensions, request_latency=args.embed_latency)
+    return RAGChain(index_dir=None, read_only=False, llm=llm, embedding=embedding)
+
+def benchmark_ingestion(args: argparse.Namespace, paths: List[str]) -> Dict[str, Any]:
+    """Time each ingestion stage separately, then a full load_pdfs run."""
+    chain = build_chain(args)
+
+    start = time.perf_counter()
+    splits = [split for _, result, _, _ in stream_pdf_splits(
+        paths, chain.chunk_size, chain.chunk_overlap,
+        max_workers=chain.ingest_workers, pages_per_task=config.INGEST_PAGES_PER_TASK,
+    ) for split in result or []]
+    parse_seconds = time.perf_counter() - start
+
+    texts = [split.page_content for split in splits]
+    start = time.perf_counter()
+    vectors = chain.embedder.embed(texts)
+    embed_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    FAISS.from_embeddings(list(zip(texts, vectors)), chain.embedding)
+    lexical_index = BM25Index()
+    for i, text in enumerate(texts):
+        lexical_index.add(str(i), text)
+    index_seconds = time.perf_counter() - start
+
+    chain = build_chain(args)
+    start = time.perf_counter()
+    chain.load_pdfs(paths)
+    total_seconds = time.perf_counter() - start
+
+    def rates(seconds: float) -> Dict[str, float]:
+        return {
+            "seconds": seconds,
+            "documents_per_second": len(paths) / seconds if seconds else 0.0,
+            "chunks_per_second": len(texts) / seconds if seconds else 0.0,
+        }
+
+    return {
+        "documents": len(paths),
+        "chunks": len(texts),
+        "parse_split": rates(parse_seconds),
+        "embed": rates(embed_seconds),
+        "index": rates(index_seconds),
+        "load_pdfs": rates(total_seconds),
+    }
+
+def benchmark_retrieval(args: argparse.Namespace, paths: List[str]) -> List[Dict[str, Any]]:
+    """Measure retrieval latency of every retrieval mode as the corpus grows."""
+    chain = build_chain(args)
+    questions = make_questions(args.questions)
+    results = []
+    loaded = 0
+    for size in args.sizes:
+        chain.load_pdfs(paths[loaded:size])
+        loaded = size
+
+        modes = {}
+        for mode in RAGChain.RETRIEVAL_MODES:
+            retrieval = LatencyStats("retrieval")
+            stages = {stage: LatencyStats(stage) for stage in RETRIEVAL_STAGES}
+            for question in questions:
+                timer = RequestTimer()
+                # A fresh session per question, so no contextualization step
+                for _ in chain.query_stream(question, f"bench-{uuid.uuid4()}", timer=timer, mode=mode):
+                    pass
+                retrieval.observe(sum(timer.stages.get(stage, 0.0) for stage in RETRIEVAL_STAGES))
+                for stage in RETRIEVAL_STAGES:
+                    if stage in timer.stages:
+                        stages[stage].observe(timer.stages[stage])
+            modes[mode] = {
+                "retrieval": retrieval.summary(),
+                "stages": {stage: stats.summary() for stage, stats in stages.items() if stats.count},
+            }
+
+        results.append({
+            "documents": size,
+            "chunks": sum(len(chunk_ids) for chunk_ids in chain.doc_chunks.values()),
+            "modes": modes,
+        })
+        print(f"retrieval: {size} documents done", file=sys.stderr)
+    return results
+
+async def benchmark_chat(args: argparse.Namespace, paths: List[str]) -> Dict[str, Any]:
+    """Send concurrent /api/chat requests through the ASGI app and measure latency."""
+    import httpx
+    from app.api import routes
+    from app.main import app
+
+    chain = build_chain(args)
+    routes.collection_manager.register(config.DEFAULT_COLLECTION, chain)
+    chain.load_pdfs(paths[:args.sizes[-1]])
+
+    questions = make_questions(args.requests, seed=2)
+    latency = LatencyStats("chat", max_samples=args.requests)
+    errors = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=None
+    ) as client:
+        async def send(question: str) -> None:
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/api/chat", json={"message": question, "mode": args.mode})
+                latency.observe(time.perf_counter() - start)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send(question) for question in questions))
+        seconds = time.perf_counter() - start
+
+    return {
+        "documents": len(chain.doc_chunks),
+        "mode": args.mode,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "errors": errors,
+        "seconds": seconds,
+        "requests_per_second": args.requests / seconds if seconds else 0.0,
+        "latency": latency.summary(),
+    }
+
+def git_revision() -> Dict[str, Any]:
+    """Return the current commit and whether the working tree has changes, if known."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--corpus-dir", default=os.path.join("benchmarks", "corpus"),
+                        help="Directory for the synthetic PDFs, reused across runs")
+    parser.add_argument("--sizes", default="10,50,200",
+                        help="Comma-separated corpus sizes (documents) for the retrieval benchmark")
+    parser.add_argument("--pages", type=int, default=5, help="Pages per synthetic document")
+    parser.add_argument("--questions", type=int, default=20, help="Questions per retrieval mode and corpus size")
+    parser.add_argument("--requests", type=int, default=200, help="Total /api/chat requests")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent /api/chat requests")
+    parser.add_argument("--mode", default="fast", choices=sorted(RAGChain.RETRIEVAL_MODES),
+                        help="Retrieval mode of the /api/chat requests")
+    parser.add_argument("--llm-first-token", type=float, default=0.05, help="Fake LLM time to first token (s)")
+    parser.add_argument("--llm-token", type=float, default=0.002, help="Fake LLM time per further token (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="Fake embedding request latency (s)")
+    parser.add_argument("--dimensions", type=int, default=768, help="Fake embedding dimensions")
+    parser.add_argument("--only", choices=["ingestion", "retrieval", "chat"], action="append",
+                        help="Run only the given benchmark (repeatable)")
+    args = parser.parse_args(argv)
+    args.sizes = sorted(int(size) for size in args.sizes.split(","))
+    return args
+
+def main(argv: List[str] = None) -> None:
+    args = parse_args(argv)
+    selected = set(args.only or ["ingestion", "retrieval", "chat"])
+    paths = make_corpus(args.corpus_dir, args.sizes[-1], pages=args.pages)
+
+    settings = {key: value for key, value in vars(args).items() if key not in ("output", "only")}
+    results: Dict[str, Any] = {
+        "meta": {
+            **git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "ingest_workers": config.INGEST_WORKERS,
+            "settings": settings,
+        },
+    }
+
+    if "ingestion" in selected:
+        results["ingestion"] = benchmark_ingestion(args, paths)
+        print("ingestion done", file=sys.stderr)
+    if "retrieval" in selected:
+        results["retrieval"] = benchmark_retrieval(args, paths)
+    if "chat" in selected:
+        results["chat"] = asyncio.run(benchmark_chat(args, paths))
+        print("chat done", file=sys.stderr)
+
+    output = args.output
+    if not output:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join("benchmarks", "results", f"{stamp}-{results['meta']['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
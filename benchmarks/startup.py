@@ -0,0 +1,194 @@
+"""
+Measure how long each entry point takes to start.
+
+Every run is a fresh Python process, started against a persisted index of
+a synthetic corpus. Each entry point reports the time to import it, the
+time until it could serve (the API answers a request, the Gradio UI is
+built, the Telegram bot is created) and the time until its RAG chain is
+loaded, which is what WARMUP=true moves off the startup path:
+
+    python -m benchmarks.startup --documents 50 --output startup.json
+    python -m benchmarks.compare baseline.json startup.json
+
+The Gemini clients are created with a placeholder API key but never called.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+# Keep the benchmarks independent of local settings and state on disk
+os.environ.update({
+    "EMBEDDING_CACHE_PATH": "",
+    "SESSION_DB_PATH": "",
+    "RUN_TELEGRAM_BOT": "false",
+    "WARMUP": "false",
+})
+
+from app.bot.rag_chain import RAGChain
+from app.utils.metrics import LatencyStats
+from benchmarks.corpus import make_corpus
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+from benchmarks.run import git_revision
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Script run in a fresh process for each entry point. Each records the
+# seconds since the script started in marks and prints them as JSON.
+PRELUDE = """
+import time
+start = time.perf_counter()
+import json
+marks = {}
+"""
+
+API_SCRIPT = """
+import app.main
+marks["import"] = time.perf_counter() - start
+from fastapi.testclient import TestClient
+before_client = time.perf_counter()
+with TestClient(app.main.app) as client:
+    client.get("/")
+    marks["ready"] = marks["import"] + time.perf_counter() - before_client
+    app.main.get_rag_chain()
+    marks["first_chain"] = marks["import"] + time.perf_counter() - before_client
+"""
+
+ENTRY_POINTS = {
+    # The API without the Gradio UI
+    "api": API_SCRIPT,
+    # The API with the Gradio UI mounted, as deployed by default
+    "api_gradio": API_SCRIPT,
+    "gradio": """
+import gradio_app
+from app.bot.rag_chain import RAGChain
+from app.utils.startup import Lazy
+marks["import"] = time.perf_counter() - start
+get_rag_chain = Lazy(RAGChain)
+gradio_app.create_demo(get_rag_chain=get_rag_chain)
+marks["ready"] = time.perf_counter() - start
+get_rag_chain()
+marks["first_chain"] = time.perf_counter() - start
+""",
+    "bot": """
+from app.bot.telegram_bot import TelegramBot
+from app.bot.rag_chain import RAGChain
+from app.utils.startup import Lazy
+marks["import"] = time.perf_counter() - start
+get_rag_chain = Lazy(RAGChain)
+TelegramBot(token="123456:placeholder", get_rag_chain=get_rag_chain)
+marks["ready"] = time.perf_counter() - start
+get_rag_chain()
+marks["first_chain"] = time.perf_counter() - start
+""",
+}
+
+def build_index(args: argparse.Namespace, index_dir: str) -> List[str]:
+    """Persist an index of the synthetic corpus for the entry points to load."""
+    paths = make_corpus(args.corpus_dir, args.documents, pages=args.pages)
+    chain = RAGChain(
+        index_dir=index_dir, llm=FakeChatModel(), embedding=FakeEmbeddings(size=args.dimensions)
+    )
+    chain.load_pdfs(paths)
+    chain.close()
+    return paths
+
+def run_entry_point(name: str, env: Dict[str, str]) -> Dict[str, float]:
+    """Start one entry point in a new process and return its marks plus the whole process time."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", PRELUDE + ENTRY_POINTS[name] + "print(json.dumps(marks))"],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{name} failed to start:\n{result.stderr}")
+    marks = json.loads(result.stdout.strip().splitlines()[-1])
+    marks["process"] = time.perf_counter() - start
+    return marks
+
+def benchmark_startup(args: argparse.Namespace, index_dir: str) -> Dict[str, Any]:
+    env = dict(
+        os.environ,
+        INDEX_DIR=index_dir,
+        # The PDFs of the index, so that syncing on load finds nothing to do
+        UPLOAD_DIR=os.path.abspath(args.corpus_dir),
+        GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY") or "placeholder",
+    )
+    results = {}
+    for name in args.entry_points:
+        stats = {}
+        entry_env = dict(env, GRADIO_PATH="/gradio" if name == "api_gradio" else "")
+        for _ in range(args.runs):
+            for mark, seconds in run_entry_point(name, entry_env).items():
+                stats.setdefault(mark, LatencyStats(f"{name}.{mark}", max_samples=args.runs)).observe(seconds)
+        results[name] = {mark: latency.summary() for mark, latency in stats.items()}
+        print(f"startup: {name} done", file=sys.stderr)
+    return results
+
+def print_table(results: Dict[str, Any]) -> None:
+    print(f"{'entry point':12} {'import s':>9} {'ready s':>9} {'chain s':>9} {'process s':>10}  (p50)")
+    for name, marks in results.items():
+        print(
+            f"{name:12} {marks['import']['p50']:9.2f} {marks['ready']['p50']:9.2f} "
+            f"{marks['first_chain']['p50']:9.2f} {marks['process']['p50']:10.2f}"
+        )
+
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="JSON file to write (default: benchmarks/results/<time>-<commit>-startup.json)")
+    parser.add_argument("--corpus-dir", default=os.path.join("benchmarks", "corpus"),
+                        help="Directory for the synthetic PDFs (reused between runs)")
+    parser.add_argument("--documents", type=int, default=50, help="Documents in the persisted index")
+    parser.add_argument("--pages", type=int, default=5, help="Pages per synthetic document")
+    parser.add_argument("--dimensions", type=int, default=768, help="Embedding dimensions of the index")
+    parser.add_argument("--runs", type=int, default=5, help="Process starts per entry point")
+    parser.add_argument("--entry-points", default=",".join(ENTRY_POINTS),
+                        help="Comma-separated entry points to measure")
+    args = parser.parse_args(argv)
+    args.entry_points = args.entry_points.split(",")
+    unknown = set(args.entry_points) - set(ENTRY_POINTS)
+    if unknown:
+        parser.error(f"Unknown entry points: {', '.join(sorted(unknown))}")
+    return args
+
+def main(argv: List[str] = None) -> None:
+    args = parse_args(argv)
+    settings = {key: value for key, value in vars(args).items() if key not in ("output", "corpus_dir")}
+    index_dir = tempfile.mkdtemp(prefix="startup-index-")
+    try:
+        build_index(args, index_dir)
+        startup = benchmark_startup(args, index_dir)
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    results: Dict[str, Any] = {
+        "meta": {
+            **git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "settings": settings,
+        },
+        "startup": startup,
+    }
+    print_table(startup)
+
+    output = args.output
+    if not output:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join("benchmarks", "results", f"{stamp}-{results['meta']['commit'] or 'unknown'}-startup.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
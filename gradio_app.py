@@ -1,120 +1,167 @@
 import os
 import gradio as gr
 import uuid
+from contextlib import nullcontext
+from typing import Callable, Optional
 from dotenv import load_dotenv
 
 # Import the RAG chain implementation
-from app.bot.rag_chain import RAGChain
+from app.bot.rag_chain import RAGChain, StageTimeoutError
+from app import config
+from app.bot.admission import AdmissionController, AdmissionError
+from app.utils.pdf_processor import PDFProcessor
+from app.utils.startup import Lazy, warm_up
 
 # Load environment variables
 load_dotenv()
 
-# Initialize RAG chain with API key from environment
-api_key = os.getenv("GOOGLE_API_KEY")
-rag_chain = RAGChain(api_key=api_key)
-
-# Dictionary to store chat sessions
-chat_sessions = {}
-
-def process_pdfs(pdf_files):
-    """Process uploaded PDF files."""
-    if not pdf_files:
-        return "No PDF files uploaded"
-        
-    # Save PDFs to temporary directory
-    pdf_paths = [pdf_file.name for pdf_file in pdf_files]
-    
-    # Load PDFs into RAG chain
-    rag_chain.load_pdfs(pdf_paths)
-    
-    return f"Processed {len(pdf_paths)} PDF files: {', '.join(os.path.basename(path) for path in pdf_paths)}"
-
-def respond(message, chat_history, session_id):
-    """Stream response while updating chat history."""
-    if not session_id:
-        session_id = str(uuid.uuid4())
-
-    chat_history.append((message, ""))  # Append user message with empty bot response
-    
-    response_generator = rag_chain.query(message, session_id)  # Streaming response
-    
-    bot_response = ""
-    for chunk in response_generator:
-        bot_response += chunk
-        chat_history[-1] = (message, bot_response)  # Update chat history in real-time
-        yield "", chat_history, session_id  # Stream response updates
-
-def clear_chat(chat_history, session_id):
-    """Clear the chat history for the current session."""
-    if session_id:
-        rag_chain.clear_session(session_id)
-    return [], session_id
-
-# Create Gradio interface
-with gr.Blocks(title="PDF RAG Chatbot") as demo:
-    gr.Markdown("# 📚 PDF RAG Chatbot")
-    gr.Markdown("Upload PDF files and chat with them using RAG (Retrieval Augmented Generation)")
-    
-    with gr.Row():
-        with gr.Column(scale=2):
-            # PDF upload section
-            pdf_files = gr.File(
-                label="Upload PDF Files",
-                file_types=[".pdf"],
-                file_count="multiple"
-            )
-            upload_button = gr.Button("Process PDFs")
-            pdf_status = gr.Textbox(label="Upload Status", interactive=False)
-            
-            # Connect the upload button
-            upload_button.click(
-                process_pdfs,
-                inputs=[pdf_files],
-                outputs=[pdf_status]
-            )
-            
-        with gr.Column(scale=3):
-            # Chat section
-            session_id = gr.State("")
-            chatbot = gr.Chatbot(label="Chat with your PDFs")  # Enable streaming
-            
-            with gr.Row():
-                msg = gr.Textbox(
-                    label="Your message",
-                    placeholder="Ask something about your PDFs...",
-                    scale=9
+def create_demo(
+    rag_chain: RAGChain = None,
+    pdf_processor: PDFProcessor = None,
+    get_rag_chain: Optional[Callable[[], RAGChain]] = None,
+    admission: Optional[AdmissionController] = None,
+) -> gr.Blocks:
+    """Build the Gradio interface on top of an existing RAG chain.
+
+    The API mounts this interface with its own RAG chain, so the web UI, the
+    API and the Telegram bot all share one index. Given get_rag_chain instead
+    of a chain, the interface is built without loading the index, and the
+    chain is fetched when it is first needed. With an admission controller,
+    answers wait for a slot shared with the API.
+    """
+    pdf_processor = pdf_processor or PDFProcessor()
+    chain = (lambda: rag_chain) if rag_chain is not None else get_rag_chain
+
+    def process_pdfs(pdf_files):
+        """Process uploaded PDF files."""
+        if not pdf_files:
+            return "No PDF files uploaded"
+
+        # Keep the PDFs in the upload directory, like API uploads
+        saved = pdf_processor.save_pdf_files([pdf_file.name for pdf_file in pdf_files])
+        # Files with the same content as an already indexed upload are not embedded again
+        pdf_paths = list(dict.fromkeys(
+            item["path"] for item in saved
+            if not item["duplicate"] or RAGChain.document_id(item["path"]) not in chain().doc_chunks
+        ))
+
+        # Load PDFs into RAG chain
+        try:
+            failures = chain().load_pdfs(pdf_paths)
+        except RuntimeError as e:
+            for item in saved:
+                if not item["duplicate"] and os.path.exists(item["path"]):
+                    os.remove(item["path"])
+            return str(e)
+
+        names = [item["filename"] for item in saved if item["path"] not in failures]
+        return f"Processed {len(names)} PDF files: {', '.join(names)}"
+
+    def respond(message, chat_history, session_id):
+        """Stream response while updating chat history."""
+        if not session_id:
+            session_id = str(uuid.uuid4())
+
+        chat_history.append((message, ""))  # Append user message with empty bot response
+
+        bot_response = ""
+        try:
+            with admission.admit(session_id) if admission else nullcontext():
+                response_generator = chain().query_stream(message, session_id)  # Streaming response
+                for chunk in response_generator:
+                    bot_response += chunk
+                    chat_history[-1] = (message, bot_response)  # Update chat history in real-time
+                    yield "", chat_history, session_id  # Stream response updates
+        except AdmissionError:
+            chat_history[-1] = (message, "The server is busy, please try again in a moment.")
+            yield "", chat_history, session_id
+        except StageTimeoutError:
+            chat_history[-1] = (message, "The answer took too long, please try again.")
+            yield "", chat_history, session_id
+        except Exception as e:
+            print(f"Error answering session {session_id}: {e}")
+            chat_history[-1] = (message, "Sorry, something went wrong while answering your question.")
+            yield "", chat_history, session_id
+
+    def clear_chat(chat_history, session_id):
+        """Clear the chat history for the current session."""
+        if session_id:
+            chain().clear_session(session_id)
+        return [], session_id
+
+    # Create Gradio interface
+    with gr.Blocks(title="PDF RAG Chatbot") as demo:
+        gr.Markdown("# 📚 PDF RAG Chatbot")
+        gr.Markdown("Upload PDF files and chat with them using RAG (Retrieval Augmented Generation)")
+
+        with gr.Row():
+            with gr.Column(scale=2):
+                # PDF upload section
+                pdf_files = gr.File(
+                    label="Upload PDF Files",
+                    file_types=[".pdf"],
+                    file_count="multiple"
+                )
+                upload_button = gr.Button("Process PDFs")
+                pdf_status = gr.Textbox(label="Upload Status", interactive=False)
+
+                # Connect the upload button
+                upload_button.click(
+                    process_pdfs,
+                    inputs=[pdf_files],
+                    outputs=[pdf_status]
                 )
-                submit = gr.Button("Send", scale=1)
-            
-            clear = gr.Button("Clear chat")
-            
-            # Connect the chat components
-            submit.click(
-                respond,
-                inputs=[msg, chatbot, session_id],
-                outputs=[msg, chatbot, session_id]
-            )
-            
-            msg.submit(
-                respond,
-                inputs=[msg, chatbot, session_id],
-                outputs=[msg, chatbot, session_id]
-            )
-            
-            clear.click(
-                clear_chat,
-                inputs=[chatbot, session_id],
-                outputs=[chatbot, session_id]
-            )
-    
-    gr.Markdown("## How to use")
-    gr.Markdown("""
-    1. Upload one or more PDF files using the upload section
-    2. Click "Process PDFs" to load them into the system
-    3. Start chatting with your documents in the chat section
-    4. Click "Clear chat" to start a new conversation
-    """)
-
-# Launch the app
+
+            with gr.Column(scale=3):
+                # Chat section
+                session_id = gr.State("")
+                chatbot = gr.Chatbot(label="Chat with your PDFs")  # Enable streaming
+
+                with gr.Row():
+                    msg = gr.Textbox(
+                        label="Your message",
+                        placeholder="Ask something about your PDFs...",
+                        scale=9
+                    )
+                    submit = gr.Button("Send", scale=1)
+
+                clear = gr.Button("Clear chat")
+
+                # Connect the chat components
+                submit.click(
+                    respond,
+                    inputs=[msg, chatbot, session_id],
+                    outputs=[msg, chatbot, session_id]
+                )
+
+                msg.submit(
+                    respond,
+                    inputs=[msg, chatbot, session_id],
+                    outputs=[msg, chatbot, session_id]
+                )
+
+                clear.click(
+                    clear_chat,
+                    inputs=[chatbot, session_id],
+                    outputs=[chatbot, session_id]
+                )
+
+        gr.Markdown("## How to use")
+        gr.Markdown("""
+        1. Upload one or more PDF files using the upload section
+        2. Click "Process PDFs" to load them into the system
+        3. Start chatting with your documents in the chat section
+        4. Click "Clear chat" to start a new conversation
+        """)
+
+    return demo
+
+# Launch the app on its own. The API serves this UI itself only when
+# GRADIO_PATH is set (e.g. to /gradio); next to an API, run it separately
+# only with INDEX_READ_ONLY=true, so that a single process owns the index.
 if __name__ == "__main__":
-    demo.launch(server_name="0.0.0.0", server_port=7860)
+    # Initialize RAG chain with API key from environment, in the background
+    get_rag_chain = Lazy(lambda: RAGChain(api_key=os.getenv("GOOGLE_API_KEY")))
+    if config.WARMUP:
+        warm_up("RAG chain", get_rag_chain)
+    create_demo(get_rag_chain=get_rag_chain).launch(server_name="0.0.0.0", server_port=7860)
@@ -0,0 +1,12 @@
+import os
+
+# Keep the tests independent of local settings and state on disk
+os.environ.update({
+    "ANSWER_CACHE_SIZE": "0",
+    "EMBEDDING_CACHE_PATH": "",
+    "SESSION_DB_PATH": "",
+    "GRADIO_PATH": "",
+    "RUN_TELEGRAM_BOT": "false",
+    "WARMUP": "false",
+    "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY") or "placeholder",
+})
@@ -0,0 +1,136 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.bot.admission import (
+    PRIORITY_BATCH,
+    AdmissionController,
+    OverloadedError,
+    SessionBusyError,
+)
+
+def assert_idle(controller: AdmissionController) -> None:
+    stats = controller.stats()
+    assert (stats["active"], stats["queued"]) == (0, 0)
+    assert not controller._sessions
+
+def test_admits_up_to_the_limit_and_releases():
+    controller = AdmissionController(max_concurrent=2, max_per_session=2, max_queue=0)
+    first = controller.acquire("a")
+    second = controller.acquire("b")
+    with pytest.raises(OverloadedError) as error:
+        controller.acquire("c")
+    assert error.value.retry_after >= 1
+    controller.release(first)
+    controller.release(second)
+    assert_idle(controller)
+    assert controller.stats()["admitted"] == 2 and controller.stats()["rejected"] == 1
+
+def test_session_limit():
+    controller = AdmissionController(max_concurrent=10, max_per_session=1)
+    with controller.admit("a"):
+        with pytest.raises(SessionBusyError):
+            controller.acquire("a")
+        with controller.admit("b"):
+            pass
+    assert_idle(controller)
+
+def test_context_manager_releases_on_error():
+    controller = AdmissionController(max_concurrent=1)
+    with pytest.raises(ValueError):
+        with controller.admit("a"):
+            raise ValueError("failed")
+    assert_idle(controller)
+
+    async def fail():
+        async with controller.aadmit("a"):
+            raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        asyncio.run(fail())
+    assert_idle(controller)
+
+def test_queued_request_starts_when_a_slot_frees():
+    controller = AdmissionController(max_concurrent=1, max_wait=5.0)
+    ticket = controller.acquire("a")
+    started = threading.Event()
+
+    def wait() -> None:
+        with controller.admit("b"):
+            started.set()
+
+    thread = threading.Thread(target=wait)
+    thread.start()
+    time.sleep(0.05)
+    assert controller.stats()["queued"] == 1 and not started.is_set()
+    controller.release(ticket)
+    thread.join(2)
+    assert started.is_set()
+    assert_idle(controller)
+
+def test_queued_request_gives_up_at_its_deadline():
+    controller = AdmissionController(max_concurrent=1)
+    ticket = controller.acquire("a")
+    with pytest.raises(OverloadedError):
+        controller.acquire("b", max_wait=0.05)
+    assert controller.stats()["shed"] == 1
+    controller.release(ticket)
+    assert_idle(controller)
+
+def test_cancelled_waiter_leaves_the_queue():
+    controller = AdmissionController(max_concurrent=1, max_wait=5.0)
+
+    async def run():
+        ticket = await controller.aacquire("a")
+        waiting = asyncio.ensure_future(controller.aacquire("b"))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        controller.release(ticket)
+
+    asyncio.run(run())
+    assert_idle(controller)
+
+def test_interactive_requests_are_admitted_before_batch_ones():
+    controller = AdmissionController(max_concurrent=1, max_wait=5.0)
+    order = []
+
+    async def request(name: str, priority: int) -> None:
+        async with controller.aadmit(name, priority):
+            order.append(name)
+
+    async def run():
+        ticket = await controller.aacquire("holder")
+        tasks = [asyncio.ensure_future(request("batch", PRIORITY_BATCH))]
+        await asyncio.sleep(0.01)
+        tasks.append(asyncio.ensure_future(request("interactive", 0)))
+        await asyncio.sleep(0.01)
+        controller.release(ticket)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["interactive", "batch"]
+    assert_idle(controller)
+
+def test_full_queue_sheds_a_lower_priority_request():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, max_wait=5.0)
+
+    async def run():
+        ticket = await controller.aacquire("holder")
+        batch = asyncio.ensure_future(controller.aacquire("batch", PRIORITY_BATCH))
+        await asyncio.sleep(0.01)
+        interactive = asyncio.ensure_future(controller.aacquire("interactive"))
+        with pytest.raises(OverloadedError):
+            await batch
+        # A second interactive request finds the queue full of its own priority
+        with pytest.raises(OverloadedError):
+            await controller.aacquire("other")
+        controller.release(ticket)
+        controller.release(await interactive)
+
+    asyncio.run(run())
+    assert controller.stats()["shed"] == 1
+    assert_idle(controller)
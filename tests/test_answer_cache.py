@@ -0,0 +1,61 @@
+import pytest
+
+from app.bot import answer_cache
+from app.bot.answer_cache import AnswerCache
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "monotonic", lambda: now[0])
+    return now
+
+def make_cache(**kwargs) -> AnswerCache:
+    cache = AnswerCache(**kwargs)
+    cache.set_corpus_version("v1")
+    return cache
+
+def test_similar_question_hits():
+    cache = make_cache(threshold=0.9)
+    cache.store([1.0, 0.0], "question", "answer", "v1", sources=[{"document": "a.pdf"}])
+    assert cache.lookup([0.99, 0.05]) == ("answer", [{"document": "a.pdf"}])
+    assert cache.lookup([0.0, 1.0]) is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "entries": 1}
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = make_cache(ttl=60)
+    cache.store([1.0, 0.0], "question", "answer", "v1")
+    clock[0] += 59
+    assert cache.lookup([1.0, 0.0]) is not None
+    clock[0] += 2
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.stats()["entries"] == 0
+
+def test_new_corpus_version_drops_every_entry():
+    cache = make_cache()
+    cache.store([1.0, 0.0], "question", "answer", "v1")
+    cache.set_corpus_version("v2")
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.stats()["entries"] == 0
+
+def test_answer_for_an_outdated_corpus_is_not_stored():
+    cache = make_cache()
+    # Generated while the corpus changed underneath the question
+    cache.set_corpus_version("v2")
+    cache.store([1.0, 0.0], "question", "answer", "v1")
+    assert cache.lookup([1.0, 0.0]) is None
+
+def test_least_recently_used_entries_are_evicted():
+    cache = make_cache(max_entries=2)
+    cache.store([1.0, 0.0, 0.0], "first", "1", "v1")
+    cache.store([0.0, 1.0, 0.0], "second", "2", "v1")
+    assert cache.lookup([1.0, 0.0, 0.0])[0] == "1"
+    cache.store([0.0, 0.0, 1.0], "third", "3", "v1")
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+    assert cache.lookup([1.0, 0.0, 0.0])[0] == "1"
+    assert cache.lookup([0.0, 0.0, 1.0])[0] == "3"
+
+def test_disabled_cache_stores_nothing():
+    cache = make_cache(max_entries=0)
+    assert not cache.enabled
+    cache.store([1.0, 0.0], "question", "answer", "v1")
+    assert cache.lookup([1.0, 0.0]) is None
@@ -0,0 +1,59 @@
+from app.bot.bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+
+def make_index(**kwargs) -> BM25Index:
+    index = BM25Index(**kwargs)
+    index.add("pump", "The pump reports error E-1203 when the pressure drops")
+    index.add("valve", "Replace the valve XJ_200 as described in clause 4.2.1")
+    index.add("filter", "Clean the filter every month to keep the pressure stable")
+    return index
+
+def test_tokenize_keeps_identifiers_and_drops_stopwords():
+    assert tokenize("The error E-1203 is in clause 4.2.1 of XJ_200") == ["error", "e-1203", "clause", "4.2.1", "xj_200"]
+
+def test_search_ranks_matching_chunks_first():
+    index = make_index()
+    assert [chunk_id for chunk_id, _ in index.search("error E-1203")] == ["pump"]
+    assert {chunk_id for chunk_id, _ in index.search("pressure", k=4)} == {"filter", "pump"}
+    assert index.search("the") == []
+    assert index.search("unknown words") == []
+
+def test_search_respects_k():
+    index = make_index()
+    assert len(index.search("pump valve filter", k=2)) == 2
+
+def test_add_replaces_and_remove_forgets():
+    index = make_index()
+    index.add("pump", "A completely different text about motors")
+    assert index.search("E-1203") == []
+    assert [chunk_id for chunk_id, _ in index.search("motors")] == ["pump"]
+
+    index.remove(["pump", "missing"])
+    assert len(index) == 2
+    assert index.search("motors") == []
+    assert "motors" not in index.postings
+    assert index.total_length == sum(index.lengths.values())
+
+    index.remove(["valve", "filter"])
+    assert len(index) == 0 and not index.postings
+    assert index.search("valve") == []
+
+def test_common_terms_only_score_candidates_of_rare_terms():
+    index = BM25Index(max_df=0.5)
+    for i in range(10):
+        index.add(f"common-{i}", "pressure reading")
+    index.add("rare", "pressure valve")
+    # "pressure" is in every chunk, so only the chunk with "valve" is a candidate
+    results = index.search("pressure valve", k=20)
+    assert [chunk_id for chunk_id, _ in results] == ["rare"]
+    assert results[0][1] > index.search("valve")[0][1]
+    # A query of common terms only still finds chunks
+    assert len(index.search("pressure", k=20)) == 11
+
+def test_score_matches_search():
+    index = make_index()
+    (chunk_id, score), = index.search("valve clause", k=1)
+    assert chunk_id == "valve"
+    assert abs(index.score("valve clause", "Replace the valve XJ_200 as described in clause 4.2.1") - score) < 1e-9
+
+def test_reciprocal_rank_fusion_prefers_items_ranked_high_everywhere():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["b", "a"], ["b"]]) == ["b", "a", "c"]
@@ -0,0 +1,60 @@
+import gc
+import asyncio
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.api import routes
+
+class FakeChain:
+    def __init__(self, error: Exception = None):
+        self.error = error
+
+    async def aquery_stream(self, message, session_id, timer=None, mode=None, sources=None):
+        yield "an "
+        if self.error is not None:
+            raise self.error
+        yield "answer"
+
+@pytest.fixture
+def use_chain(monkeypatch):
+    def use(chain: FakeChain) -> None:
+        @asynccontextmanager
+        async def open_collection(name):
+            yield chain
+
+        monkeypatch.setattr(routes, "open_collection", open_collection)
+    return use
+
+app = FastAPI()
+app.include_router(routes.router)
+
+async def post_stream(message: str) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        return await client.post("/api/chat/stream", json={"message": message, "mode": "fast"})
+
+def test_stream_releases_its_slot(use_chain):
+    use_chain(FakeChain())
+    response = asyncio.run(post_stream("question"))
+    assert '"token": "answer"' in response.text and "event: done" in response.text
+    assert routes.admission.stats()["active"] == 0
+
+def test_failing_stream_ends_with_an_error_event_and_releases_its_slot(use_chain):
+    use_chain(FakeChain(RuntimeError("model failed")))
+    response = asyncio.run(post_stream("question"))
+    assert response.text.rstrip().endswith('event: error\ndata: {"detail": "model failed"}')
+    assert routes.admission.stats()["active"] == 0
+
+def test_discarded_response_releases_its_slot(use_chain):
+    use_chain(FakeChain())
+
+    async def run():
+        response = await routes.chat_stream(routes.ChatRequest(message="question", mode="fast"))
+        assert routes.admission.stats()["active"] == 1
+        del response
+        gc.collect()
+
+    asyncio.run(run())
+    assert routes.admission.stats()["active"] == 0
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import defaultdict
+
+from app.bot.chat_workers import ChatWorkerPool
+
+def wait_until(condition, timeout: float = 2.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+def test_messages_of_a_chat_are_handled_in_order_one_at_a_time():
+    handled = defaultdict(list)
+    running = defaultdict(int)
+    overlaps = []
+    lock = threading.Lock()
+
+    def handler(chat, item):
+        with lock:
+            running[chat] += 1
+            if running[chat] > 1:
+                overlaps.append(chat)
+        time.sleep(0.002)
+        with lock:
+            running[chat] -= 1
+            handled[chat].append(item)
+
+    pool = ChatWorkerPool(handler, workers=4, max_pending=100, max_pending_per_chat=20)
+    pool.start()
+    try:
+        for i in range(10):
+            for chat in ("a", "b", "c"):
+                assert pool.submit(chat, i)
+        assert wait_until(lambda: sum(map(len, handled.values())) == 30)
+    finally:
+        pool.stop(timeout=2)
+    assert handled == {chat: list(range(10)) for chat in ("a", "b", "c")}
+    assert not overlaps
+    assert pool.stats() == {"pending": 0, "chats": 0, "rejected": 0}
+
+def test_chats_are_handled_concurrently():
+    release = threading.Event()
+    started = []
+
+    def handler(chat, item):
+        started.append(chat)
+        release.wait(2)
+
+    pool = ChatWorkerPool(handler, workers=2)
+    pool.start()
+    try:
+        pool.submit("a", 1)
+        pool.submit("b", 1)
+        assert wait_until(lambda: len(started) == 2)
+    finally:
+        release.set()
+        pool.stop(timeout=2)
+
+def test_back_pressure_rejects_beyond_the_limits():
+    release = threading.Event()
+    pool = ChatWorkerPool(lambda chat, item: release.wait(2), workers=1, max_pending=3, max_pending_per_chat=2)
+    pool.start()
+    try:
+        assert pool.submit("a", 0)
+        # The worker takes the first item, so it no longer counts as pending
+        assert wait_until(lambda: pool.stats()["pending"] == 0)
+        assert pool.submit("a", 1) and pool.submit("a", 2)
+        assert not pool.submit("a", 3)
+        assert pool.submit("b", 0)
+        # Three items are waiting in total
+        assert not pool.submit("c", 0)
+        assert pool.stats() == {"pending": 3, "chats": 2, "rejected": 2}
+    finally:
+        release.set()
+        assert wait_until(lambda: pool.stats()["pending"] == 0)
+        pool.stop(timeout=2)
+
+def test_handler_errors_do_not_stop_the_chat():
+    handled = []
+
+    def handler(chat, item):
+        if item == 0:
+            raise RuntimeError("failed")
+        handled.append(item)
+
+    pool = ChatWorkerPool(handler, workers=1)
+    pool.start()
+    try:
+        pool.submit("a", 0)
+        pool.submit("a", 1)
+        assert wait_until(lambda: handled == [1])
+    finally:
+        pool.stop(timeout=2)
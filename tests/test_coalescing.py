@@ -0,0 +1,54 @@
+import asyncio
+from typing import Any, List
+
+import pytest
+
+from app.bot.rag_chain import RAGChain
+from app.utils.metrics import COALESCED_QUESTIONS
+from benchmarks.corpus import make_corpus
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+
+class CountingChatModel(FakeChatModel):
+    calls: List[Any] = []
+
+    async def _agenerate(self, messages, *args, **kwargs):
+        self.calls.append(messages)
+        return await super()._agenerate(messages, *args, **kwargs)
+
+@pytest.fixture
+def chain(tmp_path):
+    chain = RAGChain(
+        index_dir="",
+        llm=CountingChatModel(first_token_latency=0.05, token_latency=0.0, calls=[]),
+        embedding=FakeEmbeddings(size=32, request_latency=0.0, text_latency=0.0),
+    )
+    chain.load_pdfs(make_corpus(str(tmp_path), 2, pages=2))
+    yield chain
+    chain.close()
+
+def coalesced() -> float:
+    return COALESCED_QUESTIONS.labels(mode="fast")._value.get()
+
+async def ask_twice(chain: RAGChain, question: str, sessions) -> List[str]:
+    return await asyncio.gather(*(chain.aquery(question, session, mode="fast") for session in sessions))
+
+def test_identical_questions_share_one_answer(chain):
+    before = coalesced()
+    answers = asyncio.run(ask_twice(chain, "What is the  maintenance schedule?", ["a", "b"]))
+
+    assert answers[0] == answers[1]
+    assert len(chain.llm.calls) == 1
+    assert coalesced() == before + 1
+
+def test_questions_with_history_are_answered_per_session(chain):
+    for session in ("a", "b"):
+        history = chain.session_store.get(session)
+        history.add_user_message(f"Earlier question of {session}")
+        history.add_ai_message(f"Earlier answer to {session}")
+    before = coalesced()
+
+    asyncio.run(ask_twice(chain, "And the warranty?", ["a", "b"]))
+
+    assert coalesced() == before
+    # Each session contextualizes its question and gets its own answer
+    assert len(chain.llm.calls) == 4
@@ -0,0 +1,86 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.api import routes
+from app.bot.collection_manager import CollectionManager
+
+class FakeChain:
+    def __init__(self, name: str, size: int = 0):
+        self.name = name
+        self.size = size
+        self.closed = False
+
+    def memory_estimate(self) -> int:
+        return self.size
+
+    def close(self) -> None:
+        self.closed = True
+
+def make_manager(sizes=None, **kwargs) -> CollectionManager:
+    sizes = sizes or {}
+    return CollectionManager(lambda name: FakeChain(name, sizes.get(name, 0)), **kwargs)
+
+def test_least_recently_used_collection_is_unloaded_first():
+    manager = make_manager(max_loaded=2)
+    a = manager.get("a")
+    manager.get("b")
+    manager.get("a")
+    manager.get("c")
+
+    assert manager.loaded() == ["a", "c"]
+    assert manager.stats()["evictions"] == 1
+    assert not a.closed
+
+    manager.get("b")
+    assert manager.loaded() == ["c", "b"]
+    assert a.closed
+
+def test_collections_are_unloaded_beyond_the_memory_budget():
+    manager = make_manager({"a": 60, "b": 30, "c": 30}, max_loaded=10, memory_budget=100)
+    manager.get("a")
+    manager.get("b")
+    assert manager.loaded() == ["a", "b"]
+
+    manager.get("c")
+    assert manager.loaded() == ["b", "c"]
+
+def test_resident_collection_is_never_unloaded():
+    manager = make_manager(max_loaded=1, resident=["default"])
+    manager.get("default")
+    manager.get("a")
+    manager.get("b")
+    assert manager.loaded() == ["default", "b"]
+
+def test_collection_in_use_is_unloaded_only_after_release(monkeypatch):
+    manager = make_manager(max_loaded=1)
+    monkeypatch.setattr(routes, "collection_manager", manager)
+
+    async def run():
+        async with routes.open_collection("a") as chain:
+            manager.get("b")
+            assert "a" in manager.loaded() and not chain.closed
+        return chain
+
+    chain = asyncio.run(run())
+    assert manager.loaded() == ["b"]
+    assert chain.closed
+
+@pytest.mark.parametrize("name", ["../x", ".hidden", "a/b", "x" * 65])
+def test_invalid_collection_name_is_rejected(name):
+    with pytest.raises(ValueError):
+        make_manager().get(name)
+
+def test_route_rejects_invalid_collection_name():
+    app = FastAPI()
+    app.include_router(routes.router)
+
+    async def get():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.get("/api/pdfs", params={"collection": "../x"})
+
+    response = asyncio.run(get())
+    assert response.status_code == 400
+    assert "Invalid collection name" in response.json()["detail"]
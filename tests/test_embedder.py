@@ -0,0 +1,78 @@
+import pytest
+
+from app.bot.embedder import BatchEmbedder, is_rate_limit_error
+from benchmarks.fakes import FakeEmbeddings, FakeRateLimitError, FakeServerError, ThrottledEmbeddings
+
+def make_embedder(embedding, **kwargs) -> BatchEmbedder:
+    kwargs.setdefault("initial_backoff", 0.001)
+    kwargs.setdefault("max_backoff", 0.01)
+    return BatchEmbedder(embedding, **kwargs)
+
+TEXTS = [f"text {i}" for i in range(50)]
+
+def test_vectors_are_returned_in_input_order():
+    embedding = ThrottledEmbeddings(size=8, request_latency=0.001)
+    embedder = make_embedder(embedding, batch_size=3, max_concurrency=4)
+    progress = []
+    vectors = embedder.embed(TEXTS, lambda done, total: progress.append((done, total)))
+    assert vectors == FakeEmbeddings(size=8, request_latency=0.0).embed_documents(TEXTS)
+    assert embedding.calls == 17
+    assert progress[-1] == (50, 50) and len(progress) == 17
+
+def test_failed_batches_are_retried():
+    embedding = ThrottledEmbeddings(size=8, request_latency=0.001, failures=3)
+    embedder = make_embedder(embedding, batch_size=10, max_concurrency=1)
+    assert len(embedder.embed(TEXTS)) == 50
+    assert (embedder.retries, embedder.rate_limited) == (3, 0)
+    # Failed attempts are rejected before any texts are embedded
+    assert embedding.calls == 5
+
+def test_gives_up_after_max_retries():
+    embedding = ThrottledEmbeddings(size=8, request_latency=0.0, failures=10)
+    embedder = make_embedder(embedding, max_retries=3)
+    with pytest.raises(FakeServerError):
+        embedder.embed(["text"])
+    assert (embedding.failed, embedder.retries) == (3, 2)
+
+def test_concurrency_adapts_to_throttling():
+    embedding = ThrottledEmbeddings(size=8, request_latency=0.01, max_concurrent=2)
+    embedder = make_embedder(embedding, batch_size=2, max_concurrency=8, max_retries=20)
+    vectors = embedder.embed(TEXTS)
+    assert vectors == FakeEmbeddings(size=8, request_latency=0.0).embed_documents(TEXTS)
+    assert embedding.throttled > 0
+    assert embedder.rate_limited == embedding.throttled
+    assert embedding.peak_in_flight <= 2
+
+def test_limit_halves_on_throttling_and_grows_back_by_one():
+    embedder = make_embedder(FakeEmbeddings(size=8), max_concurrency=8)
+    limits = []
+    for throttled in (True, True, True, True, False, False):
+        embedder._acquire()
+        embedder._release(throttled)
+        limits.append(embedder._limit)
+    assert limits == [4, 2, 1, 1, 2, 3]
+
+class ResourceExhausted(Exception):
+    """Named like the Google API client's rate-limit error."""
+
+class Response:
+    status_code = 429
+
+class HTTPError(Exception):
+    response = Response()
+
+def test_rate_limit_errors_are_recognised_by_status_and_type():
+    assert is_rate_limit_error(FakeRateLimitError())
+    assert is_rate_limit_error(ResourceExhausted("quota"))
+    assert is_rate_limit_error(HTTPError())
+    try:
+        try:
+            raise ResourceExhausted("quota")
+        except ResourceExhausted as e:
+            raise RuntimeError("Error embedding content") from e
+    except RuntimeError as wrapped:
+        assert is_rate_limit_error(wrapped)
+
+def test_other_errors_are_not_rate_limits():
+    assert not is_rate_limit_error(FakeServerError())
+    assert not is_rate_limit_error(ValueError("Chunk 429 of the document is empty"))
@@ -0,0 +1,78 @@
+import sqlite3
+
+from app.bot.embedding_cache import EmbeddingCache
+
+def vector(i):
+    return [float(i), 0.0, 1.0]
+
+def disk_keys(path):
+    with sqlite3.connect(path) as db:
+        return {key for key, in db.execute("SELECT key FROM embeddings")}
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    EmbeddingCache(path).put_many({"a": vector(1)})
+
+    cache = EmbeddingCache(path)
+    assert cache.get_many(["a", "b"]) == {"a": vector(1)}
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.stats()["disk_entries"] == 1
+
+def test_disk_tier_drops_least_recently_used(tmp_path, monkeypatch):
+    path = str(tmp_path / "embeddings.sqlite")
+    clock = iter(range(1000))
+    monkeypatch.setattr("app.bot.embedding_cache.time.time", lambda: next(clock))
+    monkeypatch.setattr(EmbeddingCache, "TOUCH_BATCH_SIZE", 1)
+    cache = EmbeddingCache(path, max_memory_entries=0, max_disk_entries=10)
+
+    for i in range(10):
+        cache.put_many({f"k{i}": vector(i)})
+    # Reading the two oldest keys makes them the most recently used
+    assert set(cache.get_many(["k0", "k1"])) == {"k0", "k1"}
+
+    cache.put_many({"k10": vector(10)})
+
+    # Pruning leaves 90% of the limit: the two least recently used go
+    assert disk_keys(path) == {"k0", "k1", "k4", "k5", "k6", "k7", "k8", "k9", "k10"}
+    assert cache.stats()["disk_entries"] == 9
+    assert cache.stats()["pruned"] == 2
+
+def test_uses_are_recorded_before_pruning(tmp_path, monkeypatch):
+    path = str(tmp_path / "embeddings.sqlite")
+    clock = iter(range(1000))
+    monkeypatch.setattr("app.bot.embedding_cache.time.time", lambda: next(clock))
+    cache = EmbeddingCache(path, max_memory_entries=0, max_disk_entries=4)
+
+    for i in range(4):
+        cache.put_many({f"k{i}": vector(i)})
+    cache.get_many(["k0"])
+    cache.put_many({"k4": vector(4)})
+
+    assert "k0" in disk_keys(path)
+    assert "k1" not in disk_keys(path)
+
+def test_replaced_rows_do_not_count_twice(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    cache = EmbeddingCache(path, max_disk_entries=2)
+
+    for _ in range(5):
+        cache.put_many({"a": vector(1), "b": vector(2)})
+
+    assert disk_keys(path) == {"a", "b"}
+    assert cache.stats()["pruned"] == 0
+
+def test_files_without_last_used_are_upgraded(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    with sqlite3.connect(path) as db:
+        db.execute("CREATE TABLE embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        db.executemany(
+            "INSERT INTO embeddings VALUES (?, ?)",
+            [(f"old{i}", bytes(12)) for i in range(3)],
+        )
+
+    cache = EmbeddingCache(path, max_disk_entries=3)
+    cache.put_many({"new": vector(1)})
+
+    # The rows written before aging existed are the first to go
+    assert "new" in disk_keys(path)
+    assert len(disk_keys(path)) == 2
@@ -0,0 +1,33 @@
+import pytest
+
+from app.bot.rag_chain import StageTimeoutError
+from gradio_app import create_demo
+
+class FakeChain:
+    def __init__(self, error: Exception = None):
+        self.error = error
+
+    def query_stream(self, message, session_id):
+        yield "partial "
+        if self.error is not None:
+            raise self.error
+        yield "answer"
+
+def respond(chain: FakeChain):
+    demo = create_demo(rag_chain=chain, pdf_processor=object())
+    functions = demo.fns.values() if isinstance(demo.fns, dict) else demo.fns
+    return next(function.fn for function in functions if function.fn.__name__ == "respond")
+
+def last_reply(chain: FakeChain) -> str:
+    *_, (_, history, _) = respond(chain)("question", [], "session")
+    return history[-1][1]
+
+def test_answer_is_streamed_into_the_history():
+    assert last_reply(FakeChain()) == "partial answer"
+
+@pytest.mark.parametrize("error, reply", [
+    (StageTimeoutError("answer", 60), "The answer took too long, please try again."),
+    (RuntimeError("Google API key is required"), "Sorry, something went wrong while answering your question."),
+])
+def test_failed_answer_shows_a_message(error, reply):
+    assert last_reply(FakeChain(error)) == reply
@@ -0,0 +1,116 @@
+import os
+
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+
+from app import config
+from app.bot.index_store import IndexStore
+from app.bot.rag_chain import RAGChain
+from benchmarks.corpus import make_corpus
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+
+DIMENSION = 16
+
+def make_store(count: int) -> FAISS:
+    rng = np.random.default_rng(count)
+    texts = [f"chunk {i}" for i in range(count)]
+    vectors = rng.standard_normal((count, DIMENSION)).astype(np.float32)
+    return FAISS.from_embeddings(list(zip(texts, vectors.tolist())), FakeEmbeddings(size=DIMENSION), ids=texts)
+
+def generations(index_dir) -> list:
+    return sorted(name for name in os.listdir(index_dir) if name.startswith("gen-"))
+
+def make_chain(index_dir: str, read_only: bool = False) -> RAGChain:
+    return RAGChain(
+        index_dir=index_dir,
+        read_only=read_only,
+        llm=FakeChatModel(),
+        embedding=FakeEmbeddings(size=DIMENSION, request_latency=0.0, text_latency=0.0),
+    )
+
+@pytest.mark.parametrize("mmap", [False, True])
+def test_save_and_load(tmp_path, mmap):
+    store = IndexStore(str(tmp_path))
+    assert store.load(FakeEmbeddings(size=DIMENSION)) is None
+
+    generation = store.save(make_store(10), {"documents": {"a": {"chunks": ["chunk 0"]}}}, extras={"lexical": [1, 2]})
+    vectorstore, manifest = store.load(FakeEmbeddings(size=DIMENSION), mmap=mmap)
+
+    assert generation == store.current_generation() == manifest["generation"] == 1
+    assert manifest["documents"] == {"a": {"chunks": ["chunk 0"]}}
+    assert vectorstore.index.ntotal == 10
+    assert vectorstore.docstore.search("chunk 3").page_content == "chunk 3"
+    assert store.load_extra(generation, "lexical") == [1, 2]
+    assert store.load_extra(generation, "missing") is None
+
+def test_empty_index_is_saved_without_vectors(tmp_path):
+    store = IndexStore(str(tmp_path))
+    store.save(None, {"documents": {}})
+    assert store.load(FakeEmbeddings(size=DIMENSION)) == (None, {"documents": {}, "generation": 1})
+
+def test_old_generations_are_pruned(tmp_path):
+    store = IndexStore(str(tmp_path))
+    for count in range(1, 5):
+        store.save(make_store(count), {"documents": {}})
+
+    assert generations(tmp_path) == ["gen-000003", "gen-000004"]
+    assert store.load(FakeEmbeddings(size=DIMENSION))[0].index.ntotal == 4
+
+def test_crash_before_switching_current_keeps_the_previous_generation(tmp_path, monkeypatch):
+    store = IndexStore(str(tmp_path))
+    store.save(make_store(1), {"documents": {}})
+
+    replace = os.replace
+    def crash(src, dst):
+        raise OSError("crashed")
+    monkeypatch.setattr(os, "replace", crash)
+    with pytest.raises(OSError):
+        store.save(make_store(2), {"documents": {}})
+    monkeypatch.setattr(os, "replace", replace)
+
+    # The complete but unpublished generation is ignored
+    assert store.current_generation() == 1
+    assert store.load(FakeEmbeddings(size=DIMENSION))[0].index.ntotal == 1
+
+    # and replaced by the next save
+    assert store.save(make_store(3), {"documents": {}}) == 2
+    assert store.load(FakeEmbeddings(size=DIMENSION))[0].index.ntotal == 3
+
+def test_chain_reloads_its_corpus(tmp_path):
+    paths = make_corpus(str(tmp_path / "corpus"), 2, pages=2)
+    chain = make_chain(str(tmp_path / "index"))
+    chain.load_pdfs(paths)
+    removed = RAGChain.document_id(paths[0])
+    assert chain.remove_pdf(removed)
+    version = chain.corpus_version
+    chain.close()
+
+    reloaded = make_chain(str(tmp_path / "index"))
+    assert reloaded.corpus_version == version
+    assert list(reloaded.doc_chunks) == [RAGChain.document_id(paths[1])]
+    assert not any(
+        document.metadata["doc_id"] == removed
+        for document in reloaded._vector_search("maintenance schedule")
+    )
+    reloaded.close()
+
+def test_read_only_chain_follows_new_generations(tmp_path, monkeypatch):
+    # Refresh by hand rather than from the background loop
+    monkeypatch.setattr(config, "INDEX_REFRESH_INTERVAL", 3600)
+    first, second = make_corpus(str(tmp_path / "corpus"), 2, pages=2)
+    writer = make_chain(str(tmp_path / "index"))
+    writer.load_pdfs([first])
+    reader = make_chain(str(tmp_path / "index"), read_only=True)
+
+    assert list(reader.doc_chunks) == [RAGChain.document_id(first)]
+    assert not reader.refresh()
+    with pytest.raises(RuntimeError):
+        reader.load_pdfs([second])
+
+    writer.load_pdfs([second])
+    assert reader.refresh()
+    assert reader.corpus_version == writer.corpus_version
+    assert reader.vectorstore.index.ntotal == writer.vectorstore.index.ntotal
+    writer.close()
+    reader.close()
@@ -0,0 +1,18 @@
+import asyncio
+import importlib
+
+import httpx
+
+import app.main
+
+def test_app_can_be_imported_again():
+    main = importlib.reload(app.main)
+
+    async def get():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://test") as client:
+            return await client.get("/metrics")
+
+    response = asyncio.run(get())
+    assert response.status_code == 200
+    # Exposed once, by the collector of the reloaded module
+    assert response.text.count("# TYPE rag_admission_active gauge") == 1
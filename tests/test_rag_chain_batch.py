@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from app.bot.admission import AdmissionController
+from app.bot.rag_chain import RAGChain
+from benchmarks.corpus import make_corpus
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+
+@pytest.fixture(scope="module")
+def chain(tmp_path_factory):
+    paths = make_corpus(str(tmp_path_factory.mktemp("corpus")), 2, pages=2)
+    chain = RAGChain(
+        index_dir="",
+        llm=FakeChatModel(first_token_latency=0.01, token_latency=0.0),
+        embedding=FakeEmbeddings(size=32, request_latency=0.0, text_latency=0.0),
+    )
+    chain.load_pdfs(paths)
+    yield chain
+    chain.close()
+
+def human_messages(chain: RAGChain, session_id: str):
+    return [message.content for message in chain.session_store.get(session_id).messages if message.type == "human"]
+
+def test_results_are_in_order(chain):
+    messages = [f"question {i}" for i in range(6)]
+    session_ids = [f"order-{i}" for i in range(6)]
+    results = asyncio.run(chain.aquery_batch(messages, session_ids, mode="fast", concurrency=3))
+    assert [result["error"] for result in results] == [None] * 6
+    for session_id, message in zip(session_ids, messages):
+        assert human_messages(chain, session_id) == [message]
+
+def test_shared_session_is_answered_in_order(chain):
+    messages = ["first", "other", "second", "third"]
+    session_ids = ["shared", "single", "shared", "shared"]
+    results = asyncio.run(chain.aquery_batch(messages, session_ids, mode="fast", concurrency=4))
+    assert [result["error"] for result in results] == [None] * 4
+    assert human_messages(chain, "shared") == ["first", "second", "third"]
+    assert human_messages(chain, "single") == ["other"]
+
+def test_shared_session_takes_one_admission_slot(chain):
+    admission = AdmissionController(max_concurrent=2, max_per_session=1, max_queue=10, max_wait=5.0)
+    messages = [f"admitted {i}" for i in range(4)]
+    results = asyncio.run(chain.aquery_batch(messages, ["admitted"] * 4, mode="fast", admission=admission))
+    assert [result["error"] for result in results] == [None] * 4
+    assert human_messages(chain, "admitted") == messages
+    stats = admission.stats()
+    assert (stats["admitted"], stats["rejected"], stats["active"]) == (1, 0, 0)
+
+def test_rejected_session_fails_all_its_questions(chain):
+    admission = AdmissionController(max_concurrent=1, max_per_session=1, max_queue=0, max_wait=5.0)
+
+    async def run():
+        # Hold the only slot, so the batch cannot be admitted
+        async with admission.aadmit("interactive"):
+            return await chain.aquery_batch(["a", "b"], ["rejected", "rejected"], mode="fast", admission=admission)
+
+    results = asyncio.run(run())
+    assert all(result["response"] is None and result["error"] for result in results)
+    assert human_messages(chain, "rejected") == []
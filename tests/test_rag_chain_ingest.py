@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from app.bot import ingestion
+from app.bot.rag_chain import RAGChain
+from benchmarks.corpus import make_corpus, write_pdf
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+
+def make_chain(index_dir: str) -> RAGChain:
+    return RAGChain(
+        index_dir=index_dir,
+        llm=FakeChatModel(),
+        embedding=FakeEmbeddings(size=16, request_latency=0.0, text_latency=0.0),
+    )
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """Paths handed to the PDF parser."""
+    paths = []
+    stream_pdf_splits = ingestion.stream_pdf_splits
+
+    def recording(pdf_paths, *args, **kwargs):
+        paths.extend(pdf_paths)
+        return stream_pdf_splits(pdf_paths, *args, **kwargs)
+
+    monkeypatch.setattr(ingestion, "stream_pdf_splits", recording)
+    return paths
+
+def test_document_without_text_is_not_parsed_again(tmp_path, parsed):
+    paths = make_corpus(str(tmp_path / "corpus"), 1, pages=2)
+    scan = str(tmp_path / "corpus" / "scan.pdf")
+    write_pdf(scan, [""])
+    chain = make_chain(str(tmp_path / "index"))
+
+    assert chain.load_pdfs(paths + [scan]) == {}
+    assert chain.doc_chunks[RAGChain.document_id(scan)] == []
+
+    parsed.clear()
+    assert chain.sync_pdfs(paths + [scan]) == {}
+    assert parsed == []
+    chain.close()
+
+    # The empty document is persisted with the others
+    reloaded = make_chain(str(tmp_path / "index"))
+    reloaded.sync_pdfs(paths + [scan])
+    assert parsed == []
+    reloaded.close()
+
+def test_interrupted_ingestion_keeps_completed_documents(tmp_path):
+    paths = make_corpus(str(tmp_path / "corpus"), 2, pages=2)
+    chain = make_chain(str(tmp_path / "index"))
+
+    def interrupt(done, total):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        chain.load_pdfs(paths, progress_callback=interrupt)
+    first, second = (RAGChain.document_id(path) for path in paths)
+    assert first in chain.doc_chunks and second not in chain.doc_chunks
+    chain.close()
+
+    reloaded = make_chain(str(tmp_path / "index"))
+    assert list(reloaded.doc_chunks) == [first]
+    assert reloaded.vectorstore.index.ntotal == len(reloaded.doc_chunks[first])
+    reloaded.close()
@@ -0,0 +1,61 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.bot.session_store import SessionStore, window_history
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    stores = []
+
+    def make(**kwargs) -> SessionStore:
+        path = str(tmp_path / "sessions.db") if request.param == "sqlite" else None
+        store = SessionStore(path=path, **kwargs)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        store.close()
+
+def add_turns(history, turns: int) -> None:
+    for i in range(turns):
+        history.add_user_message(f"question {i}")
+        history.add_ai_message(f"answer {i}")
+
+def test_history_is_trimmed_to_the_most_recent_messages(make_store):
+    store = make_store(max_loaded_messages=4, max_messages=6)
+    add_turns(store.get("a"), 10)
+    assert [message.content for message in store.get("a").messages][-4:] == [
+        "question 8", "answer 8", "question 9", "answer 9",
+    ]
+    if store._db is not None:
+        assert store._execute("SELECT COUNT(*) FROM messages WHERE session_id = 'a'")[0][0] == 6
+    else:
+        assert len(store.get("a").messages) == 6
+
+def test_trimming_leaves_other_sessions_alone(make_store):
+    store = make_store(max_loaded_messages=2, max_messages=2)
+    add_turns(store.get("a"), 1)
+    add_turns(store.get("b"), 5)
+    assert [message.content for message in store.get("a").messages] == ["question 0", "answer 0"]
+    assert [message.content for message in store.get("b").messages] == ["question 4", "answer 4"]
+
+def test_no_limit_keeps_every_message(make_store):
+    store = make_store(max_loaded_messages=100)
+    add_turns(store.get("a"), 20)
+    assert len(store.get("a").messages) == 40
+
+def test_clear_and_eviction(make_store):
+    store = make_store(max_sessions=2)
+    for session_id in ("a", "b", "c"):
+        add_turns(store.get(session_id), 1)
+    store.clear("c")
+    assert store.get("c").messages == []
+    if store._db is None:
+        # The least recently used session was evicted
+        assert store.get("a").messages == []
+
+def test_window_starts_on_a_human_message():
+    messages = [HumanMessage("q1"), AIMessage("a1"), HumanMessage("q2"), AIMessage("a2")]
+    assert [message.content for message in window_history(messages, 3, 1000)] == ["q2", "a2"]
+    assert [message.content for message in window_history(messages, 10, 1000)] == ["q1", "a1", "q2", "a2"]
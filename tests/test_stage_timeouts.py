@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+from app.bot.answer_cache import AnswerCache
+from app.bot.rag_chain import RAGChain, StageTimeoutError
+from benchmarks.corpus import make_corpus
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+
+@pytest.fixture
+def chain(tmp_path):
+    chain = RAGChain(
+        index_dir="",
+        llm=FakeChatModel(first_token_latency=0.01, token_latency=0.0),
+        embedding=FakeEmbeddings(size=32, request_latency=0.0, text_latency=0.0),
+    )
+    chain.load_pdfs(make_corpus(str(tmp_path), 1, pages=2))
+    yield chain
+    chain.close()
+
+def test_streamed_answer_within_the_limit(chain):
+    chain.answer_timeout = 5
+    tokens = list(chain.query_stream("what is in the report", "fast-stream", mode="fast"))
+    assert len(tokens) > 1
+    assert chain.query("what is in the report", "fast-query", mode="fast") == "".join(tokens)
+
+def test_streamed_answer_stops_waiting_at_the_deadline(chain):
+    chain.llm.first_token_latency = 2.0
+    chain.answer_timeout = 0.2
+    start = time.monotonic()
+    with pytest.raises(StageTimeoutError):
+        list(chain.query_stream("what is in the report", "slow-stream", mode="fast"))
+    # The first token alone would take two seconds
+    assert time.monotonic() - start < 1.0
+
+def test_slow_query_generation_falls_back_to_the_question(chain):
+    chain.generate_queries_timeout = 0.1
+    chain.llm.first_token_latency = 0.5
+    chain.answer_timeout = 5
+    sources = []
+    assert chain.query("what is in the report", "multi", mode="multi_query", sources=sources)
+    assert sources
+
+def test_slow_question_embedding_is_bounded_by_the_search_timeout(chain):
+    chain.answer_cache = AnswerCache(max_entries=10)
+    chain.answer_cache.set_corpus_version(chain.corpus_version)
+    chain.vector_search_timeout = 0.2
+    chain.answer_timeout = 5
+    chain.embedding.embedding.request_latency = 2.0
+    start = time.monotonic()
+    # The answer comes from the lexical index alone
+    assert "".join(chain.query_stream("what is in the report", "slow-embedding", mode="fast"))
+    assert time.monotonic() - start < 1.5
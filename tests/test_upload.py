@@ -0,0 +1,64 @@
+import io
+import os
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, UploadFile
+
+from app.api import routes
+from app.utils.pdf_processor import FileTooLargeError, PDFProcessor
+
+app = FastAPI()
+app.include_router(routes.router)
+
+def stored_pdfs(directory) -> list:
+    return sorted(name for name in os.listdir(directory) if name.endswith(".pdf"))
+
+def test_upload_with_a_file_too_large_keeps_none(tmp_path, monkeypatch):
+    processor = PDFProcessor(str(tmp_path), max_file_size=100)
+    monkeypatch.setattr(routes, "get_pdf_processor", lambda name: processor)
+    submitted = []
+    monkeypatch.setattr(routes, "submit_ingestion", lambda *args: submitted.append(args))
+
+    async def upload():
+        files = [
+            ("files", ("small.pdf", b"%PDF small", "application/pdf")),
+            ("files", ("large.pdf", b"%PDF " + b"x" * 200, "application/pdf")),
+        ]
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post("/api/upload-pdfs", files=files)
+
+    response = asyncio.run(upload())
+
+    assert response.status_code == 413
+    assert "large.pdf" in response.json()["detail"]
+    assert stored_pdfs(tmp_path) == []
+    assert submitted == []
+
+def test_file_found_too_large_while_copying_removes_the_files_saved_before(tmp_path):
+    processor = PDFProcessor(str(tmp_path), max_file_size=100)
+    processor.CHUNK_SIZE = 16
+    files = [
+        UploadFile(io.BytesIO(b"%PDF small"), filename="small.pdf"),
+        UploadFile(io.BytesIO(b"%PDF " + b"x" * 200), filename="large.pdf"),
+    ]
+
+    with pytest.raises(FileTooLargeError):
+        asyncio.run(processor.save_uploaded_pdfs(files))
+
+    assert os.listdir(tmp_path) == []
+
+def test_failed_upload_keeps_files_stored_before_it(tmp_path):
+    processor = PDFProcessor(str(tmp_path), max_file_size=100)
+    asyncio.run(processor.save_uploaded_pdfs([UploadFile(io.BytesIO(b"%PDF small"), filename="small.pdf")]))
+    files = [
+        UploadFile(io.BytesIO(b"%PDF small"), filename="again.pdf"),
+        UploadFile(io.BytesIO(b"%PDF " + b"x" * 200), filename="large.pdf"),
+    ]
+
+    with pytest.raises(FileTooLargeError):
+        asyncio.run(processor.save_uploaded_pdfs(files))
+
+    # The first file was a duplicate of one stored earlier, which stays
+    assert [name.split("_", 1)[1] for name in stored_pdfs(tmp_path)] == ["small.pdf"]
@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+from langchain_community.vectorstores import FAISS
+
+from app import config
+from app.bot.rag_chain import RAGChain
+from app.bot.vector_index import (
+    add_vectors, delete_vectors, deleted_count, index_type, needs_compaction, rebuild_without, search,
+    search_parameters,
+)
+from benchmarks.corpus import make_corpus
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings
+
+DIMENSION = 16
+
+def vector(i: int) -> np.ndarray:
+    return np.random.default_rng(i).standard_normal(DIMENSION).astype(np.float32)
+
+def embedded(start: int, count: int):
+    texts = [f"chunk {i}" for i in range(start, start + count)]
+    return texts, np.stack([vector(i) for i in range(start, start + count)])
+
+def make_store(kind: str, count: int = 2000) -> FAISS:
+    texts, vectors = embedded(0, count)
+    store = FAISS.from_embeddings(
+        list(zip(texts, vectors.tolist())), FakeEmbeddings(size=DIMENSION), ids=texts
+    )
+    if kind != "flat":
+        store.index, store.index_to_docstore_id = rebuild_without(store, [], kind=kind)
+    return store
+
+def find(store: FAISS, text: str, k: int = 1):
+    """Search for the vector of a chunk, the way RAGChain does."""
+    query = vector(int(text.split()[1])).tolist()
+    params = search_parameters(store)
+    if params is not None:
+        documents = search(store, query, k, params)
+    else:
+        documents = store.similarity_search_by_vector(query, k=k)
+    return [document.page_content for document in documents]
+
+@pytest.fixture(autouse=True)
+def small_ivf(monkeypatch):
+    monkeypatch.setattr(config, "INDEX_IVF_NPROBE", 64)
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw", "ivf"])
+def test_delete_and_add_in_place(kind):
+    store = make_store(kind)
+    index = store.index
+    assert find(store, "chunk 5") == ["chunk 5"]
+
+    delete_vectors(store, ["chunk 5", "chunk 6"])
+    if kind != "flat":
+        # The index was updated in place, not rebuilt
+        assert store.index is index
+    assert "chunk 5" not in find(store, "chunk 5", k=10)
+    assert find(store, "chunk 7") == ["chunk 7"]
+
+    texts, vectors = embedded(2000, 10)
+    add_vectors(store, list(zip(texts, vectors.tolist())), [{} for _ in texts], texts)
+    assert find(store, "chunk 2005") == ["chunk 2005"]
+    assert find(store, "chunk 1999") == ["chunk 1999"]
+    assert len(store.index_to_docstore_id) == (2008 if kind == "flat" else 2010)
+
+def test_ivf_removes_vectors_and_hnsw_keeps_tombstones():
+    ivf = make_store("ivf")
+    delete_vectors(ivf, ["chunk 1"])
+    assert ivf.index.ntotal == 1999 and deleted_count(ivf) == 1
+    assert search_parameters(ivf) is None
+
+    hnsw = make_store("hnsw")
+    delete_vectors(hnsw, ["chunk 1"])
+    assert hnsw.index.ntotal == 2000 and deleted_count(hnsw) == 1
+    assert search_parameters(hnsw) is not None
+
+def test_compaction_drops_tombstones(monkeypatch):
+    monkeypatch.setattr(config, "INDEX_MAX_DELETED_RATIO", 0.1)
+    store = make_store("hnsw")
+    delete_vectors(store, [f"chunk {i}" for i in range(150)])
+    assert not needs_compaction(store)
+    delete_vectors(store, [f"chunk {i}" for i in range(150, 250)])
+    assert needs_compaction(store)
+
+    store.index, store.index_to_docstore_id = rebuild_without(store, [], kind="hnsw")
+    assert store.index.ntotal == 1750 and deleted_count(store) == 0
+    assert sorted(store.index_to_docstore_id) == list(range(1750))
+    assert find(store, "chunk 300") == ["chunk 300"]
+
+def test_rebuild_uses_the_original_vectors(monkeypatch):
+    monkeypatch.setattr(config, "INDEX_PQ_BYTES", 4)
+    store = make_store("ivfpq")
+    _, vectors = embedded(0, 2000)
+    loaded = []
+
+    def load_vectors(positions):
+        loaded.append(len(positions))
+        return vectors[positions]
+
+    # Vectors read back from IVF-PQ codes are approximations
+    lossy, _ = rebuild_without(store, ["chunk 0"], kind="flat")
+    assert not np.array_equal(lossy.reconstruct(0), vectors[1])
+
+    index, _ = rebuild_without(store, ["chunk 0"], kind="flat", load_vectors=load_vectors)
+    assert sum(loaded) == 1999
+    assert np.array_equal(index.reconstruct(0), vectors[1])
+
+def test_chain_removes_documents_from_an_hnsw_index_in_place(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "INDEX_TYPE", "hnsw")
+    monkeypatch.setattr(config, "INDEX_MAX_DELETED_RATIO", 0.5)
+
+    def make_chain() -> RAGChain:
+        return RAGChain(
+            index_dir=str(tmp_path / "index"),
+            llm=FakeChatModel(),
+            embedding=FakeEmbeddings(size=DIMENSION, request_latency=0.0, text_latency=0.0),
+        )
+
+    chain = make_chain()
+    paths = make_corpus(str(tmp_path / "corpus"), 3, pages=3)
+    chain.load_pdfs(paths)
+    assert index_type(chain.vectorstore.index) == "hnsw"
+    total = chain.vectorstore.index.ntotal
+    removed_id, compacted_id, kept_id = (RAGChain.document_id(path) for path in paths)
+    removed = set(chain.doc_chunks[removed_id])
+    texts = [chain.vectorstore.docstore.search(chunk_id).page_content for chunk_id in removed]
+
+    def found(chain: RAGChain) -> set:
+        return {
+            document.metadata["chunk_id"] for text in texts for document in chain._vector_search(text)
+        }
+
+    assert removed <= found(chain)
+    assert chain.remove_pdf(removed_id)
+    assert chain.vectorstore.index.ntotal == total
+    assert not removed & found(chain)
+
+    # The tombstones are persisted with the index
+    reloaded = make_chain()
+    assert reloaded._search_params is not None
+    assert not removed & found(reloaded)
+    reloaded.close()
+
+    # Past the deleted ratio the index is rebuilt from the cached embeddings
+    cached = []
+    cached_documents = chain.embedding.cached_documents
+    monkeypatch.setattr(chain.embedding, "cached_documents", lambda texts: cached.append(texts) or cached_documents(texts))
+    assert chain.remove_pdf(compacted_id)
+    assert cached
+    assert chain.vectorstore.index.ntotal == len(chain.doc_chunks[kept_id])
+    assert deleted_count(chain.vectorstore) == 0 and chain._search_params is None
+    chain.close()